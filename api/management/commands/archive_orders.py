@@ -0,0 +1,34 @@
+import datetime
+
+from api.utils.archive import archive_batch
+from api.utils.shards import shard_aliases
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Переносит завершенные развозы и выполненные заказы '
+            'в таблицы истории пачками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--older-than-hours', type=int, default=0,
+                            help='переносить развозы старше N часов')
+        parser.add_argument('--max-batches', type=int, default=None)
+
+    def handle(self, *args, **options):
+        older_than = datetime.datetime.now() - datetime.timedelta(
+            hours=options['older_than_hours'])
+        total_assigns = total_orders = 0
+        for alias in shard_aliases():
+            batches = 0
+            while options['max_batches'] is None or \
+                    batches < options['max_batches']:
+                assigns, orders = archive_batch(options['batch_size'],
+                                                older_than, alias)
+                if not assigns:
+                    break
+                batches += 1
+                total_assigns += assigns
+                total_orders += orders
+        self.stdout.write(f'archived assigns: {total_assigns}, '
+                          f'orders: {total_orders}')
@@ -0,0 +1,21 @@
+from api.utils.candidates import check_candidates
+from api.utils.shards import shard_aliases
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = ('Сверяет таблицу кандидатов курьер-заказ с посчитанной заново '
+            'по курьерам и свободным заказам')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='пересобрать расхождения')
+
+    def handle(self, *args, **options):
+        for alias in shard_aliases():
+            with transaction.atomic(using=alias):
+                result = check_candidates(using=alias, fix=options['fix'])
+            self.stdout.write(f'{alias or "default"}: '
+                              f'{result["missing"]} missing, '
+                              f'{result["extra"]} extra')
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from api.utils import metrics
+from api.utils.dispatch import dispatch_tick
+from api.utils.shards import shard_aliases
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+
+def parse_shard(value):
+    index, _, shards = value.partition('/')
+    try:
+        index, shards = int(index), int(shards)
+    except ValueError:
+        raise CommandError('--shard должен иметь вид номер/число, '
+                           'например 0/4')
+    if not 0 <= index < shards:
+        raise CommandError(f'нет части {index} из {shards}')
+    return index, shards
+
+
+class Command(BaseCommand):
+    help = ('Непрерывно назначает новые и снятые с курьеров заказы '
+            'курьерам без открытых развозов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=1.0,
+                            help='период такта, в секундах')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='сколько заказов назначать за такт')
+        parser.add_argument('--courier-batch', type=int, default=1000,
+                            help='сколько свободных курьеров брать за такт')
+        parser.add_argument('--max-pages', type=int, default=10,
+                            help='сколько страниц пула просматривать '
+                                 'за такт')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='число процессов, регионы делятся между '
+                                 'ними по остатку от деления номера')
+        parser.add_argument('--shard',
+                            help='обрабатывать только часть регионов, '
+                                 'например 0/4 (для запуска на разных '
+                                 'машинах)')
+        parser.add_argument('--metrics-file',
+                            help='файл метрик для textfile-коллектора')
+        parser.add_argument('--once', action='store_true',
+                            help='назначить все, что можно, и выйти')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        if options['shard']:
+            total = self.run(parse_shard(options['shard']), options)
+        elif options['workers'] > 1:
+            total = self.run_pool(options)
+        else:
+            total = self.run(None, options)
+        self.stdout.write(f'dispatched {total} orders')
+
+    def run_pool(self, options):
+        # Дочерние процессы открывают свои соединения с базой
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        totals = context.Queue()
+        shards = options['workers']
+        processes = [
+            context.Process(target=lambda shard: totals.put(
+                self.run(shard, options)), args=((index, shards),))
+            for index in range(shards)]
+        for process in processes:
+            process.start()
+        while any(process.is_alive() for process in processes):
+            if self.stopping:
+                for process in processes:
+                    if process.is_alive():
+                        os.kill(process.pid, signal.SIGTERM)
+            time.sleep(0.5)
+        failed = [index for index, process in enumerate(processes)
+                  if process.exitcode != 0]
+        if failed:
+            raise CommandError(f'процессы частей {failed} завершились '
+                               'с ошибкой')
+        return sum(totals.get() for process in processes)
+
+    def run(self, shard, options):
+        metrics_file = options['metrics_file']
+        if metrics_file and shard is not None:
+            root, extension = os.path.splitext(metrics_file)
+            metrics_file = f'{root}_{shard[0]}{extension}'
+        total = 0
+        # Место, где остановился предыдущий такт, в каждой базе
+        cursors = {alias: {} for alias in shard_aliases()}
+        while not self.stopping:
+            close_old_connections()
+            started = time.monotonic()
+            dispatched = sum(
+                dispatch_tick(options['batch_size'],
+                              options['courier_batch'], shard, alias,
+                              options['max_pages'], cursors[alias])
+                for alias in cursors)
+            total += dispatched
+            if metrics_file:
+                metrics.write_textfile(metrics_file)
+            # Такт, остановленный посреди пула, продолжается сразу
+            if any(cursor['after'] for cursor in cursors.values()):
+                continue
+            if options['once']:
+                if not dispatched:
+                    break
+            # Полная пачка значит, что заказы еще есть: следующий такт сразу
+            elif dispatched < options['batch_size']:
+                time.sleep(max(0.0, options['tick']
+                               - (time.monotonic() - started)))
+        return total
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,40 @@
+from api.utils.export import FORMATS, export_orders
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+
+class Command(BaseCommand):
+    help = ('Выгружает выполненные заказы в CSV или NDJSON потоком, '
+            'не загружая их в память')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='complete_time не раньше, ISO')
+        parser.add_argument('--until', help='complete_time раньше, ISO')
+        parser.add_argument('--format', choices=tuple(FORMATS),
+                            default='csv')
+        parser.add_argument('--output', default='-',
+                            help='файл, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        since, until = (self.parse(options[name])
+                        for name in ('since', 'until'))
+        chunks = export_orders(since, until, options['format'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='') as file:
+            for chunk in chunks:
+                file.write(chunk)
+
+    @staticmethod
+    def parse(value):
+        if value is None:
+            return None
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise CommandError(f'неверное время {value}')
+        return parsed
@@ -0,0 +1,67 @@
+import datetime
+from collections import defaultdict
+
+from api.middleware.profiling import make_profile_token
+from api.models import RequestProfile
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Показывает сохраненные профили запросов или самые затратные '
+            'функции по каждому endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aggregate', action='store_true',
+                            help='суммировать профили по endpoint')
+        parser.add_argument('--endpoint',
+                            help='например "POST OrdersView-assign"')
+        parser.add_argument('--since-hours', type=int, default=None)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--token', action='store_true',
+                            help='вывести значение заголовка X-Profile')
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write(make_profile_token())
+            return
+        profiles = RequestProfile.objects.order_by('-created_at')
+        if options['endpoint']:
+            profiles = profiles.filter(endpoint=options['endpoint'])
+        if options['since_hours'] is not None:
+            profiles = profiles.filter(
+                created_at__gte=datetime.datetime.now() - datetime.timedelta(
+                    hours=options['since_hours']))
+        if options['aggregate']:
+            self.aggregate(profiles, options['limit'])
+        else:
+            self.show(profiles[:options['limit']])
+
+    def show(self, profiles):
+        for profile in profiles:
+            self.stdout.write(
+                f'{profile.pk:>6} {profile.created_at:%Y-%m-%d %H:%M:%S} '
+                f'{profile.endpoint} {profile.status_code} '
+                f'{profile.duration_ms:.1f}ms')
+
+    def aggregate(self, profiles, limit):
+        durations = defaultdict(list)
+        functions = defaultdict(lambda: defaultdict(lambda: [0, 0.0, 0.0]))
+        for endpoint, duration_ms, stats in profiles.values_list(
+                'endpoint', 'duration_ms', 'stats').iterator():
+            durations[endpoint].append(duration_ms)
+            for row in stats:
+                total = functions[endpoint][row['function']]
+                total[0] += row['ncalls']
+                total[1] += row['tottime']
+                total[2] += row['cumtime']
+        for endpoint, values in sorted(durations.items()):
+            self.stdout.write(
+                f'{endpoint}: {len(values)} profiles, '
+                f'avg {sum(values) / len(values):.1f}ms')
+            hottest = sorted(functions[endpoint].items(),
+                             key=lambda item: item[1][1], reverse=True)
+            for function, (ncalls, tottime, cumtime) in hottest[:limit]:
+                self.stdout.write(
+                    f'  {tottime * 1000:10.2f}ms self '
+                    f'{cumtime * 1000:10.2f}ms cum {ncalls:>8} calls '
+                    f'{function}')
@@ -0,0 +1,13 @@
+import datetime
+
+from api.models import IdempotencyKey
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Удаляет сохраненные ответы с истекшим Idempotency-Key'
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(
+            expires_at__lte=datetime.datetime.now()).delete()
+        self.stdout.write(f'deleted: {deleted}')
@@ -0,0 +1,81 @@
+import time
+
+from api.models import Order, RegionShard
+from api.models.orders import StatusChoices
+from api.utils.shards import (default_shard, move_pending_orders,
+                              region_map, reset_region_map, shard_aliases)
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+
+class Command(BaseCommand):
+    help = ('Переносит регионы между шардами: меняет карту регионов и '
+            'переносит свободные заказы в новые шарды')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--move', action='append', default=[],
+                            metavar='REGION=ALIAS',
+                            help='перенести регион в шард: 12=shard_1')
+        parser.add_argument('--sweep', action='store_true',
+                            help='только перенести свободные заказы, '
+                                 'лежащие не в своем шарде')
+        parser.add_argument('--show', action='store_true',
+                            help='показать карту и число заказов по шардам')
+        parser.add_argument('--no-wait', action='store_true',
+                            help='не ждать, пока процессы перечитают карту')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_SHARDS:
+            raise CommandError('шарды не заданы (POSTGRES_SHARDS)')
+        if options['show']:
+            self.show()
+            return
+        moves = [self.parse_move(value) for value in options['move']]
+        for region, alias in moves:
+            self.move_region(region, alias)
+        if moves and not options['no_wait']:
+            # Пока процессы не перечитали карту, новые заказы региона
+            # могут попадать в старый шард
+            time.sleep(settings.SHARD_MAP_TTL)
+        if moves or options['sweep']:
+            self.sweep(options['batch_size'])
+
+    @staticmethod
+    def parse_move(value):
+        region, _, alias = value.partition('=')
+        if not region.isdigit() or alias not in settings.DATABASE_SHARDS:
+            raise CommandError(f'неверный перенос {value}, нужен '
+                               f'REGION=ALIAS из {settings.DATABASE_SHARDS}')
+        return int(region), alias
+
+    def move_region(self, region, alias):
+        if alias == default_shard(region):
+            RegionShard.objects.filter(region=region).delete()
+        else:
+            RegionShard.objects.update_or_create(
+                region=region, defaults={'alias': alias})
+        self.stdout.write(f'region {region} -> {alias}')
+
+    def sweep(self, batch_size):
+        for alias in shard_aliases():
+            total = 0
+            while True:
+                moved = move_pending_orders(alias, batch_size)
+                if not moved:
+                    break
+                total += moved
+            self.stdout.write(f'{alias}: moved {total} pending orders')
+
+    def show(self):
+        reset_region_map()
+        for region, alias in sorted(region_map().items()):
+            self.stdout.write(f'region {region} -> {alias}')
+        for alias in shard_aliases():
+            counts = dict(Order.objects.using(alias).values_list(
+                'status').annotate(Count('pk')))
+            self.stdout.write(
+                f'{alias}: {counts.get(StatusChoices.new, 0)} pending, '
+                f'{counts.get(StatusChoices.assigned, 0)} assigned, '
+                f'{counts.get(StatusChoices.complete, 0)} complete')
@@ -0,0 +1,97 @@
+import datetime
+import signal
+import time
+
+from api.models import Job
+from api.models.jobs import JobStatusChoices
+from api.utils import metrics
+from api.utils.jobs import claim, run_job
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+STATS_SQL = """
+SELECT name, status, count(*), avg(duration_ms),
+       percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms)
+FROM api_job
+WHERE created_at >= %s
+GROUP BY name, status
+ORDER BY name, status
+"""
+
+jobs_queued = metrics.gauge('jobs_queued', 'Задачи, ожидающие выполнения')
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди в таблице api_job'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='пауза при пустой очереди, в секундах')
+        parser.add_argument('--visibility-timeout', type=int, default=300,
+                            help='через сколько секунд задачу упавшего '
+                                 'обработчика заберет другой')
+        parser.add_argument('--keep-hours', type=int, default=24,
+                            help='сколько хранить выполненные задачи')
+        parser.add_argument('--metrics-file',
+                            help='файл метрик для textfile-коллектора')
+        parser.add_argument('--once', action='store_true',
+                            help='выполнить готовые задачи и выйти')
+        parser.add_argument('--stats', action='store_true',
+                            help='показать время выполнения задач')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.show_stats(options['keep_hours'])
+            return
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        processed = 0
+        while not self.stopping:
+            close_old_connections()
+            jobs = claim(options['batch_size'],
+                         options['visibility_timeout'])
+            for job in jobs:
+                # Взятые, но не начатые задачи вернутся в очередь
+                # по истечении visibility_timeout
+                if self.stopping:
+                    break
+                run_job(job)
+                processed += 1
+            if options['metrics_file']:
+                self.write_metrics(options['metrics_file'])
+            if options['once'] and not jobs:
+                break
+            if not jobs:
+                self.purge(options['keep_hours'])
+                time.sleep(options['poll_interval'])
+        self.stdout.write(f'processed {processed} jobs')
+
+    def stop(self, signum, frame):
+        # Текущая задача дорабатывает, новые не берутся
+        self.stopping = True
+
+    @staticmethod
+    def write_metrics(path):
+        jobs_queued.set(Job.objects.filter(
+            status=JobStatusChoices.queued).count())
+        metrics.write_textfile(path)
+
+    @staticmethod
+    def purge(keep_hours):
+        Job.objects.filter(
+            status=JobStatusChoices.done,
+            finished_at__lt=datetime.datetime.now() - datetime.timedelta(
+                hours=keep_hours)).delete()
+
+    def show_stats(self, hours):
+        since = datetime.datetime.now() - datetime.timedelta(hours=hours)
+        with connection.cursor() as cursor:
+            cursor.execute(STATS_SQL, [since])
+            rows = cursor.fetchall()
+        for name, status, count, avg, p95 in rows:
+            timing = ''
+            if avg is not None:
+                timing = f' avg {avg:.1f}ms p95 {p95:.1f}ms'
+            self.stdout.write(f'{name} {status}: {count}{timing}')
@@ -0,0 +1,4 @@
+from .replica import ReplicaPinMiddleware
+from .profiling import ProfilingMiddleware
+from .tracing import TracingMiddleware
+from .compression import CompressionMiddleware
@@ -0,0 +1,92 @@
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    # Без пакета brotli ответы сжимаются только gzip
+    brotli = None
+
+# Заголовок gzip вместо zlib
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def negotiate(accept_encoding) -> str:
+    """Кодировка из Accept-Encoding: br, если он доступен, иначе gzip"""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0
+        accepted[name.strip().lower()] = quality
+    encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compressor(encoding):
+    """Пара функций (сжать кусок, завершить поток)"""
+    if encoding == 'br':
+        stream = brotli.Compressor(quality=settings.COMPRESSION_BR_QUALITY)
+        # flush после каждого куска: клиент получает данные сразу
+        return (lambda data: stream.process(data) + stream.flush(),
+                stream.finish)
+    stream = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED,
+                              GZIP_WBITS)
+    return (lambda data: stream.compress(data) + stream.flush(
+        zlib.Z_SYNC_FLUSH), stream.flush)
+
+
+def compress_sequence(encoding, chunks):
+    compress, finish = compressor(encoding)
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы gzip или br, согласованные по Accept-Encoding.
+    Обычные ответы сжимаются от COMPRESSION_MIN_SIZE байт, потоковые -
+    всегда, по кускам по мере отдачи.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding'):
+            return response
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = compress_sequence(
+                encoding, response.streaming_content)
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            compress, finish = compressor(encoding)
+            compressed = compress(response.content) + finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        # ETag профиля курьера - его версия, а не байты тела, поэтому
+        # при сжатии не меняется
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,87 @@
+import logging
+import random
+import time
+
+from api.models import RequestProfile
+from django.conf import settings
+from django.core import signing
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_SALT = 'api.profiling'
+
+
+def make_profile_token():
+    """Значение заголовка X-Profile, включающего профилирование запроса"""
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign('profile')
+
+
+class ProfilingMiddleware:
+    """
+    Снимает cProfile запроса, если передан подписанный заголовок X-Profile
+    или запрос попал в выборку PROFILING_SAMPLE_RATE, и сохраняет самые
+    затратные функции в RequestProfile.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        import cProfile
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration_ms = (time.perf_counter() - start) * 1000
+        try:
+            profile = self.store(request, response, profiler, duration_ms)
+            response['X-Profile-Id'] = str(profile.pk)
+        except Exception:
+            logger.exception('failed to store request profile')
+        return response
+
+    @staticmethod
+    def should_profile(request):
+        token = request.META.get(PROFILE_HEADER)
+        if token:
+            try:
+                signing.TimestampSigner(salt=PROFILE_SALT).unsign(
+                    token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+                return True
+            except signing.BadSignature:
+                return False
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    @staticmethod
+    def collect_stats(profiler):
+        import pstats
+
+        stats = pstats.Stats(profiler).stats
+        rows = []
+        for (filename, line, name), (_, ncalls, tottime, cumtime, _) in \
+                stats.items():
+            rows.append({'function': f'{filename}:{line}({name})',
+                         'ncalls': ncalls,
+                         'tottime': tottime,
+                         'cumtime': cumtime})
+        rows.sort(key=lambda row: row['tottime'], reverse=True)
+        return rows[:settings.PROFILING_TOP_FUNCTIONS]
+
+    def store(self, request, response, profiler, duration_ms):
+        match = request.resolver_match
+        endpoint = match.view_name if match else request.path
+        return RequestProfile.objects.create(
+            method=request.method,
+            path=request.path[:255],
+            endpoint=f'{request.method} {endpoint}'[:255],
+            status_code=response.status_code,
+            duration_ms=duration_ms,
+            stats=self.collect_stats(profiler))
@@ -0,0 +1,26 @@
+from api.routers import pin_to_primary
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_COOKIE = 'replica_pin'
+
+
+class ReplicaPinMiddleware:
+    """
+    Изменяющие запросы и чтения в течение REPLICA_PIN_SECONDS после
+    записи того же клиента выполняются на основной базе, чтобы клиент
+    видел свои изменения несмотря на отставание реплик.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        is_write = request.method not in SAFE_METHODS
+        pinned = is_write or PIN_COOKIE in request.COOKIES
+        with pin_to_primary(pinned):
+            response = self.get_response(request)
+        if is_write and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS)
+        return response
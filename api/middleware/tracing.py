@@ -0,0 +1,31 @@
+import logging
+
+from api.utils.tracing import export_trace, span, start_trace
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TracingMiddleware:
+    """
+    Собирает фазы обработки запроса в трассу, отдает их длительности
+    в заголовке Server-Timing и выгружает трассу в TRACING_EXPORT_PATH.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.TRACING_ENABLED:
+            return self.get_response(request)
+        with start_trace() as trace:
+            with span('total', **{'http.method': request.method,
+                                  'http.target': request.path}):
+                response = self.get_response(request)
+        response['Server-Timing'] = trace.server_timing()
+        if settings.TRACING_EXPORT_PATH:
+            try:
+                export_trace(trace, settings.TRACING_EXPORT_PATH)
+            except OSError:
+                logger.exception('failed to export trace')
+        return response
@@ -0,0 +1,30 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:37
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, verbose_name='key')),
+                ('path', models.CharField(max_length=255, verbose_name='path')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='request_hash')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='status_code')),
+                ('response', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True, verbose_name='response')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='expires_at')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(fields=('key', 'path'), name='unique_idempotency_key_path'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courier',
+            name='version',
+            field=models.PositiveIntegerField(default=1, verbose_name='version'),
+        ),
+    ]
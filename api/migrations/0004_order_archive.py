@@ -0,0 +1,58 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:40
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_courier_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAssign',
+            fields=[
+                ('assign_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('courier_type', models.CharField(blank=True, choices=[('foot', 'Foot'), ('bike', 'Bike'), ('car', 'Car')], max_length=4, null=True, verbose_name='Courier type')),
+                ('assign_time', models.DateTimeField(verbose_name='assign_time')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='archived_at')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('order_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('weight', models.DecimalField(decimal_places=4, max_digits=6, verbose_name='Weight')),
+                ('region', models.PositiveSmallIntegerField(verbose_name='Region')),
+                ('delivery_hours', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=200), size=None)),
+                ('assign_time', models.DateTimeField(verbose_name='assign_time')),
+                ('complete_time', models.DateTimeField(verbose_name='complete_time')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(allow_to_assign=True), fields=['region', 'weight'], name='order_pool_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='assign',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='api.ArchivedAssign', verbose_name='assign'),
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='assign_courier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_orders', to='api.Courier', verbose_name='assign_courier'),
+        ),
+        migrations.AddField(
+            model_name='archivedassign',
+            name='courier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_assigns', to='api.Courier'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['assign_courier', 'complete_time'], name='archived_order_courier_idx'),
+        ),
+    ]
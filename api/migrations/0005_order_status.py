@@ -0,0 +1,39 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:42
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_order_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_pool_idx',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='pooled_at',
+            field=models.DateTimeField(default=datetime.datetime.now, verbose_name='pooled_at'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('new', 'New'), ('assigned', 'Assigned'), ('complete', 'Complete')], db_index=True, default='new', max_length=8, verbose_name='status'),
+        ),
+        migrations.RunSQL(
+            "UPDATE api_order SET status = CASE "
+            "WHEN is_complete THEN 'complete' "
+            "WHEN NOT allow_to_assign THEN 'assigned' "
+            "ELSE 'new' END",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(status='new'), fields=['region', 'weight'], name='order_pool_idx'),
+        ),
+    ]
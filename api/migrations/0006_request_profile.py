@@ -0,0 +1,27 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:44
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_order_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10, verbose_name='method')),
+                ('path', models.CharField(max_length=255, verbose_name='path')),
+                ('endpoint', models.CharField(db_index=True, max_length=255, verbose_name='endpoint')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='status_code')),
+                ('duration_ms', models.FloatField(verbose_name='duration_ms')),
+                ('stats', django.contrib.postgres.fields.jsonb.JSONField(verbose_name='stats')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created_at')),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.0.5 on 2026-10-19 12:51
+
+import datetime
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_request_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourierStats',
+            fields=[
+                ('courier', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.Courier')),
+                ('version', models.PositiveIntegerField(verbose_name='version')),
+                ('rating', models.FloatField(verbose_name='rating')),
+                ('earning', models.PositiveIntegerField(verbose_name='earning')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated_at')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='name')),
+                ('payload', django.contrib.postgres.fields.jsonb.JSONField(default=dict, verbose_name='payload')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=7, verbose_name='status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5, verbose_name='max_attempts')),
+                ('run_at', models.DateTimeField(default=datetime.datetime.now, verbose_name='run_at')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='locked_until')),
+                ('created_at', models.DateTimeField(default=datetime.datetime.now, verbose_name='created_at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started_at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished_at')),
+                ('duration_ms', models.FloatField(blank=True, null=True, verbose_name='duration_ms')),
+                ('last_error', models.TextField(blank=True, verbose_name='last_error')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(status__in=('queued', 'running')), fields=['run_at'], name='job_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.0.5 on 2026-10-19 13:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionShard',
+            fields=[
+                ('region', models.PositiveSmallIntegerField(primary_key=True, serialize=False, verbose_name='Region')),
+                ('alias', models.CharField(max_length=100, verbose_name='alias')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated_at')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='archivedassign',
+            name='courier',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_assigns', to='api.Courier'),
+        ),
+        migrations.AlterField(
+            model_name='archivedorder',
+            name='assign_courier',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_orders', to='api.Courier', verbose_name='assign_courier'),
+        ),
+        migrations.AlterField(
+            model_name='assign',
+            name='courier',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='assign', to='api.Courier'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='assign_courier',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order', to='api.Courier', verbose_name='assign_courier'),
+        ),
+    ]
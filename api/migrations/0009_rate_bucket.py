@@ -0,0 +1,21 @@
+# Generated by Django 3.0.5 on 2026-10-19 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_region_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateBucket',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='key')),
+                ('tokens', models.FloatField(verbose_name='tokens')),
+                ('updated_at', models.DateTimeField(verbose_name='updated_at')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.0.5 on 2026-10-19 13:11
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_rate_bucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliverySketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region', models.PositiveSmallIntegerField(verbose_name='Region')),
+                ('courier_type', models.CharField(max_length=4, verbose_name='courier_type')),
+                ('bucket_start', models.DateTimeField(db_index=True, verbose_name='bucket_start')),
+                ('bins', django.contrib.postgres.fields.jsonb.JSONField(default=dict, verbose_name='bins')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='count')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='deliverysketch',
+            constraint=models.UniqueConstraint(fields=('region', 'courier_type', 'bucket_start'), name='unique_delivery_sketch'),
+        ),
+    ]
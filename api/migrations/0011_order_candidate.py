@@ -0,0 +1,26 @@
+# Generated by Django 3.0.5 on 2026-10-19 13:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_delivery_sketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('courier', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='api.Courier', verbose_name='courier')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='api.Order', verbose_name='order')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ordercandidate',
+            constraint=models.UniqueConstraint(fields=('courier', 'order'), name='unique_order_candidate'),
+        ),
+    ]
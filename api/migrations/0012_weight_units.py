@@ -0,0 +1,85 @@
+from django.db import migrations, models
+import django.core.validators
+
+WEIGHT_SCALE = 10000
+
+
+def scale(table, column):
+    """
+    Переводит килограммы в целые единицы WEIGHT_SCALE до смены типа
+    столбца и обратно после нее
+    """
+    return migrations.RunSQL(
+        f'UPDATE {table} SET {column} = {column} * {WEIGHT_SCALE}',
+        reverse_sql=f'UPDATE {table} SET {column} = {column} / {WEIGHT_SCALE}')
+
+
+def wide_decimal(**kwargs):
+    return models.DecimalField(decimal_places=4, max_digits=10, **kwargs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_order_candidate'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_pool_idx',
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='weight',
+            field=wide_decimal(db_index=True, verbose_name='Weight'),
+        ),
+        migrations.AlterField(
+            model_name='archivedorder',
+            name='weight',
+            field=wide_decimal(verbose_name='Weight'),
+        ),
+        migrations.AlterField(
+            model_name='courier',
+            name='allowed_orders_weight',
+            field=wide_decimal(blank=True, null=True,
+                               verbose_name='allowed_orders_weight'),
+        ),
+        scale('api_order', 'weight'),
+        scale('api_archivedorder', 'weight'),
+        scale('api_courier', 'allowed_orders_weight'),
+        migrations.AlterField(
+            model_name='order',
+            name='weight',
+            field=models.PositiveIntegerField(db_index=True, validators=[django.core.validators.MaxValueValidator(500000)], verbose_name='Weight'),
+        ),
+        migrations.AlterField(
+            model_name='archivedorder',
+            name='weight',
+            field=models.PositiveIntegerField(verbose_name='Weight'),
+        ),
+        migrations.AlterField(
+            model_name='courier',
+            name='allowed_orders_weight',
+            field=models.PositiveIntegerField(blank=True, default=100000, null=True, verbose_name='allowed_orders_weight'),
+        ),
+        migrations.RenameField(
+            model_name='order',
+            old_name='weight',
+            new_name='weight_units',
+        ),
+        migrations.RenameField(
+            model_name='archivedorder',
+            old_name='weight',
+            new_name='weight_units',
+        ),
+        migrations.RenameField(
+            model_name='courier',
+            old_name='allowed_orders_weight',
+            new_name='allowed_weight_units',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(status='new'), fields=['region', 'weight_units'], name='order_pool_idx'),
+        ),
+    ]
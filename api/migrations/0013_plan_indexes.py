@@ -0,0 +1,22 @@
+# Generated by Django 3.0.5 on 2026-10-19 13:40
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_weight_units'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assign',
+            index=models.Index(condition=models.Q(is_complete=False), fields=['courier'], name='open_assign_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courier',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['regions'], name='courier_regions_idx'),
+        ),
+    ]
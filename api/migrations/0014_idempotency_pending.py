@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-19 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_plan_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='idempotencykey',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='status_code'),
+        ),
+    ]
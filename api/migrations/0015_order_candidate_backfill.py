@@ -0,0 +1,80 @@
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations
+
+WEIGHT_SCALE = 10000
+MAX_WEIGHT_UNITS = {'foot': 10 * WEIGHT_SCALE, 'bike': 15 * WEIGHT_SCALE,
+                    'car': 50 * WEIGHT_SCALE}
+BATCH_SIZE = 5000
+
+
+def parse_hours(periods):
+    result = []
+    for period in periods:
+        start, end = period.split('-')
+        result.append((datetime.datetime.strptime(start, '%H:%M'),
+                       datetime.datetime.strptime(end, '%H:%M')))
+    return result
+
+
+def couriers_by_region(Courier, using):
+    """Рабочие часы и максимальный вес курьеров каждого региона"""
+    by_region = defaultdict(list)
+    for courier in Courier.objects.using(using).iterator():
+        try:
+            hours = parse_hours(courier.working_hours)
+            regions = {int(region) for region in courier.regions}
+        except ValueError:
+            # Профиль, записанный в обход проверок, кандидатов не дает
+            continue
+        capacity = MAX_WEIGHT_UNITS.get(courier.courier_type, 0)
+        for region in regions:
+            by_region[region].append((courier.pk, hours, capacity))
+    return by_region
+
+
+def fill_candidates(apps, schema_editor):
+    """
+    Кандидаты свободных заказов, созданных до 0011_order_candidate, по
+    правилам api.utils.candidates.candidate_pairs
+    """
+    Courier = apps.get_model('api', 'Courier')
+    Order = apps.get_model('api', 'Order')
+    OrderCandidate = apps.get_model('api', 'OrderCandidate')
+    using = schema_editor.connection.alias
+    # При шардах курьеры лежат в default, заказы - в мигрируемой базе
+    by_region = couriers_by_region(
+        Courier, 'default' if settings.DATABASE_SHARDS else using)
+    candidates = []
+    for order in Order.objects.using(using).filter(
+            status='new', region__in=list(by_region)).iterator():
+        try:
+            delivery = parse_hours(order.delivery_hours)
+        except ValueError:
+            continue
+        candidates.extend(
+            OrderCandidate(courier_id=courier_id, order_id=order.pk)
+            for courier_id, hours, capacity in by_region[order.region]
+            if order.weight_units <= capacity and any(
+                start <= working_end and end >= working_start
+                for start, end in delivery
+                for working_start, working_end in hours))
+        if len(candidates) >= BATCH_SIZE:
+            OrderCandidate.objects.using(using).bulk_create(
+                candidates, ignore_conflicts=True)
+            candidates = []
+    OrderCandidate.objects.using(using).bulk_create(candidates,
+                                                    ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_idempotency_pending'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_candidates, migrations.RunPython.noop),
+    ]
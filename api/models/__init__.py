@@ -1,3 +1,12 @@
 from .couriers import Courier
 from .orders import Order
 from .assign import Assign
+from .idempotency import IdempotencyKey
+from .archive import ArchivedAssign, ArchivedOrder
+from .profiles import RequestProfile
+from .jobs import Job
+from .stats import CourierStats
+from .shards import RegionShard
+from .limits import RateBucket
+from .sketches import DeliverySketch
+from .candidates import OrderCandidate
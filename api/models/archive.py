@@ -0,0 +1,59 @@
+from api.models import Courier
+from api.models.couriers import TypeChoices
+from django.contrib.postgres.fields import ArrayField
+from django.db import models
+
+
+class ArchivedAssign(models.Model):
+    """Завершенный развоз, перенесенный из api_assign"""
+    assign_id = models.PositiveIntegerField(primary_key=True)
+    courier = models.ForeignKey(
+        Courier,
+        related_name='archived_assigns',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        db_constraint=False
+    )
+    courier_type = models.CharField(
+        max_length=4,
+        choices=TypeChoices.choices,
+        verbose_name='Courier type',
+        blank=True,
+        null=True
+    )
+    assign_time = models.DateTimeField(verbose_name='assign_time')
+    archived_at = models.DateTimeField(auto_now_add=True,
+                                       verbose_name='archived_at')
+
+
+class ArchivedOrder(models.Model):
+    """Выполненный заказ, перенесенный из api_order"""
+    order_id = models.PositiveIntegerField(primary_key=True)
+    # Вес в единицах api.models.couriers.WEIGHT_SCALE
+    weight_units = models.PositiveIntegerField(verbose_name='Weight')
+    region = models.PositiveSmallIntegerField(verbose_name='Region')
+    delivery_hours = ArrayField(models.CharField(max_length=200))
+    assign = models.ForeignKey(
+        ArchivedAssign,
+        related_name='orders',
+        on_delete=models.CASCADE,
+        verbose_name='assign'
+    )
+    assign_courier = models.ForeignKey(
+        Courier,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        verbose_name='assign_courier',
+        related_name='archived_orders',
+        db_constraint=False
+    )
+    assign_time = models.DateTimeField(verbose_name='assign_time')
+    complete_time = models.DateTimeField(verbose_name='complete_time')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['assign_courier', 'complete_time'],
+                         name='archived_order_courier_idx'),
+        ]
@@ -1,6 +1,7 @@
 from api.models import Courier, Order
 from api.models.couriers import TypeChoices
 from django.db import models
+from django.db.models import Q
 
 
 class Assign(models.Model):
@@ -9,7 +10,9 @@ class Assign(models.Model):
         related_name='assign',
         on_delete=models.CASCADE,
         blank=True,
-        null=True
+        null=True,
+        # Курьер может лежать в другой базе, см. api.routers.ShardRouter
+        db_constraint=False
     )
     courier_type = models.CharField(
         max_length=4,
@@ -37,6 +40,13 @@ class Assign(models.Model):
         default=False
     )
 
+    class Meta:
+        indexes = [
+            # Открытые развозы: их проверяют назначение и снятие заказов
+            models.Index(fields=['courier'], name='open_assign_idx',
+                         condition=Q(is_complete=False)),
+        ]
+
     def can_close(self):
         return len(self.orders.all()) == len(
             self.orders.filter(is_complete=True))
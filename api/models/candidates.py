@@ -0,0 +1,31 @@
+from api.models import Courier, Order
+from django.db import models
+
+
+class OrderCandidate(models.Model):
+    """
+    Свободный заказ, который курьер может доставить по региону, времени
+    и максимальному весу своего типа, без учета текущей загрузки.
+    Хранится в шарде заказа и поддерживается при записи, см.
+    api.utils.candidates.
+    """
+    courier = models.ForeignKey(
+        Courier,
+        on_delete=models.CASCADE,
+        related_name='candidates',
+        verbose_name='courier',
+        # Курьер может лежать в другой базе, см. api.routers.ShardRouter
+        db_constraint=False
+    )
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='candidates',
+        verbose_name='order'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('courier', 'order'),
+                                    name='unique_order_candidate'),
+        ]
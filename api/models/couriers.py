@@ -1,7 +1,33 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef
+
+
+# Веса хранятся целыми числами в десятитысячных долях килограмма: столько
+# знаков после запятой принимает API. Вместимость курьеров и раскладка
+# заказов по весу считаются в целых числах, Decimal - только на входе
+# и выходе API
+WEIGHT_SCALE = 10000
+
+
+def to_weight_units(weight):
+    """Вес в килограммах (Decimal, число или строка) в целых единицах"""
+    if weight is None:
+        return None
+    return int(Decimal(str(weight)) * WEIGHT_SCALE)
+
+
+def from_weight_units(units):
+    """Вес в целых единицах в килограммах"""
+    if units is None:
+        return None
+    return Decimal(units) / WEIGHT_SCALE
 
 
 class TypeChoices(models.TextChoices):
@@ -20,17 +46,33 @@ class Courier(models.Model):
     )
     regions = ArrayField(models.CharField(max_length=200), blank=False)
     working_hours = ArrayField(models.CharField(max_length=200), blank=False)
-    allowed_orders_weight = models.DecimalField(
-        decimal_places=4,
-        max_digits=6,
-        default=10,
+    # Свободная вместимость в единицах WEIGHT_SCALE
+    allowed_weight_units = models.PositiveIntegerField(
+        default=10 * WEIGHT_SCALE,
         blank=True,
         null=True,
         verbose_name='allowed_orders_weight',
     )
+    # Версия профиля, меняется при каждой записи, влияющей на ответ
+    # GET /couriers/{id}. Изменяется только через bump_version
+    version = models.PositiveIntegerField(default=1, verbose_name='version')
+
+    class Meta:
+        indexes = [
+            # Курьеры регионов заказа: regions && ARRAY[...]
+            GinIndex(fields=['regions'], name='courier_regions_idx'),
+        ]
+
+    @property
+    def allowed_orders_weight(self):
+        return from_weight_units(self.allowed_weight_units)
+
+    @allowed_orders_weight.setter
+    def allowed_orders_weight(self, weight):
+        self.allowed_weight_units = to_weight_units(weight)
 
     def can_take_weight(self, order):
-        return self.allowed_orders_weight >= order.weight
+        return self.allowed_weight_units >= order.weight_units
 
     def clean(self, *args, **kwargs):
         # Проверка типа курьера
@@ -58,57 +100,210 @@ class Courier(models.Model):
             raise ValidationError('invalid values in working_hours list')
 
     def can_take_assign(self):
-        return len(self.assign.filter(is_complete=False)) < 1
+        return self.open_assign() is None
 
-    def check_change_regions(self, regions) -> None:
-        if not regions:
-            return None
-        orders = self.order.exclude(
-            Q(region__in=regions) | Q(is_complete=True))
-        # Снимаем назначение с курьера, делаем заказ доступным для других
+    def open_assign(self):
+        """Незавершенный развоз курьера из любого шарда"""
+        from api.models import Assign
+        from api.utils.prepared import fetch_first
+        from api.utils.shards import shard_aliases
+
+        for alias in shard_aliases():
+            assign = fetch_first('open_assign', Assign.objects.using(
+                alias).filter(courier_id=self.pk,
+                              is_complete=False).order_by('-pk'))
+            if assign is not None:
+                return assign
+        return None
+
+    def active_orders(self) -> list:
+        """Невыполненные заказы курьера из всех шардов"""
+        from api.models import Order
+        from api.utils.shards import shard_aliases
+
+        return [order for alias in shard_aliases()
+                for order in Order.objects.using(alias).filter(
+                    assign_courier_id=self.pk, is_complete=False)]
+
+    def select_orders(self, orders) -> list:
+        """Заказы, подходящие курьеру по времени и умещающиеся по весу"""
+        from api.utils import Interval
+
+        intervals = Interval()
+        intervals.set_working_hours(self.working_hours)
+        allowed_weight = self.allowed_weight_units
+        selected = []
         for order in orders:
-            order.cancel_assign()
+            intervals.set_delivery_hours(order.delivery_hours)
+            if not intervals.delivery_allowed():
+                continue
+            if allowed_weight >= order.weight_units:
+                selected.append(order)
+                allowed_weight -= order.weight_units
+        return selected
 
-    def check_change_working_hours(self, working_hours) -> None:
+    def check_change_regions(self, regions, orders) -> list:
+        if not regions:
+            return []
+        regions = {str(region) for region in regions}
+        return [order for order in orders if str(order.region) not in regions]
+
+    def check_change_working_hours(self, working_hours, orders) -> list:
         if not working_hours:
-            return None
-        orders = self.order.filter(is_complete=False)
+            return []
         from api.utils import Interval
 
         intervals = Interval()
         intervals.set_working_hours(working_hours)
+        unfit = []
         for order in orders:
             intervals.set_delivery_hours(order.delivery_hours)
-            # Если интервал не подходит, то снимаем назначение с курьера,
-            # делаем заказ доступным для других
             if not intervals.delivery_allowed():
-                order.cancel_assign()
+                unfit.append(order)
+        return unfit
 
-    def check_change_courier_type(self, courier_type) -> None:
+    def check_change_courier_type(self, courier_type, orders) -> list:
         if not courier_type:
-            return None
-        new_max_weight = self.get_max_weight(courier_type)
-        current_max_weight = self.get_max_weight(self.courier_type)
-        if new_max_weight >= current_max_weight:
-            return None
-        orders = self.order.filter(is_complete=False)
-        self.allowed_orders_weight = new_max_weight
+            return []
+        self.allowed_weight_units = self.get_max_weight_units(courier_type)
+        unfit = []
         # сортируем заказы по возрастанию веса, чтобы сохранить
         # как можно больше заказов без изменений
-        for order in sorted(orders, key=lambda order: order.weight):
-            if self.allowed_orders_weight - order.weight < 0:
-                order.cancel_assign()
+        for order in sorted(orders, key=lambda order: order.weight_units):
+            if self.allowed_weight_units < order.weight_units:
+                unfit.append(order)
             else:
-                self.allowed_orders_weight -= order.weight
+                self.allowed_weight_units -= order.weight_units
+        return unfit
+
+    def unfit_orders(self, orders) -> list:
+        """
+        Заказы из orders, которые курьер не сможет доставить с текущими
+        регионами, графиком и типом. allowed_weight_units пересчитывается
+        по оставшимся заказам.
+        """
+        unfit = []
+        for check, value in ((self.check_change_regions, self.regions),
+                             (self.check_change_working_hours,
+                              self.working_hours),
+                             (self.check_change_courier_type,
+                              self.courier_type)):
+            released = check(value, orders)
+            taken = {order.pk for order in released}
+            orders = [order for order in orders if order.pk not in taken]
+            unfit += released
+        return unfit
+
+    def release_unfit_orders(self) -> list:
+        """
+        Снимает с курьера заказы, которые он не сможет доставить с текущими
+        регионами, графиком и типом, и закрывает развоз, если в нем остались
+        только выполненные заказы. Повторный вызов ничего не меняет.
+        Возвращает номера снятых заказов.
+        """
+        return self.release_unfit_orders_bulk([self])[self.pk]['released']
+
+    @classmethod
+    def release_unfit_orders_bulk(cls, couriers) -> dict:
+        """
+        То же, что release_unfit_orders, для многих курьеров сразу:
+        заказы читаются, снимаются и развозы закрываются несколькими
+        запросами на шард, независимо от числа курьеров. Возвращает отчет
+        {номер курьера: {'released': [заказы], 'assign_closed': развоз}}.
+        """
+        from api.models import Assign, Order
+        from api.models.orders import StatusChoices
+        from api.utils.candidates import add_orders
+        from api.utils.events import publish_many
+        from api.utils.shards import shard_aliases, shard_of
+
+        couriers = {courier.pk: courier for courier in couriers}
+        if not couriers:
+            return {}
+        orders = defaultdict(list)
+        for alias in shard_aliases():
+            for order in Order.objects.using(alias).filter(
+                    assign_courier_id__in=couriers, is_complete=False):
+                orders[order.assign_courier_id].append(order)
+        report = {}
+        by_shard = defaultdict(list)
+        for courier_id, courier in couriers.items():
+            unfit = courier.unfit_orders(orders[courier_id])
+            report[courier_id] = {'released': [order.pk for order in unfit],
+                                  'assign_closed': None}
+            for order in unfit:
+                by_shard[shard_of(order)].append(order.pk)
+        # Снимаем назначение с курьеров, делаем заказы доступными для других
+        now = datetime.datetime.now()
+        for alias, order_ids in by_shard.items():
+            Order.objects.using(alias).filter(
+                pk__in=order_ids, status=StatusChoices.assigned).update(
+                status=StatusChoices.new, assign_courier=None,
+                allow_to_assign=True, pooled_at=now)
+            Assign.orders.through.objects.using(alias).filter(
+                order_id__in=order_ids, assign__is_complete=False).delete()
+            add_orders(Order.objects.using(alias).filter(
+                pk__in=order_ids, status=StatusChoices.new), using=alias)
+        cls.objects.bulk_update(couriers.values(), ['allowed_weight_units'])
+        # Закрываем развозы, в которых остались только выполненные заказы.
+        # NOT EXISTS по развозу, а не NOT IN по всем невыполненным заказам
+        open_orders = Order.objects.filter(assigns=OuterRef('pk'),
+                                           is_complete=False)
+        for alias in shard_aliases():
+            assigns = dict(Assign.objects.using(alias).filter(
+                ~Exists(open_orders), courier_id__in=couriers,
+                is_complete=False).values_list('pk', 'courier_id'))
+            if assigns:
+                Assign.objects.using(alias).filter(pk__in=assigns).update(
+                    is_complete=True)
+            for assign_id, courier_id in assigns.items():
+                report[courier_id]['assign_closed'] = assign_id
+        changed = [courier_id for courier_id, item in report.items()
+                   if item['released'] or item['assign_closed']]
+        cls.objects.filter(pk__in=changed).update(version=F('version') + 1)
+        publish_many(cls.release_events(report))
+        return report
+
+    @staticmethod
+    def release_events(report) -> list:
+        """События cancel и assign_closed по отчету снятия заказов"""
+        events = []
+        for courier_id, item in report.items():
+            if item['released']:
+                events.append({'courier_id': courier_id, 'event': 'cancel',
+                               'orders': item['released']})
+            if item['assign_closed']:
+                events.append({'courier_id': courier_id,
+                               'event': 'assign_closed',
+                               'assign_id': item['assign_closed']})
+        return events
 
     @staticmethod
     def get_max_weight(key):
         units = {'foot': 10, 'bike': 15, 'car': 50}
         return units.get(key, 0)
 
+    @classmethod
+    def get_max_weight_units(cls, key):
+        return cls.get_max_weight(key) * WEIGHT_SCALE
+
     def save(self, *args, **kwargs):
         self.clean()
+        # Не перезаписываем версию устаревшим значением из памяти
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'version']
         super(Courier, self).save(*args, **kwargs)
 
+    def bump_version(self):
+        Courier.objects.filter(pk=self.pk).update(version=F('version') + 1)
+        self.refresh_from_db(fields=['version'])
+
+    @property
+    def etag(self):
+        return f'"{self.pk}-{self.version}"'
+
     def update_allowed_weight(self):
-        self.allowed_orders_weight = self.get_max_weight(self.courier_type)
+        self.allowed_weight_units = self.get_max_weight_units(
+            self.courier_type)
@@ -0,0 +1,20 @@
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+    """Сохраненный ответ на запрос с заголовком Idempotency-Key"""
+    key = models.CharField(max_length=255, verbose_name='key')
+    path = models.CharField(max_length=255, verbose_name='path')
+    request_hash = models.CharField(max_length=64, verbose_name='request_hash')
+    # Пустой, пока запрос с этим ключом выполняется
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True,
+                                                   verbose_name='status_code')
+    response = JSONField(blank=True, null=True, verbose_name='response')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='expires_at')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('key', 'path'),
+                                    name='unique_idempotency_key_path'),
+        ]
@@ -0,0 +1,51 @@
+import datetime
+
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+from django.db.models import Q
+
+
+class JobStatusChoices(models.TextChoices):
+    queued = 'queued'
+    running = 'running'
+    done = 'done'
+    failed = 'failed'
+
+
+class Job(models.Model):
+    """Фоновая задача, выполняемая командой manage.py worker"""
+    name = models.CharField(max_length=100, verbose_name='name')
+    payload = JSONField(default=dict, verbose_name='payload')
+    status = models.CharField(
+        max_length=7,
+        choices=JobStatusChoices.choices,
+        default=JobStatusChoices.queued,
+        verbose_name='status'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0,
+                                                verbose_name='attempts')
+    max_attempts = models.PositiveSmallIntegerField(
+        default=5, verbose_name='max_attempts')
+    run_at = models.DateTimeField(default=datetime.datetime.now,
+                                  verbose_name='run_at')
+    # Пока не истекло, задачу выполняет взявший ее обработчик. Если он
+    # упал, после этого времени задачу заберет другой
+    locked_until = models.DateTimeField(blank=True, null=True,
+                                        verbose_name='locked_until')
+    created_at = models.DateTimeField(default=datetime.datetime.now,
+                                      verbose_name='created_at')
+    started_at = models.DateTimeField(blank=True, null=True,
+                                      verbose_name='started_at')
+    finished_at = models.DateTimeField(blank=True, null=True,
+                                       verbose_name='finished_at')
+    duration_ms = models.FloatField(blank=True, null=True,
+                                    verbose_name='duration_ms')
+    last_error = models.TextField(blank=True, verbose_name='last_error')
+
+    class Meta:
+        indexes = [
+            # Очередь: только невыполненные задачи
+            models.Index(fields=['run_at'],
+                         name='job_pending_idx',
+                         condition=Q(status__in=('queued', 'running'))),
+        ]
@@ -0,0 +1,12 @@
+from django.db import models
+
+
+class RateBucket(models.Model):
+    """
+    Корзина токенов ограничителя частоты запросов. Токены пополняются со
+    скоростью rate в секунду до burst и списываются по одному на запрос.
+    """
+    key = models.CharField(max_length=255, primary_key=True,
+                           verbose_name='key')
+    tokens = models.FloatField(verbose_name='tokens')
+    updated_at = models.DateTimeField(verbose_name='updated_at')
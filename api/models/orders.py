@@ -1,18 +1,34 @@
 import datetime
 
 from api.models import Courier
+from api.models.couriers import (WEIGHT_SCALE, from_weight_units,
+                                 to_weight_units)
+from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models, router
+from django.db.models import F, Q
+
+
+class StatusChoices(models.TextChoices):
+    new = 'new'
+    assigned = 'assigned'
+    complete = 'complete'
 
 
 class Order(models.Model):
+    # Допустимые переходы: имя -> (исходный статус, новый статус)
+    TRANSITIONS = {
+        'assign': (StatusChoices.new, StatusChoices.assigned),
+        'cancel': (StatusChoices.assigned, StatusChoices.new),
+        'complete': (StatusChoices.assigned, StatusChoices.complete),
+    }
+
     order_id = models.PositiveIntegerField(primary_key=True)
-    weight = models.DecimalField(
-        validators=[MaxValueValidator(50)],
-        decimal_places=4,
-        max_digits=6,
+    # Вес в единицах WEIGHT_SCALE, в килограммах - свойство weight
+    weight_units = models.PositiveIntegerField(
+        validators=[MaxValueValidator(50 * WEIGHT_SCALE)],
         verbose_name='Weight',
         blank=False,
         db_index=True
@@ -30,7 +46,9 @@ class Order(models.Model):
         blank=True,
         null=True,
         verbose_name='assign_courier',
-        related_name='order'
+        related_name='order',
+        # Курьер может лежать в другой базе, см. api.routers.ShardRouter
+        db_constraint=False
     )
     assign_time = models.DateTimeField(
         blank=True,
@@ -54,32 +72,180 @@ class Order(models.Model):
         verbose_name='is_complete',
         default=False
     )
+    # Время попадания заказа в пул свободных заказов. Заказы назначаются
+    # в порядке очереди, отмененный заказ встает в ее конец
+    pooled_at = models.DateTimeField(
+        default=datetime.datetime.now,
+        verbose_name='pooled_at'
+    )
+    status = models.CharField(
+        max_length=8,
+        choices=StatusChoices.choices,
+        default=StatusChoices.new,
+        db_index=True,
+        verbose_name='status'
+    )
+
+    class Meta:
+        indexes = [
+            # Пул свободных заказов: только их перебирает назначение
+            models.Index(fields=['region', 'weight_units'],
+                         name='order_pool_idx',
+                         condition=Q(status='new')),
+        ]
+
+    @property
+    def weight(self):
+        return from_weight_units(self.weight_units)
+
+    @weight.setter
+    def weight(self, weight):
+        self.weight_units = to_weight_units(weight)
+
+    def transition(self, name, **values) -> bool:
+        """
+        Переводит заказ в новый статус одним условным UPDATE, который
+        записывает только переданные поля. Возвращает False, если заказ
+        уже не в исходном статусе (например, его изменил другой запрос).
+        """
+        from api.utils.shards import shard_of
+
+        source, target = self.TRANSITIONS[name]
+        values['status'] = target
+        updated = Order.objects.using(shard_of(self)).filter(
+            pk=self.pk, status=source).update(**values)
+        if not updated:
+            return False
+        for field, value in values.items():
+            setattr(self, field, value)
+        return True
 
     def assign_order(self, courier, assign):
         """Назначает заказ на доставку"""
-        if not courier.allowed_orders_weight:
+        if not courier.allowed_weight_units:
             return None
-        # назначаем время выдачи заказа
-        self.assign_time = datetime.datetime.now()
+        # помечаем заказ как назначенный и назначаем время выдачи заказа
+        if not self.transition('assign',
+                               assign_time=datetime.datetime.now(),
+                               allow_to_assign=False,
+                               assign_courier=courier):
+            return False
         # уменьшаем доступный вес заказов курьера
-        courier.allowed_orders_weight -= self.weight
-        # помечаем заказ как назначенный
-        self.allow_to_assign = False
-        self.assign_courier = courier
+        courier.allowed_weight_units -= self.weight_units
         assign.orders.add(self)
         assign.courier_type = courier.courier_type
-        self.save()
+        return True
 
     def cancel_assign(self):
         """Удаляет заказ из назначенной доставки"""
+        from api.utils.candidates import add_orders
+        from api.utils.shards import shard_of
+
+        courier = self.assign_courier
+        if not self.transition('cancel',
+                               assign_courier=None,
+                               allow_to_assign=True,
+                               pooled_at=datetime.datetime.now()):
+            return False
         self.assigns.remove(self.assigns.first())
-        self.assign_courier = None
-        self.allow_to_assign = True
-        self.save()
+        add_orders([self], using=shard_of(self))
+        if courier is not None:
+            courier.bump_version()
+        return True
+
+    @classmethod
+    def complete(cls, order_id, courier_id, complete_time):
+        """
+        Завершает заказ одним запросом (без шардов): проверяет, что заказ
+        назначен этому курьеру и выдан раньше complete_time, завершает его,
+        закрывает развоз, если в нем не осталось невыполненных заказов,
+        меняет версию профиля курьера, ставит в очередь пересчет его
+        рейтинга и отправляет курьеру событие о закрытии развоза.
+        Повтор для уже выполненного этим курьером заказа тоже успешен и
+        ничего не меняет. Возвращает None, если завершить нельзя.
+        Завершение ждет блокировку курьера, как назначение и PATCH.
+        """
+        from api.utils.locks import COURIER_LOCK, lock_courier
+
+        sharded = bool(settings.DATABASE_SHARDS)
+        if sharded:
+            with lock_courier(courier_id):
+                completed = cls._complete(order_id, courier_id,
+                                          complete_time)
+        else:
+            completed = cls._complete(order_id, courier_id, complete_time,
+                                      COURIER_LOCK)
+        if completed is None:
+            return cls.completed_before(order_id, courier_id)
+        return completed
+
+    @classmethod
+    def completed_before(cls, order_id, courier_id):
+        """Результат повторного завершения уже выполненного заказа"""
+        from api.utils.shards import shard_aliases
+
+        for alias in shard_aliases():
+            if cls.objects.using(alias).filter(
+                    pk=order_id, assign_courier_id=courier_id,
+                    status=StatusChoices.complete).exists():
+                return {'order_id': order_id, 'assign_id': None,
+                        'assign_closed': False}
+        return None
+
+    @classmethod
+    def _complete(cls, order_id, courier_id, complete_time, lock=None):
+        from api.utils.events import CHANNEL, publish
+        from api.utils.jobs import enqueue
+        from api.utils.prepared import execute
+        from api.utils.shards import shard_aliases
+        from api.utils.sketch import LOG_GAMMA, record_delivery
+
+        # Блокировка курьера отдельной командой того же обращения к
+        # базе: она действует до конца неявной транзакции, а снимок
+        # данных завершения берется уже после ее получения
+        prefix = LOCK_COURIER_SQL if lock is not None else ''
+        # Шард заказа по номеру неизвестен: пробуем по очереди. При шардах
+        # курьер и очередь задач лежат в default, их меняем отдельно, даже
+        # если заказ тоже лежит в default
+        sharded = bool(settings.DATABASE_SHARDS)
+        # Событие о закрытии развоза отправляет тот же запрос, если он
+        # выполняется в default
+        notify = settings.EVENTS_BACKEND == 'notify' and not sharded
+        for alias in shard_aliases():
+            connection = connections[alias or router.db_for_write(cls)]
+            with connection.cursor() as cursor:
+                execute(cursor, 'complete_order', COMPLETE_ORDER_SQL, {
+                    'lock': lock,
+                    'order_id': order_id,
+                    'courier_id': courier_id,
+                    'complete_time': complete_time,
+                    'now': datetime.datetime.now(),
+                    'enqueue_stats': not (settings.JOBS_EAGER or sharded),
+                    'channel': CHANNEL,
+                    'notify': notify,
+                    'log_gamma': LOG_GAMMA,
+                    'bump': not sharded,
+                    'sketch': not sharded,
+                }, prefix=prefix)
+                row = cursor.fetchone()
+            if row is not None:
+                break
+        if row is None:
+            return None
+        if sharded:
+            Courier.objects.filter(pk=courier_id).update(
+                version=F('version') + 1)
+            record_delivery(*row[4:7], complete_time)
+        if settings.JOBS_EAGER or sharded:
+            enqueue('recompute_courier_stats', courier_id=courier_id)
+        if row[2] and not notify:
+            publish(courier_id, 'assign_closed', assign_id=row[1])
+        return dict(zip(('order_id', 'assign_id', 'assign_closed'), row))
 
     def clean(self, *args, **kwargs):
         # Проверка веса
-        if self.weight * 100 < 1 or self.weight > 50:
+        if self.weight_units * 100 < WEIGHT_SCALE \
+                or self.weight_units > 50 * WEIGHT_SCALE:
             return ValidationError(f'invalid weight value {self.weight}')
         # Проверка региона
         if not isinstance(self.region, int) or int(self.region) < 1:
@@ -96,3 +262,86 @@ class Order(models.Model):
     def save(self, *args, **kwargs):
         self.full_clean()
         super(Order, self).save(*args, **kwargs)
+
+
+LOCK_COURIER_SQL = """
+SELECT pg_advisory_xact_lock(%(lock)s, %(courier_id)s);
+"""
+
+# Время приводится к timestamp явно: в подготовленном операторе без
+# приведения PostgreSQL выводит для параметра timestamp with time zone
+COMPLETE_ORDER_SQL = """
+WITH target AS (
+    -- Время доставки считается от завершения предыдущего заказа развоза
+    -- или от выдачи развоза
+    SELECT o.order_id, ao.assign_id, o.region, a.courier_type,
+           CEIL(LN(GREATEST(1, EXTRACT(EPOCH FROM
+               %(complete_time)s::timestamp - COALESCE((
+                   SELECT max(p.complete_time)
+                   FROM api_assign_orders pa
+                   JOIN api_order p ON p.order_id = pa.order_id
+                   WHERE pa.assign_id = ao.assign_id AND p.is_complete),
+                   o.assign_time)))) / %(log_gamma)s)::integer AS bin
+    FROM api_order o
+    JOIN api_assign_orders ao ON ao.order_id = o.order_id
+    JOIN api_assign a ON a.id = ao.assign_id
+    WHERE o.order_id = %(order_id)s
+      AND o.assign_courier_id = %(courier_id)s
+      AND o.status = 'assigned'
+      AND o.assign_time < %(complete_time)s
+    LIMIT 1
+), completed AS (
+    UPDATE api_order o
+    SET status = 'complete', is_complete = TRUE,
+        complete_time = %(complete_time)s
+    FROM target t
+    WHERE o.order_id = t.order_id AND o.status = 'assigned'
+    RETURNING o.order_id, t.assign_id, t.region, t.courier_type, t.bin
+), closed AS (
+    UPDATE api_assign a
+    SET is_complete = TRUE
+    FROM completed c
+    WHERE a.id = c.assign_id AND NOT EXISTS (
+        SELECT 1
+        FROM api_assign_orders ao
+        JOIN api_order o ON o.order_id = ao.order_id
+        WHERE ao.assign_id = c.assign_id
+          AND o.order_id <> c.order_id
+          AND o.is_complete IS NOT TRUE)
+    RETURNING a.id
+), bumped AS (
+    UPDATE api_courier
+    SET version = version + 1
+    WHERE courier_id = %(courier_id)s AND EXISTS (SELECT 1 FROM completed)
+      AND %(bump)s
+), stats_job AS (
+    INSERT INTO api_job (name, payload, status, attempts, max_attempts,
+                         run_at, created_at, last_error)
+    SELECT 'recompute_courier_stats',
+           jsonb_build_object('courier_id', %(courier_id)s::integer),
+           'queued', 0, 5, %(now)s::timestamp, %(now)s::timestamp, ''
+    FROM completed
+    WHERE %(enqueue_stats)s
+), sketched AS (
+    INSERT INTO api_deliverysketch AS s (region, courier_type, bucket_start,
+                                         bins, count)
+    SELECT region, courier_type, date_trunc('hour', %(complete_time)s),
+           jsonb_build_object(bin::text, 1), 1
+    FROM completed
+    WHERE %(sketch)s
+    ON CONFLICT (region, courier_type, bucket_start) DO UPDATE
+    SET bins = s.bins || (SELECT jsonb_object_agg(
+            key, value::integer + COALESCE((s.bins ->> key)::integer, 0))
+            FROM jsonb_each_text(EXCLUDED.bins)),
+        count = s.count + 1
+), notified AS (
+    SELECT pg_notify(%(channel)s, json_build_object(
+        'courier_id', %(courier_id)s::integer, 'event', 'assign_closed',
+        'assign_id', id)::text)
+    FROM closed
+    WHERE %(notify)s
+)
+SELECT c.order_id, c.assign_id, EXISTS (SELECT 1 FROM closed),
+       (SELECT count(*) FROM notified), c.region, c.courier_type, c.bin
+FROM completed c
+"""
@@ -0,0 +1,16 @@
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+
+
+class RequestProfile(models.Model):
+    """Профиль выполнения одного запроса, снятый ProfilingMiddleware"""
+    method = models.CharField(max_length=10, verbose_name='method')
+    path = models.CharField(max_length=255, verbose_name='path')
+    endpoint = models.CharField(max_length=255, db_index=True,
+                                verbose_name='endpoint')
+    status_code = models.PositiveSmallIntegerField(verbose_name='status_code')
+    duration_ms = models.FloatField(verbose_name='duration_ms')
+    # Самые затратные функции: function, ncalls, tottime, cumtime
+    stats = JSONField(verbose_name='stats')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True,
+                                      verbose_name='created_at')
@@ -0,0 +1,14 @@
+from django.db import models
+
+
+class RegionShard(models.Model):
+    """
+    Перенесенный регион: база, в которой лежат его заказы и развозы.
+    Регионы без записи хранятся в DATABASE_SHARDS[region % len(shards)].
+    Меняется командой manage.py rebalance_shards.
+    """
+    region = models.PositiveSmallIntegerField(primary_key=True,
+                                              verbose_name='Region')
+    alias = models.CharField(max_length=100, verbose_name='alias')
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name='updated_at')
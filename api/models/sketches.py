@@ -0,0 +1,24 @@
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+
+
+class DeliverySketch(models.Model):
+    """
+    Распределение времени доставки заказов региона курьерами одного типа,
+    завершенных за час bucket_start: корзины наброска api.utils.sketch,
+    номер корзины -> число заказов.
+    """
+    region = models.PositiveSmallIntegerField(verbose_name='Region')
+    courier_type = models.CharField(max_length=4,
+                                    verbose_name='courier_type')
+    bucket_start = models.DateTimeField(db_index=True,
+                                        verbose_name='bucket_start')
+    bins = JSONField(default=dict, verbose_name='bins')
+    count = models.PositiveIntegerField(default=0, verbose_name='count')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('region', 'courier_type', 'bucket_start'),
+                name='unique_delivery_sketch'),
+        ]
@@ -0,0 +1,20 @@
+from api.models import Courier
+from django.db import models
+
+
+class CourierStats(models.Model):
+    """
+    Рейтинг и заработок курьера, посчитанные фоновой задачей для версии
+    профиля version. Если версия курьера изменилась, значения устарели.
+    """
+    courier = models.OneToOneField(
+        Courier,
+        primary_key=True,
+        related_name='stats',
+        on_delete=models.CASCADE
+    )
+    version = models.PositiveIntegerField(verbose_name='version')
+    rating = models.FloatField(verbose_name='rating')
+    earning = models.PositiveIntegerField(verbose_name='earning')
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name='updated_at')
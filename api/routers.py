@@ -0,0 +1,83 @@
+import contextlib
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Признак того, что чтения текущего запроса должны идти в основную базу
+_use_primary = ContextVar('use_primary', default=False)
+
+
+@contextlib.contextmanager
+def pin_to_primary(pinned=True):
+    token = _use_primary.set(pinned)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Отправляет чтения на реплики из DATABASE_REPLICAS, запись - в default.
+    Внутри pin_to_primary и при REPLICA_ROUTING=False все запросы идут
+    в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not settings.REPLICA_ROUTING or _use_primary.get():
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+# Модели, строки которых хранятся в базе своего региона
+SHARDED_MODELS = {'order', 'assign', 'assign_orders', 'ordercandidate',
+                  'archivedorder', 'archivedassign'}
+
+
+def is_sharded(model):
+    return model._meta.model_name in SHARDED_MODELS
+
+
+class ShardRouter:
+    """
+    При заданных DATABASE_SHARDS заказы и развозы лежат в базе своего
+    региона. Базу выбирает вызывающий код через using() (см.
+    api.utils.shards), связанные объекты читаются из базы объекта, через
+    который к ним обращаются. Курьеры и служебные таблицы - в default.
+    """
+
+    def _route(self, model, **hints):
+        if not settings.DATABASE_SHARDS:
+            return None
+        instance = hints.get('instance')
+        if instance is None or not is_sharded(instance):
+            return None
+        if is_sharded(model):
+            return instance._state.db
+        # Курьер заказа или развоза читается из default, а не из шарда
+        return 'default'
+
+    db_for_read = _route
+    db_for_write = _route
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not settings.DATABASE_SHARDS:
+            return None
+        # Заказ и развоз связываются только внутри одного шарда
+        if is_sharded(obj1) and is_sharded(obj2):
+            return obj1._state.db == obj2._state.db
+        return True
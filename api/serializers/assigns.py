@@ -1,8 +1,16 @@
+import datetime
+
 from api.models import Assign, Courier, Order
-from api.utils import Interval
+from api.models.orders import StatusChoices
+from api.utils.candidates import remove_orders
+from api.utils.events import publish
+from api.utils.locks import lock_courier
+from api.utils.prepared import fetch, fetch_first
+from api.utils.shards import group_by_shard
+from api.utils.tracing import span
+from django.http import Http404
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from rest_framework.generics import get_object_or_404
 from rest_framework.validators import UniqueValidator
 
 
@@ -21,28 +29,67 @@ class AssignSerializer(serializers.ModelSerializer):
     def save(self, **kwargs):
         # Получаем курьера, для которого будем назначать заказы
         courier_id = self.validated_data.get('courier_id')
-        courier = get_object_or_404(Courier, pk=courier_id)
+        # Запросы одного курьера выполняются по очереди: иначе два
+        # назначения могут оба пройти проверку открытого развоза
+        with lock_courier(courier_id):
+            return self.create_assign(courier_id)
+
+    def create_assign(self, courier_id):
+        with span('courier_fetch'):
+            courier = fetch_first('courier_by_pk',
+                                  Courier.objects.filter(pk=courier_id))
+            if courier is None:
+                raise Http404
         # Если у курьера есть незавершенные развозы то назначать новый нельзя
-        if not courier.can_take_assign():
-            return None
+        with span('can_take_assign'):
+            if not courier.can_take_assign():
+                return None
         # Пересчитываем максимальный вес, с учетом возможных изменений типа
         courier.update_allowed_weight()
-        intervals = Interval()
-        intervals.set_working_hours(courier.working_hours)
-        # ищем подходящие заказы, без учета времени
-        orders = Order.objects.filter(
-            weight__lte=courier.allowed_orders_weight,
-            region__in=courier.regions,
-            allow_to_assign=True)
-        if not orders:
-            return None
-        assign = Assign.objects.create(courier=courier)
-        for order in orders:
-            intervals.set_delivery_hours(order.delivery_hours)
-            if intervals.delivery_allowed() and courier.can_take_weight(order):
-                order.assign_order(courier, assign)
-        assign.save()
-        courier.save()
+        # Подходящие по региону, времени и типу заказы берем из таблицы
+        # кандидатов в шардах регионов курьера. Кандидаты могли быть
+        # записаны по профилю до его изменения, поэтому регион и время
+        # проверяются и здесь
+        with span('candidate_query'):
+            candidates = {
+                alias: fetch('assign_candidates', Order.objects.using(
+                    alias).filter(
+                    candidates__courier_id=courier.pk,
+                    weight_units__lte=courier.allowed_weight_units,
+                    region__in=regions,
+                    status=StatusChoices.new).order_by('pooled_at', 'pk'))
+                for alias, regions in group_by_shard(
+                    courier.regions, key=int).items()}
+        # Развоз собирается из заказов одного шарда, начиная с шарда
+        # с самым старым заказом
+        with span('interval_matching',
+                  candidates=sum(map(len, candidates.values()))):
+            for alias, orders in sorted(
+                    candidates.items(),
+                    key=lambda item: item[1][0].pooled_at if item[1]
+                    else datetime.datetime.max):
+                orders = courier.select_orders(orders)
+                if orders:
+                    break
+            else:
+                # Пустой развоз не создается: он блокировал бы курьера,
+                # пока его не закроют
+                return None
+        with span('order_writes', orders=len(orders)):
+            assign = Assign.objects.using(alias).create(courier=courier)
+            assigned = [order.pk for order in orders
+                        if order.assign_order(courier, assign)]
+            # Все заказы успел забрать другой запрос или диспетчер:
+            # пустой развоз заблокировал бы курьера
+            if not assigned:
+                assign.delete()
+                return None
+            remove_orders(assigned, using=alias)
+            assign.save()
+            courier.save()
+            courier.bump_version()
+            publish(courier.pk, 'assign', assign_id=assign.pk,
+                    orders=assigned)
         return assign
 
     def to_internal_value(self, data):
@@ -56,12 +103,18 @@ class AssignSerializer(serializers.ModelSerializer):
         return super(AssignSerializer, self).to_internal_value(data)
 
     def to_representation(self, instance):
+        with span('response_building'):
+            return self.build_response(instance)
+
+    @staticmethod
+    def build_response(instance):
         courier = Courier.objects.get(pk=instance['courier_id'])
-        assign = courier.assign.filter(is_complete=False).last()
+        assign = courier.open_assign()
         if not assign:
             return {'orders': []}
         orders = [{'id': item.pk} for item in
-                  assign.orders.filter(is_complete=False)]
+                  assign.orders.filter(
+                      is_complete=False).order_by('assign_time', 'pk')]
         assign_time = assign.assign_time
         response = {'orders': orders}
         if orders:
@@ -2,9 +2,16 @@ import datetime
 from collections import defaultdict
 
 from api.models.couriers import Courier
+from api.utils.candidates import refresh_couriers
+from api.utils.jobs import enqueue, enqueue_many
+from api.utils.locks import lock_courier, lock_couriers
+from api.utils.tracing import span
+from django.db.models import F
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+RELEASE_FIELDS = {'regions', 'working_hours', 'courier_type'}
+
 
 class CourierSerializer(serializers.ModelSerializer):
     courier_id = serializers.IntegerField()
@@ -24,18 +31,24 @@ class CourierSerializer(serializers.ModelSerializer):
         return super(CourierSerializer, self).to_internal_value(data)
 
     def update(self, instance, validated_data):
-        # Проверяем, что смена региона не помешает доставить заказ
-        instance.check_change_regions(validated_data.get('regions'))
-        # Проверяем, что смена рабочего времени не помешает доставить заказ
-        instance.check_change_working_hours(
-            validated_data.get('working_hours'))
-        # Проверяем, что смена типа курьера не помешает доставить заказ
-        instance.check_change_courier_type(validated_data.get('courier_type'))
-        assign = instance.assign.filter(is_complete=False).first()
-        if assign and assign.can_close():
-            assign.is_complete = True
-            assign.save()
-        return super(CourierSerializer, self).update(instance, validated_data)
+        # Профиль перечитывается под блокировкой курьера, чтобы не
+        # перезаписать изменения параллельного назначения
+        with lock_courier(instance.pk):
+            with span('profile_save'):
+                instance.refresh_from_db()
+                instance = super(CourierSerializer, self).update(
+                    instance, validated_data)
+                instance.bump_version()
+            if RELEASE_FIELDS.intersection(validated_data):
+                with span('candidates_refresh'):
+                    refresh_couriers([instance])
+            # Заказы, которые курьер больше не сможет доставить, снимает
+            # фоновая задача по уже сохраненному профилю
+            if RELEASE_FIELDS.intersection(validated_data):
+                with span('release_enqueue'):
+                    enqueue('release_courier_orders',
+                            courier_id=instance.pk)
+        return instance
 
     @classmethod
     def validate_courier_id(self, courier_id):
@@ -93,9 +106,81 @@ class CourierListSerializer(serializers.Serializer):
             failed_ids = [{'id': item} for item in ids if ids[item] != 1]
             raise ValidationError(
                 {'validation_error': {'couriers': failed_ids}})
-        couriers = [Courier(**item) for item in data]
-        return Courier.objects.bulk_create(couriers)
+        couriers = Courier.objects.bulk_create(
+            [Courier(**item) for item in data])
+        refresh_couriers(couriers)
+        return couriers
 
     def to_representation(self, instance):
         data = {'couriers': [{'id': courier.pk} for courier in instance]}
         return data
+
+
+class CourierBulkUpdateSerializer(serializers.Serializer):
+    """
+    Изменение профилей многих курьеров одной транзакцией: каждый элемент
+    data - courier_id и поля, как в PATCH /couriers/{id}
+    """
+    data = serializers.ListField(child=serializers.DictField(),
+                                 allow_empty=False, write_only=True)
+
+    def validate(self, attrs):
+        updates = {}
+        errors = []
+        for item in attrs['data']:
+            item = dict(item)
+            courier_id = item.pop('courier_id', None)
+            serializer = CourierSerializer(data=item, partial=True)
+            item_errors = {} if serializer.is_valid() else serializer.errors
+            if not isinstance(courier_id, int) or courier_id in updates:
+                item_errors = {**item_errors, 'courier_id': [
+                    'invalid or repeated courier_id']}
+            if item_errors:
+                errors.append({'id': courier_id, **item_errors})
+            else:
+                updates[courier_id] = serializer.validated_data
+        existing = set(Courier.objects.filter(
+            pk__in=updates).values_list('pk', flat=True))
+        errors += [{'id': courier_id, 'courier_id': ['courier not found']}
+                   for courier_id in updates if courier_id not in existing]
+        # Номера курьеров с ошибками отдает view: ValidationError
+        # превратил бы их в строки
+        self.item_errors = errors
+        if errors:
+            raise ValidationError('invalid couriers')
+        return {'updates': updates}
+
+    def create(self, validated_data):
+        updates = validated_data['updates']
+        # Профили перечитываются под блокировками всех курьеров запроса
+        with lock_couriers(updates):
+            with span('profile_save', couriers=len(updates)):
+                couriers = Courier.objects.in_bulk(list(updates))
+                for courier_id, values in updates.items():
+                    for field, value in values.items():
+                        setattr(couriers[courier_id], field, value)
+                fields = set().union(*updates.values())
+                Courier.objects.bulk_update(couriers.values(), fields)
+            # Заказы, которые курьеры больше не смогут доставить, снимаются
+            # сразу для всех, чтобы вернуть их в ответе
+            with span('release_orders'):
+                released = [couriers[courier_id] for courier_id, values
+                            in updates.items()
+                            if RELEASE_FIELDS.intersection(values)]
+                refresh_couriers(released)
+                report = Courier.release_unfit_orders_bulk(released)
+            Courier.objects.filter(pk__in=updates).exclude(
+                pk__in=[courier_id for courier_id, item in report.items()
+                        if item['released'] or item['assign_closed']]
+            ).update(version=F('version') + 1)
+        enqueue_many('recompute_courier_stats',
+                     [{'courier_id': courier_id} for courier_id in report])
+        return [{'id': courier_id,
+                 'released_orders': report.get(courier_id, {}).get(
+                     'released', []),
+                 'assign_closed': report.get(courier_id, {}).get(
+                     'assign_closed')}
+                for courier_id in updates]
+
+    def to_representation(self, instance):
+        return {'couriers': instance}
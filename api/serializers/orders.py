@@ -1,7 +1,11 @@
 import datetime
+from contextlib import ExitStack
 
 import pytz
-from api.models import Courier, Order
+from api.models import ArchivedOrder, Order
+from api.utils.candidates import add_orders
+from api.utils.shards import group_by_shard, shard_aliases
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.validators import UniqueValidator
@@ -9,20 +13,21 @@ from rest_framework.validators import UniqueValidator
 
 class OrderSerializer(serializers.ModelSerializer):
     order_id = serializers.IntegerField(validators=[UniqueValidator])
+    # В модели вес хранится целым числом, API принимает килограммы
+    weight = serializers.DecimalField(max_digits=6, decimal_places=4)
 
     class Meta:
         fields = ('order_id', 'weight', 'region', 'delivery_hours')
         model = Order
 
     @staticmethod
-    def check_correct_complete_time(instance, complete_time) -> None:
+    def parse_complete_time(complete_time) -> datetime.datetime:
+        """Разбирает время завершения и приводит его к UTC"""
         utc = pytz.UTC
         format_datetime = '%Y-%m-%dT%H:%M:%S.%f%z'
         try:
             date = datetime.datetime.strptime(complete_time, format_datetime)
-            asign_date = utc.localize(instance.assign_time)
-            if asign_date >= date:
-                raise ValidationError('invalid interval to complete time')
+            return date.astimezone(utc).replace(tzinfo=None)
         except TypeError:
             raise ValidationError('invalid type complete time')
         except ValueError:
@@ -38,26 +43,25 @@ class OrderSerializer(serializers.ModelSerializer):
             raise ValidationError('empty request')
         return super(OrderSerializer, self).to_internal_value(data)
 
-    def update(self, instance, validated_data):
-        complete_time = self.context.get('complete_time')
-        courier_id = self.context.get('courier_id')
-        courier = Courier.objects.get(courier_id=courier_id)
-        self.check_correct_complete_time(instance, complete_time)
-        instance.complete_time = complete_time
-        instance.assign_courier = courier
-        instance.is_complete = True
-        instance.save()
-        # Если все заказы в развозе завершены - завершаем развоз
-        assign = instance.assigns.first()
-        if assign.can_close():
-            assign.is_complete = True
-            assign.save()
-        return super(OrderSerializer, self).update(instance, validated_data)
-
-    @classmethod
+    @staticmethod
+    def existing_ids(order_ids) -> set:
+        """Номера из order_ids, уже занятые заказами или архивом"""
+        existing = set()
+        if not order_ids:
+            return existing
+        for alias in shard_aliases():
+            for model in (Order, ArchivedOrder):
+                existing.update(model.objects.using(alias).filter(
+                    pk__in=order_ids).values_list('pk', flat=True))
+        return existing
+
     def validate_order_id(self, order_id):
-        order = Order.objects.filter(pk=order_id).exists()
-        if order:
+        # OrderListSerializer заранее находит занятые номера всего запроса.
+        # Отдельный сериализатор проверяет номер сам
+        existing = self.context.get('existing_order_ids')
+        if existing is None:
+            existing = self.existing_ids([order_id])
+        if order_id in existing:
             raise ValidationError('invalid value order_id'
                                   f'({order_id}) this id already exists')
         return order_id
@@ -91,13 +95,46 @@ class OrderSerializer(serializers.ModelSerializer):
 class OrderListSerializer(serializers.Serializer):
     data = OrderSerializer(required=False, many=True, write_only=True)
 
+    def to_internal_value(self, data):
+        # Занятые номера ищутся одним запросом к каждой таблице шарда,
+        # а не двумя запросами на каждый заказ
+        items = data.get('data') if isinstance(data, dict) else None
+        if isinstance(items, list):
+            self.context['existing_order_ids'] = OrderSerializer.existing_ids(
+                self.order_ids(items))
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def order_ids(items) -> set:
+        """
+        Номера заказов запроса, приведенные так же, как их приведет поле
+        order_id: номер "5" ищется как 5. Номера, которые поле не примет,
+        все равно не пройдут проверку
+        """
+        field = serializers.IntegerField()
+        order_ids = set()
+        for item in items:
+            if not isinstance(item, dict) or 'order_id' not in item:
+                continue
+            try:
+                order_ids.add(field.to_internal_value(item['order_id']))
+            except ValidationError:
+                continue
+        return order_ids
+
     def create(self, validated_data):
         data = validated_data.get('data')
         if not data:
             raise ValidationError({'validation_error': 'empty request'})
 
         orders = [Order(**item) for item in data]
-        return Order.objects.bulk_create(orders)
+        # Каждый заказ записывается в шард своего региона
+        with ExitStack() as stack:
+            for alias, shard_orders in group_by_shard(orders).items():
+                stack.enter_context(transaction.atomic(using=alias))
+                Order.objects.using(alias).bulk_create(shard_orders)
+                add_orders(shard_orders, using=alias)
+        return orders
 
     def to_representation(self, instance):
         data = {'orders': [{'id': order.pk} for order in instance]}
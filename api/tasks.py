@@ -0,0 +1,30 @@
+from api.models import Courier, CourierStats
+from api.utils import get_earning, get_rating
+from api.utils.jobs import enqueue, task
+from api.utils.locks import lock_courier
+
+
+@task('release_courier_orders')
+def release_courier_orders(courier_id):
+    """Снимает заказы, которые курьер не сможет доставить после PATCH"""
+    with lock_courier(courier_id):
+        courier = Courier.objects.filter(pk=courier_id).first()
+        if courier is None:
+            return
+        courier.release_unfit_orders()
+    enqueue('recompute_courier_stats', courier_id=courier_id)
+
+
+@task('recompute_courier_stats')
+def recompute_courier_stats(courier_id):
+    """Сохраняет рейтинг и заработок для текущей версии профиля курьера"""
+    courier = Courier.objects.filter(pk=courier_id).first()
+    if courier is None:
+        return
+    # Версия читается до истории: если курьер изменится во время расчета,
+    # значения окажутся привязаны к старой версии и не будут использованы
+    CourierStats.objects.update_or_create(courier=courier, defaults={
+        'version': courier.version,
+        'rating': get_rating(courier),
+        'earning': get_earning(courier),
+    })
@@ -1,3 +1,4 @@
+import datetime
 import json
 
 from django.test import Client
@@ -28,8 +29,9 @@ class MixinAPI:
         return response
 
     @staticmethod
-    def request_get_couriers_detail(courier_id):
-        response = MixinAPI.client.get(f'/api/v1/couriers/{courier_id}/')
+    def request_get_couriers_detail(courier_id, **extra):
+        response = MixinAPI.client.get(f'/api/v1/couriers/{courier_id}/',
+                                       **extra)
         return response
 
     @staticmethod
@@ -39,6 +41,13 @@ class MixinAPI:
                                          content_type='application/json')
         return response
 
+    @staticmethod
+    def request_patch_couriers(payload):
+        response = MixinAPI.client.patch('/api/v1/couriers/',
+                                         data=json.dumps(payload),
+                                         content_type='application/json')
+        return response
+
     @staticmethod
     def request_post_orders(payload):
         response = MixinAPI.client.post('/api/v1/orders/',
@@ -47,15 +56,23 @@ class MixinAPI:
         return response
 
     @staticmethod
-    def request_post_orders_assign(payload):
+    def request_post_orders_assign(payload, **extra):
         response = MixinAPI.client.post('/api/v1/orders/assign/',
                                         data=json.dumps(payload),
-                                        content_type='application/json')
+                                        content_type='application/json',
+                                        **extra)
         return response
 
     @staticmethod
-    def request_post_orders_complete(payload):
+    def request_post_orders_complete(payload, **extra):
         response = MixinAPI.client.post('/api/v1/orders/complete/',
                                         data=json.dumps(payload),
-                                        content_type='application/json')
+                                        content_type='application/json',
+                                        **extra)
         return response
+
+    @staticmethod
+    def complete_time(minutes):
+        """Время завершения через minutes минут от текущего момента"""
+        date = datetime.datetime.utcnow() + datetime.timedelta(minutes=minutes)
+        return date.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-4] + 'Z'
@@ -0,0 +1,171 @@
+import contextlib
+import json
+import os
+import re
+
+from django.db import connections
+
+PLANS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'plans')
+# Команды, план которых снимается, в том числе UNION в скобках.
+# Блокировки, SAVEPOINT, PREPARE и EXECUTE пропускаются
+EXPLAINABLE_RE = re.compile(r'^[\s(]*(SELECT|WITH|INSERT|UPDATE|DELETE)\b',
+                            re.IGNORECASE)
+RELATION_RE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+"?(\w+)"?',
+                         re.IGNORECASE)
+# Последовательное чтение стольких строк и больше считается регрессией.
+# Небольшие таблицы, например курьеров, планировщик вправе читать целиком
+SEQ_SCAN_ROWS = 10000
+# Буферы и оценка строк могут вырасти относительно снимка не больше чем
+# в PLAN_TOLERANCE раз и не больше чем на PLAN_SLACK: мелкие запросы
+# не падают от разницы в несколько страниц
+PLAN_TOLERANCE = 2
+PLAN_SLACK = 16
+# Чтение таблицы по индексу через bitmap и напрямую планировщик выбирает
+# по близкой стоимости, в форме плана это один узел
+INDEX_SCANS = {'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan'}
+BITMAP_NODES = {'Bitmap Index Scan', 'BitmapAnd', 'BitmapOr'}
+# Таблицы меньше SEQ_SCAN_ROWS строк по статистике
+SMALL_TABLES_SQL = """
+SELECT relname FROM pg_class WHERE relkind = 'r' AND reltuples < %s
+"""
+
+
+class PlanRecorder:
+    """
+    Снимает EXPLAIN (ANALYZE, BUFFERS) каждого запроса перед его
+    выполнением. Запрос выполняется в точке сохранения, которая затем
+    откатывается, поэтому данные и последующие запросы не меняются.
+    Работает только внутри транзакции, например в TestCase.
+    Небольшие таблицы, например курьеров, планировщик читает целиком или
+    по индексу почти по одной цене: в форме плана любое их чтение - один
+    узел Scan.
+    """
+
+    def __init__(self):
+        self.plans = []
+        self.small_tables = {}
+
+    @contextlib.contextmanager
+    def record(self):
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many:
+            # Несколько команд одного обращения, например блокировка
+            # курьера перед завершением заказа, разбираются по отдельности
+            for statement in sql.split(';'):
+                if (EXPLAINABLE_RE.match(statement)
+                        and 'pg_advisory' not in statement):
+                    # Отдельный курсор соединения: курсор запроса может быть
+                    # серверным, например при итерации по queryset
+                    with context['connection'].connection.cursor() as cursor:
+                        self.plans.append(summarize(
+                            statement, explain(cursor, statement, params),
+                            self.small(context['connection'].alias, cursor)))
+        return execute(sql, params, many, context)
+
+    def small(self, alias, cursor) -> set:
+        if alias not in self.small_tables:
+            cursor.execute(SMALL_TABLES_SQL, [SEQ_SCAN_ROWS])
+            self.small_tables[alias] = {name for name, in cursor.fetchall()}
+        return self.small_tables[alias]
+
+
+def explain(cursor, sql, params) -> dict:
+    """План с фактическими строками и буферами, без последствий запроса"""
+    cursor.execute('SAVEPOINT query_plan')
+    try:
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql,
+                       params)
+        plan = cursor.fetchone()[0]
+    finally:
+        cursor.execute('ROLLBACK TO SAVEPOINT query_plan')
+        cursor.execute('RELEASE SAVEPOINT query_plan')
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def nodes(plan, depth=0):
+    yield depth, plan
+    for child in plan.get('Plans', ()):
+        yield from nodes(child, depth + 1)
+
+
+def index_names(plan) -> list:
+    if plan['Node Type'] != 'Bitmap Heap Scan':
+        return [plan['Index Name']]
+    return sorted(node['Index Name'] for _, node in nodes(plan)
+                  if node['Node Type'] == 'Bitmap Index Scan')
+
+
+def shape(plan, small=frozenset(), depth=0):
+    """
+    Узлы плана без стоимостей: чтение по индексу - одним узлом, любое
+    чтение небольшой таблицы из small - узлом Scan
+    """
+    if plan.get('Relation Name') in small and (
+            plan['Node Type'] in INDEX_SCANS
+            or plan['Node Type'] == 'Seq Scan'):
+        yield '  ' * depth + 'Scan ' + plan['Relation Name']
+    elif plan['Node Type'] in INDEX_SCANS:
+        yield '  ' * depth + ' '.join(
+            ('Index Scan', plan['Relation Name'], *index_names(plan)))
+    else:
+        yield '  ' * depth + ' '.join(filter(None, (
+            plan['Node Type'], plan.get('Relation Name'),
+            plan.get('Index Name'))))
+    for child in plan.get('Plans', ()):
+        if child['Node Type'] not in BITMAP_NODES:
+            yield from shape(child, small, depth + 1)
+
+
+def summarize(sql, plan, small=frozenset()) -> dict:
+    """
+    Форма плана без стоимостей, буферы всего запроса, наибольшая оценка
+    строк в узле и таблицы, прочитанные последовательно целиком
+    """
+    match = RELATION_RE.search(sql)
+    seq_scans, rows = [], 0
+    for _, node in nodes(plan):
+        rows = max(rows, node['Plan Rows'])
+        if node['Node Type'] == 'Seq Scan':
+            scanned = (node['Actual Rows'] + node.get(
+                'Rows Removed by Filter', 0)) * node['Actual Loops']
+            if scanned >= SEQ_SCAN_ROWS:
+                seq_scans.append(f'{node["Relation Name"]} ({scanned})')
+    return {
+        'query': ' '.join((EXPLAINABLE_RE.match(sql).group(1).upper(),
+                           match.group(1) if match else '-')),
+        'shape': list(shape(plan, small)),
+        'buffers': (plan.get('Shared Hit Blocks', 0)
+                    + plan.get('Shared Read Blocks', 0)),
+        'rows': rows,
+        'seq_scans': seq_scans,
+    }
+
+
+def exceeds(value, snapshot) -> bool:
+    return value > max(snapshot * PLAN_TOLERANCE, snapshot + PLAN_SLACK)
+
+
+def snapshot_path(name) -> str:
+    return os.path.join(PLANS_DIR, f'{name}.json')
+
+
+def load_snapshot(name):
+    try:
+        with open(snapshot_path(name)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def save_snapshot(name, plans):
+    os.makedirs(PLANS_DIR, exist_ok=True)
+    with open(snapshot_path(name), 'w') as file:
+        json.dump(plans, file, indent=2, ensure_ascii=False)
+        file.write('\n')
@@ -0,0 +1,89 @@
+import threading
+
+from api.tests.fixtures.fixture_api import MixinAPI
+from api.utils.locks import ADMISSION_LOCK
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework import status
+
+
+@override_settings(ADMISSION_RATE=0.01, ADMISSION_BURST=2,
+                   ADMISSION_CONCURRENCY=1, ADMISSION_WAIT=0)
+class TestAdmission(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        MixinAPI.client.cookies.clear()
+        self.request_post_couriers({'data': [
+            {'courier_id': courier_id, 'courier_type': 'foot',
+             'regions': [1], 'working_hours': ['09:00-18:00']}
+            for courier_id in (1, 2)]})
+
+    def hold_slot(self):
+        """Занимает единственный слот из другого соединения"""
+        taken = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_lock(%s, 0)',
+                               [ADMISSION_LOCK])
+                taken.set()
+                release.wait()
+                cursor.execute('SELECT pg_advisory_unlock(%s, 0)',
+                               [ADMISSION_LOCK])
+            connection.close()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        taken.wait()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+
+    def test_courier_rate_limited(self):
+        """Сверх корзины токенов курьер получает 429, другой - нет"""
+        for _ in range(2):
+            response = self.request_post_orders_assign({'courier_id': 1})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.request_post_orders_assign({'courier_id': 1})
+        self.assertEqual(response.status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 1)
+        response = self.request_post_orders_assign({'courier_id': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_concurrency_cap(self):
+        """Пока все слоты заняты, назначения и загрузки получают 429"""
+        self.hold_slot()
+        response = self.request_post_orders_assign({'courier_id': 1})
+        self.assertEqual(response.status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '1')
+        response = self.request_post_orders({'data': [
+            {'order_id': 1, 'weight': 1, 'region': 1,
+             'delivery_hours': ['09:00-18:00']}]})
+        self.assertEqual(response.status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_rejection_not_replayed(self):
+        """Отказ 429 не сохраняется для Idempotency-Key"""
+        self.hold_slot()
+        response = self.request_post_orders_assign(
+            {'courier_id': 1}, HTTP_IDEMPOTENCY_KEY='retry')
+        self.assertEqual(response.status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        self.doCleanups()
+        response = self.request_post_orders_assign(
+            {'courier_id': 1}, HTTP_IDEMPOTENCY_KEY='retry')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_metrics(self):
+        """Пределы и занятые слоты видны в метриках"""
+        self.request_post_orders_assign({'courier_id': 1})
+        response = MixinAPI.client.get('/api/v1/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        text = response.content.decode()
+        self.assertIn('admission_limit{limit="concurrency"} 1', text)
+        self.assertIn('admission_slots_in_use 0', text)
+        self.assertIn('admission_requests_total{endpoint="assign",'
+                      'result="admitted"}', text)
@@ -0,0 +1,108 @@
+import importlib
+from types import SimpleNamespace
+
+from api.models import Courier, OrderCandidate
+from api.tests.fixtures.fixture_api import MixinAPI
+from api.utils.candidates import check_candidates
+from api.utils.shards import (reset_region_map, shard_aliases,
+                              shard_for_region)
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase
+
+
+class TestOrderCandidates(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        reset_region_map()
+        MixinAPI.client.cookies.clear()
+        self.request_post_couriers({'data': [
+            {'courier_id': 1, 'courier_type': 'foot', 'regions': [1, 2],
+             'working_hours': ['09:00-12:00']},
+            {'courier_id': 2, 'courier_type': 'car', 'regions': [2],
+             'working_hours': ['18:00-21:00']}]})
+        self.request_post_orders({'data': [
+            {'order_id': 1, 'weight': 5, 'region': 1,
+             'delivery_hours': ['10:00-11:00']},
+            {'order_id': 2, 'weight': 20, 'region': 2,
+             'delivery_hours': ['08:00-20:00']},
+            {'order_id': 3, 'weight': 5, 'region': 2,
+             'delivery_hours': ['19:00-20:00']}]})
+
+    @staticmethod
+    def pairs():
+        return {pair for alias in shard_aliases()
+                for pair in OrderCandidate.objects.using(alias).values_list(
+                    'courier_id', 'order_id')}
+
+    def check(self):
+        results = [check_candidates(using=alias) for alias in shard_aliases()]
+        return {key: sum(result[key] for result in results)
+                for key in ('missing', 'extra')}
+
+    def assert_consistent(self):
+        self.assertEqual(self.check(), {'missing': 0, 'extra': 0})
+
+    def test_candidates_on_create(self):
+        """Кандидаты учитывают регион, время и вес по типу курьера"""
+        self.assertEqual(self.pairs(), {(1, 1), (2, 2), (2, 3)})
+
+    def test_patch_refreshes_candidates(self):
+        """PATCH регионов, часов или типа пересобирает кандидатов курьера"""
+        self.request_patch_courier({'courier_type': 'car',
+                                    'working_hours': ['09:00-20:00']}, 1)
+        self.assertEqual(self.pairs(), {(1, 1), (1, 2), (1, 3),
+                                        (2, 2), (2, 3)})
+        self.request_patch_courier({'regions': [3]}, 1)
+        self.assertEqual(self.pairs(), {(2, 2), (2, 3)})
+        self.assert_consistent()
+
+    def test_assign_uses_and_removes_candidates(self):
+        """Назначенные заказы уходят из кандидатов, снятые возвращаются"""
+        self.request_post_couriers({'data': [
+            {'courier_id': 3, 'courier_type': 'car', 'regions': [2],
+             'working_hours': ['08:00-09:00']}]})
+        self.assertIn((3, 2), self.pairs())
+        response = self.request_post_orders_assign({'courier_id': 2})
+        self.assertEqual(response.data['orders'], [{'id': 2}, {'id': 3}])
+        self.assertEqual(self.pairs(), {(1, 1)})
+        # Пешему курьеру заказ 2 тяжел: он снимается и снова доступен
+        self.request_patch_courier({'courier_type': 'foot'}, 2)
+        self.assertEqual(self.pairs(), {(1, 1), (3, 2)})
+        self.assert_consistent()
+
+    def test_assign_skips_stale_candidates(self):
+        """
+        Кандидаты, записанные по старому профилю, не назначаются: регион
+        и время проверяются при назначении
+        """
+        # Профиль изменен, а кандидаты еще нет - как при гонке импорта
+        # заказов с PATCH курьера
+        Courier.objects.filter(pk=1).update(regions=['2'])
+        OrderCandidate.objects.using(shard_for_region(2)).create(
+            courier_id=1, order_id=3)
+        response = self.request_post_orders_assign({'courier_id': 1})
+        self.assertEqual(response.data, {'orders': []})
+        self.assertIn((1, 1), self.pairs())
+
+    def test_check_candidates_fixes_table(self):
+        """Команда находит и исправляет расхождения"""
+        OrderCandidate.objects.filter(courier_id=2, order_id=3).delete()
+        OrderCandidate.objects.create(courier_id=1, order_id=2)
+        self.assertEqual(self.check(), {'missing': 1, 'extra': 1})
+        call_command('check_candidates', '--fix',
+                     stdout=open('/dev/null', 'w'))
+        self.assertEqual(self.pairs(), {(1, 1), (2, 2), (2, 3)})
+
+    def test_migration_fills_candidates(self):
+        """Миграция заполняет таблицу для уже существующих заказов"""
+        migration = importlib.import_module(
+            'api.migrations.0015_order_candidate_backfill')
+        for alias in shard_aliases():
+            OrderCandidate.objects.using(alias).all().delete()
+            migration.fill_candidates(apps, SimpleNamespace(
+                connection=connections[alias or 'default']))
+        self.assertEqual(self.pairs(), {(1, 1), (2, 2), (2, 3)})
+        self.assert_consistent()
@@ -0,0 +1,124 @@
+import datetime
+import json
+import threading
+
+from api.models import Assign, Courier, Order
+from django.db import connections
+from django.test import Client, TransactionTestCase
+
+THREADS = 8
+
+
+def complete_time(minutes):
+    date = datetime.datetime.now() + datetime.timedelta(minutes=minutes)
+    return date.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-4] + 'Z'
+
+
+class TestCourierConcurrency(TransactionTestCase):
+    """
+    Параллельные запросы по одному курьеру: каждый поток со своим
+    клиентом и своим соединением с базой стартует одновременно с другими.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        client = Client()
+        # С шардом-заглушкой четные регионы лежат в default, где их
+        # проверяет assert_consistent
+        self.post(client, '/api/v1/couriers/', {'data': [
+            {'courier_id': 1, 'courier_type': 'car', 'regions': [2, 4],
+             'working_hours': ['00:00-23:59']}]})
+        self.post(client, '/api/v1/orders/', {'data': [
+            {'order_id': order_id, 'weight': 7,
+             'region': 2 * (order_id % 2 + 1),
+             'delivery_hours': ['00:00-23:59']}
+            for order_id in range(1, 41)]})
+
+    @staticmethod
+    def post(client, url, payload):
+        return client.post(url, data=json.dumps(payload),
+                           content_type='application/json')
+
+    @staticmethod
+    def patch(client, url, payload):
+        return client.patch(url, data=json.dumps(payload),
+                            content_type='application/json')
+
+    def hammer(self, *workers):
+        """Запускает потоки одновременно и возвращает их ответы"""
+        barrier = threading.Barrier(len(workers))
+        responses = [None] * len(workers)
+        errors = []
+
+        def run(index, worker):
+            try:
+                barrier.wait()
+                responses[index] = worker(Client())
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(index, worker))
+                   for index, worker in enumerate(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return responses
+
+    def assign(self, client):
+        return self.post(client, '/api/v1/orders/assign/', {'courier_id': 1})
+
+    def complete(self, order_id):
+        def worker(client):
+            return self.post(client, '/api/v1/orders/complete/', {
+                'courier_id': 1, 'order_id': order_id,
+                'complete_time': complete_time(10)})
+        return worker
+
+    def change_type(self, courier_type):
+        def worker(client):
+            return self.patch(client, '/api/v1/couriers/1/',
+                              {'courier_type': courier_type})
+        return worker
+
+    def assert_consistent(self):
+        courier = Courier.objects.get(pk=1)
+        open_assigns = Assign.objects.filter(courier_id=1, is_complete=False)
+        self.assertLessEqual(open_assigns.count(), 1)
+        assigned = Order.objects.filter(assign_courier_id=1,
+                                        status='assigned')
+        weight = sum(order.weight for order in assigned)
+        self.assertLessEqual(weight,
+                             courier.get_max_weight(courier.courier_type))
+        if assigned:
+            self.assertEqual(
+                {order.pk for order in assigned},
+                set(open_assigns.get().orders.filter(
+                    status='assigned').values_list('pk', flat=True)))
+
+    def test_parallel_assigns_open_one_assign(self):
+        """Одновременные назначения открывают один развоз"""
+        responses = self.hammer(*[self.assign] * THREADS)
+        self.assertEqual({response.status_code for response in responses},
+                         {200})
+        orders = {json.dumps(response.json()['orders'])
+                  for response in responses}
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(Assign.objects.filter(courier_id=1).count(), 1)
+        self.assert_consistent()
+
+    def test_mixed_requests_keep_courier_consistent(self):
+        """Назначения, PATCH и завершения вперемешку не ломают курьера"""
+        for courier_type in ('foot', 'car', 'bike', 'car'):
+            self.hammer(self.assign, self.assign,
+                        self.change_type(courier_type))
+            assigned = list(Order.objects.filter(
+                assign_courier_id=1, status='assigned').values_list(
+                'pk', flat=True))
+            self.hammer(self.assign, self.change_type('car'),
+                        *[self.complete(order_id)
+                          for order_id in assigned[:3]])
+            self.assert_consistent()
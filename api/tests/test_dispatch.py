@@ -0,0 +1,133 @@
+import datetime
+from unittest import mock
+
+from api.models import Assign, Courier, Order
+from api.tests.fixtures.fixture_api import MixinAPI
+from api.utils.dispatch import (dispatch_tick, pending_orders,
+                                region_shard)
+from api.utils.shards import shard_aliases, shard_for_region
+from django.test import TestCase
+
+
+class TestDispatch(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        self.request_post_couriers({'data': [
+            {'courier_id': 1, 'courier_type': 'foot', 'regions': [1],
+             'working_hours': ['09:00-18:00']},
+            {'courier_id': 2, 'courier_type': 'car', 'regions': [2, 3],
+             'working_hours': ['09:00-18:00']}]})
+        self.request_post_orders({'data': [
+            {'order_id': 1, 'weight': 6, 'region': 1,
+             'delivery_hours': ['10:00-11:00']},
+            {'order_id': 2, 'weight': 6, 'region': 1,
+             'delivery_hours': ['10:00-11:00']},
+            {'order_id': 3, 'weight': 20, 'region': 3,
+             'delivery_hours': ['10:00-11:00']},
+            {'order_id': 4, 'weight': 1, 'region': 2,
+             'delivery_hours': ['19:00-20:00']}]})
+
+    @staticmethod
+    def tick(**kwargs):
+        """Такт по всем базам с заказами, как в команде dispatch"""
+        return sum(dispatch_tick(using=alias, **kwargs)
+                   for alias in shard_aliases())
+
+    @staticmethod
+    def order(pk, region):
+        return Order.objects.using(shard_for_region(region)).get(pk=pk)
+
+    def assigned(self, courier_id):
+        return sorted(pk for alias in shard_aliases()
+                      for pk in Order.objects.using(alias).filter(
+                          assign_courier_id=courier_id).values_list(
+                          'pk', flat=True))
+
+    def test_dispatch_by_assign_rules(self):
+        """Учитываются регионы, вес по типу курьера и время доставки"""
+        self.assertEqual(self.tick(), 2)
+        self.assertEqual(self.assigned(1), [1])
+        self.assertEqual(self.assigned(2), [3])
+        self.assertEqual(self.order(4, region=2).status, 'new')
+        assign = Assign.objects.using(shard_for_region(3)).get(courier_id=2)
+        self.assertEqual(list(assign.orders.values_list('pk', flat=True)),
+                         [3])
+        self.assertEqual(assign.courier_type, 'car')
+        self.assertEqual(Courier.objects.get(pk=2).version, 2)
+
+    def test_busy_courier_is_skipped(self):
+        """Курьеру с открытым развозом заказы не назначаются"""
+        self.tick()
+        self.assertEqual(self.tick(), 0)
+        self.assertEqual(self.assigned(1), [1])
+
+    def test_released_order_is_redispatched(self):
+        """Снятый с курьера заказ снова назначается"""
+        self.tick()
+        self.request_patch_courier({'regions': [2]}, 2)
+        self.assertEqual(self.order(3, region=3).status, 'new')
+        self.request_patch_courier({'regions': [3]}, 2)
+        self.assertEqual(self.tick(), 1)
+        self.assertEqual(self.assigned(2), [3])
+
+    def test_assign_sees_dispatched_orders(self):
+        """Назначенные диспетчером заказы возвращает POST /orders/assign"""
+        self.tick()
+        response = self.request_post_orders_assign({'courier_id': 2})
+        self.assertEqual(response.data['orders'], [{'id': 3}])
+
+    def test_shard_takes_own_regions(self):
+        """Часть обрабатывает только заказы своих регионов"""
+        self.assertEqual(region_shard(3, 2), 1)
+        self.assertEqual(self.tick(shard=(0, 2)), 0)
+        self.assertEqual(self.tick(shard=(1, 2)), 2)
+        self.assertEqual(self.assigned(1), [1])
+        self.assertEqual(self.assigned(2), [3])
+
+    def test_unfit_orders_do_not_block_pool(self):
+        """Заказ, который некому доставить, не задерживает следующие"""
+        # Заказ 5 того же региона (и шарда), что и заказ 1, доставить
+        # некому: курьер не работает вечером
+        self.request_post_orders({'data': [
+            {'order_id': 5, 'weight': 1, 'region': 1,
+             'delivery_hours': ['19:00-20:00']}]})
+        using = shard_for_region(1)
+        Order.objects.using(using).filter(pk=5).update(
+            pooled_at=self.order(1, region=1).pooled_at
+            - datetime.timedelta(minutes=1))
+        # Такт останавливается на странице без подходящих пар, следующий
+        # продолжает после нее
+        cursor = {}
+        self.assertEqual(dispatch_tick(order_batch=1, using=using,
+                                       cursor=cursor), 0)
+        self.assertEqual(cursor['after'].pk, 5)
+        self.assertEqual(dispatch_tick(order_batch=1, using=using,
+                                       cursor=cursor), 1)
+        self.assertEqual(self.assigned(1), [1])
+
+    def test_tick_stops_without_idle_couriers(self):
+        """Страница без свободных курьеров заканчивает такт"""
+        Assign.objects.create(courier_id=1)
+        Assign.objects.create(courier_id=2)
+        with mock.patch('api.utils.dispatch.pending_orders',
+                        wraps=pending_orders) as pages:
+            self.assertEqual(dispatch_tick(
+                order_batch=1, using=shard_for_region(1)), 0)
+        self.assertEqual(pages.call_count, 1)
+
+    def test_tick_reads_at_most_max_pages(self):
+        """За такт просматривается не больше max_pages страниц"""
+        # На первой странице (заказы 1, 2) пешему курьеру достается один
+        # заказ, пачка из двух не набирается
+        using = shard_for_region(1)
+        cursor = {}
+        with mock.patch('api.utils.dispatch.pending_orders',
+                        wraps=pending_orders) as pages:
+            self.assertEqual(dispatch_tick(order_batch=2, max_pages=1,
+                                           using=using, cursor=cursor), 1)
+        self.assertEqual(pages.call_count, 1)
+        self.assertEqual(cursor['after'].pk, 2)
+        self.assertEqual(dispatch_tick(order_batch=2, max_pages=1,
+                                       using=using, cursor=cursor), 1)
+        self.assertEqual(self.assigned(2), [3])
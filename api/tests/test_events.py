@@ -0,0 +1,129 @@
+import asyncio
+import datetime
+import json
+
+from api.utils.events import broker
+from api.views.events import CourierEventsRouter
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+
+
+def complete_time(minutes):
+    date = datetime.datetime.now() + datetime.timedelta(minutes=minutes)
+    return date.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-4] + 'Z'
+
+
+class TestCourierEvents(TransactionTestCase):
+    """Поток событий курьера через ASGI-приложение core.asgi"""
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = Client()
+        # Оба заказа в одном развозе: с шардом-заглушкой четные регионы
+        # лежат в default
+        self.post('/api/v1/couriers/', {'data': [
+            {'courier_id': 1, 'courier_type': 'foot', 'regions': [2, 4],
+             'working_hours': ['00:00-23:59']}]})
+        self.post('/api/v1/orders/', {'data': [
+            {'order_id': order_id, 'weight': 1, 'region': order_id * 2,
+             'delivery_hours': ['00:00-23:59']} for order_id in (1, 2)]})
+        self.addCleanup(broker.stop)
+
+    def post(self, url, payload):
+        return self.client.post(url, data=json.dumps(payload),
+                                content_type='application/json')
+
+    def stream(self, courier_id, *actions, events=1):
+        """
+        Открывает поток курьера, по очереди выполняет запросы actions в
+        отдельном потоке и возвращает первые events событий
+        """
+        async def scenario():
+            messages = []
+            received = asyncio.Event()
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                body = message.get('body', b'')
+                if body.startswith(b'event:'):
+                    received.set()
+
+            app = CourierEventsRouter(None)
+            path = f'/api/v1/couriers/{courier_id}/events/'
+            task = asyncio.ensure_future(app(
+                {'type': 'http', 'method': 'GET', 'path': path},
+                receive, send))
+            while not broker.subscribers and not task.done():
+                await asyncio.sleep(0.01)
+            loop = asyncio.get_running_loop()
+            for action in actions:
+                await loop.run_in_executor(None, self.run_action, action)
+            while len(self.events(messages)) < events and not task.done():
+                received.clear()
+                await asyncio.wait_for(received.wait(), 5)
+            disconnect.set()
+            await asyncio.wait_for(task, 5)
+            return messages
+
+        return asyncio.run(scenario())
+
+    @staticmethod
+    def run_action(action):
+        try:
+            action()
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def events(messages):
+        return [message['body'].decode() for message in messages
+                if message.get('body', b'').startswith(b'event:')]
+
+    @staticmethod
+    def parse(event):
+        name, data = event.strip().split('\n')
+        return name[len('event: '):], json.loads(data[len('data: '):])
+
+    def test_assign_and_close_events(self):
+        """Назначение и закрытие развоза приходят после фиксации"""
+        messages = self.stream(
+            1,
+            lambda: self.post('/api/v1/orders/assign/', {'courier_id': 1}),
+            *[lambda order_id=order_id: self.post(
+                '/api/v1/orders/complete/',
+                {'courier_id': 1, 'order_id': order_id,
+                 'complete_time': complete_time(10)})
+              for order_id in (1, 2)],
+            events=2)
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'),
+                      messages[0]['headers'])
+        (assign, data), (closed, closed_data) = map(
+            self.parse, self.events(messages))
+        self.assertEqual(assign, 'assign')
+        self.assertEqual(data['orders'], [1, 2])
+        self.assertEqual(closed, 'assign_closed')
+        self.assertEqual(closed_data['assign_id'], data['assign_id'])
+        self.assertEqual(broker.subscribers, {})
+
+    @override_settings(EVENTS_BACKEND='local')
+    def test_cancel_event_in_process(self):
+        """Без NOTIFY события доходят до подписчиков того же процесса"""
+        self.post('/api/v1/orders/assign/', {'courier_id': 1})
+        messages = self.stream(1, lambda: self.client.patch(
+            '/api/v1/couriers/1/', data=json.dumps({'regions': [4]}),
+            content_type='application/json'))
+        self.assertEqual([self.parse(event) for event in
+                          self.events(messages)],
+                         [('cancel', {'courier_id': 1, 'event': 'cancel',
+                                      'orders': [1]})])
+
+    def test_unknown_courier(self):
+        """Поток несуществующего курьера - 404"""
+        messages = self.stream(404)
+        self.assertEqual(messages[0]['status'], 404)
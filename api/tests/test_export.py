@@ -0,0 +1,108 @@
+import asyncio
+import csv
+import datetime
+import io
+import json
+
+from api.tests.fixtures.fixture_api import MixinAPI
+from api.utils.archive import archive_batch
+from asgiref.testing import ApplicationCommunicator
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from rest_framework import status
+
+
+class ExportData(MixinAPI):
+    def setUp(self):
+        MixinAPI.client.cookies.clear()
+        self.request_post_couriers({'data': [
+            {'courier_id': courier_id, 'courier_type': 'car',
+             'regions': [courier_id], 'working_hours': ['00:00-23:59']}
+            for courier_id in (1, 2)]})
+        self.request_post_orders({'data': [
+            {'order_id': order_id, 'weight': 2, 'region': order_id % 2 + 1,
+             'delivery_hours': ['00:00-23:59']}
+            for order_id in range(1, 5)]})
+        for courier_id in (1, 2):
+            self.request_post_orders_assign({'courier_id': courier_id})
+        self.now = datetime.datetime.now()
+        # Развоз курьера 2 закрывается и уходит в архив, у курьера 1
+        # остается открытым
+        for order_id in (1, 2, 4):
+            self.request_post_orders_complete({
+                'courier_id': order_id % 2 + 1, 'order_id': order_id,
+                'complete_time': (self.now + datetime.timedelta(
+                    minutes=order_id)).strftime(
+                    '%Y-%m-%dT%H:%M:%S.%f')[:-4] + 'Z'})
+        archive_batch()
+
+
+class ExportTests(ExportData, TestCase):
+    databases = '__all__'
+
+    def export(self, **params):
+        response = MixinAPI.client.get('/api/v1/export/orders/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_from_live_and_archive(self):
+        """Выгрузка берет выполненные заказы и из работы, и из архива"""
+        response, text = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(text)))
+        self.assertEqual(sorted(int(row['order_id']) for row in rows),
+                         [1, 2, 4])
+        row = next(row for row in rows if row['order_id'] == '1')
+        self.assertEqual((row['courier_id'], row['courier_type'],
+                          row['region']), ('2', 'car', '2'))
+
+    def test_ndjson_time_range(self):
+        """Фильтр по времени завершения"""
+        since = self.now + datetime.timedelta(seconds=90)
+        _, text = self.export(type='ndjson', since=since.isoformat())
+        rows = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual(sorted(row['order_id'] for row in rows), [2, 4])
+        self.assertEqual(rows[0]['weight'], '2.0000')
+
+    def test_command(self):
+        """Команда пишет ту же выгрузку в stdout"""
+        output = io.StringIO()
+        call_command('export_orders', '--format', 'ndjson',
+                     '--until', self.now.isoformat(), stdout=output)
+        self.assertEqual(output.getvalue(), '')
+        output = io.StringIO()
+        call_command('export_orders', stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 4)
+
+
+class ExportASGITests(ExportData, TransactionTestCase):
+    """Выгрузка через ASGI-приложение core.asgi"""
+    databases = '__all__'
+
+    @staticmethod
+    async def get(path, query_string):
+        from core.asgi import application
+
+        communicator = ApplicationCommunicator(application, {
+            'type': 'http', 'method': 'GET', 'path': path,
+            'query_string': query_string, 'headers': [],
+            'http_version': '1.1', 'server': ('testserver', 80)})
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(5)
+        body = b''
+        while True:
+            message = await communicator.receive_output(5)
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        await communicator.wait(5)
+        return start, body
+
+    def test_export_through_asgi(self):
+        """Строки выгрузки читаются из базы не в цикле событий"""
+        start, body = asyncio.run(self.get('/api/v1/export/orders/',
+                                           b'type=ndjson'))
+        self.assertEqual(start['status'], status.HTTP_200_OK)
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(sorted(row['order_id'] for row in rows), [1, 2, 4])
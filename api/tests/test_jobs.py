@@ -0,0 +1,120 @@
+import datetime
+
+from api.models import Courier, CourierStats, Job, Order
+from api.tests.fixtures.fixture_api import MixinAPI
+from api.utils.jobs import claim, enqueue, run_job, task
+from django.test import TestCase, override_settings
+from rest_framework import status
+
+
+@task('test_failing')
+def failing_task():
+    raise ValueError('failed')
+
+
+@override_settings(JOBS_EAGER=False)
+class TestJobQueue(TestCase):
+    databases = '__all__'
+
+    def test_claim_due_jobs(self):
+        """Берутся только задачи, время которых пришло"""
+        due = enqueue('test_failing')
+        later = enqueue('test_failing')
+        Job.objects.filter(pk=later.pk).update(
+            run_at=datetime.datetime.now() + datetime.timedelta(hours=1))
+        jobs = claim(10, 60)
+        self.assertEqual([job.pk for job in jobs], [due.pk])
+        job = Job.objects.get(pk=due.pk)
+        self.assertEqual((job.status, job.attempts), ('running', 1))
+        # Задача, взятая обработчиком, не выдается повторно
+        self.assertEqual(claim(10, 60), [])
+
+    def test_expired_lock_is_reclaimed(self):
+        """Задачу упавшего обработчика забирает другой"""
+        job = enqueue('test_failing')
+        claim(10, 60)
+        Job.objects.filter(pk=job.pk).update(
+            locked_until=datetime.datetime.now() - datetime.timedelta(
+                seconds=1))
+        jobs = claim(10, 60)
+        self.assertEqual([item.attempts for item in jobs], [2])
+        # Результат первого обработчика уже не записывается
+        stale = Job.objects.get(pk=job.pk)
+        stale.attempts = 1
+        run_job(stale)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'running')
+
+    def test_retry_and_fail(self):
+        """Упавшая задача повторяется, пока не кончатся попытки"""
+        job = enqueue('test_failing')
+        Job.objects.filter(pk=job.pk).update(max_attempts=2)
+        self.assertFalse(run_job(claim(10, 60)[0]))
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.status, 'queued')
+        self.assertIn('ValueError', job.last_error)
+        self.assertGreater(job.run_at, datetime.datetime.now())
+
+        Job.objects.filter(pk=job.pk).update(run_at=datetime.datetime.now())
+        self.assertFalse(run_job(claim(10, 60)[0]))
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIsNotNone(job.duration_ms)
+
+
+@override_settings(JOBS_EAGER=False)
+class TestCourierJobs(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        # Оба заказа в одном развозе: с шардом-заглушкой четные регионы
+        # лежат в default
+        self.request_post_couriers({'data': [
+            {'courier_id': 1, 'courier_type': 'car', 'regions': [4, 2],
+             'working_hours': ['00:00-23:59']}]})
+        self.request_post_orders({'data': [
+            {'order_id': 1, 'weight': 1, 'region': 4,
+             'delivery_hours': ['00:00-23:59']},
+            {'order_id': 2, 'weight': 1, 'region': 2,
+             'delivery_hours': ['00:00-23:59']}]})
+        self.request_post_orders_assign({'courier_id': 1})
+
+    def run_jobs(self):
+        while True:
+            jobs = claim(10, 60)
+            if not jobs:
+                return
+            for job in jobs:
+                self.assertTrue(run_job(job))
+
+    def test_patch_releases_orders_in_background(self):
+        """PATCH сохраняет профиль, а заказы снимает задача"""
+        response = self.request_patch_courier({'regions': [4]}, 1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Order.objects.get(pk=2).status, 'assigned')
+
+        self.run_jobs()
+        self.assertEqual(Order.objects.get(pk=2).status, 'new')
+        self.assertEqual(Order.objects.get(pk=1).status, 'assigned')
+        # Повторное выполнение ничего не меняет
+        released = Courier.objects.get(pk=1).release_unfit_orders()
+        self.assertEqual(released, [])
+
+    def test_complete_caches_stats(self):
+        """Рейтинг считает задача, GET берет его для текущей версии"""
+        self.request_post_orders_complete(
+            {'courier_id': 1, 'order_id': 1,
+             'complete_time': self.complete_time(10)})
+        self.assertEqual(Job.objects.filter(
+            name='recompute_courier_stats', status='queued').count(), 1)
+        self.run_jobs()
+        stats = CourierStats.objects.get(pk=1)
+        self.assertEqual(stats.version, Courier.objects.get(pk=1).version)
+
+        CourierStats.objects.filter(pk=1).update(rating=4.5)
+        response = self.request_get_couriers_detail(1)
+        self.assertEqual(response.json()['rating'], 4.5)
+
+        # Устаревшие значения не используются
+        self.request_patch_courier({'working_hours': ['00:00-23:58']}, 1)
+        response = self.request_get_couriers_detail(1)
+        self.assertNotEqual(response.json()['rating'], 4.5)
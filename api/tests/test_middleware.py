@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from api.middleware.profiling import make_profile_token
+from api.models import RequestProfile
+from api.tests.fixtures.fixture_api import MixinAPI
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+
+class ProfilingMiddlewareTests(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        self.request_post_couriers({'data': [
+            {
+                'courier_id': 3,
+                'courier_type': 'foot',
+                'regions': [2],
+                'working_hours': ['09:00-18:00']
+            }
+        ]})
+
+    def test_signed_header_enables_profiling(self):
+        """Запрос с подписанным X-Profile профилируется и сохраняется"""
+        response = self.request_post_orders_assign(
+            {'courier_id': 3}, HTTP_X_PROFILE=make_profile_token())
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.endpoint, 'POST OrdersView-assign')
+        self.assertEqual(profile.status_code, 200)
+        self.assertTrue(profile.stats)
+        self.assertIn('tottime', profile.stats[0])
+
+    def test_bad_signature_is_ignored(self):
+        """Заголовок с неверной подписью не включает профилирование"""
+        response = self.request_post_orders_assign(
+            {'courier_id': 3}, HTTP_X_PROFILE='profile:forged')
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampling_and_aggregation(self):
+        """Выборочные профили агрегируются командой profiles"""
+        self.request_get_couriers_detail(3)
+        self.request_get_couriers_detail(3)
+        out = StringIO()
+        call_command('profiles', '--aggregate', '--limit', '3', stdout=out)
+        self.assertIn('GET CouriersView-detail: 2 profiles', out.getvalue())
+
+
+class TracingMiddlewareTests(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        self.request_post_couriers({'data': [
+            {
+                'courier_id': 3,
+                'courier_type': 'foot',
+                'regions': [2],
+                'working_hours': ['09:00-18:00']
+            }
+        ]})
+        self.request_post_orders({'data': [
+            {
+                'order_id': 1,
+                'weight': 1,
+                'region': 2,
+                'delivery_hours': ['09:00-18:00']
+            }
+        ]})
+
+    def test_server_timing_for_assign(self):
+        """Фазы назначения заказов попадают в Server-Timing"""
+        response = self.request_post_orders_assign({'courier_id': 3})
+        phases = [item.split(';')[0]
+                  for item in response['Server-Timing'].split(', ')]
+        self.assertEqual(phases, ['rate_limit', 'concurrency_slot',
+                                  'courier_fetch', 'can_take_assign',
+                                  'candidate_query', 'interval_matching',
+                                  'order_writes', 'response_building',
+                                  'total'])
+
+    def test_export_otlp_json(self):
+        """Трасса выгружается в файл в формате OTLP/JSON"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traces.jsonl')
+            with override_settings(TRACING_EXPORT_PATH=path):
+                self.request_patch_courier({'regions': [3]}, 3)
+            with open(path) as file:
+                trace = json.loads(file.readline())
+        spans = trace['resourceSpans'][0]['scopeSpans'][0]['spans']
+        root = next(item for item in spans if item['name'] == 'total')
+        self.assertEqual(root['parentSpanId'], '')
+        self.assertIn('release_enqueue', [item['name'] for item in spans])
+        for item in spans:
+            self.assertEqual(item['traceId'], root['traceId'])
+            self.assertGreaterEqual(item['endTimeUnixNano'],
+                                    item['startTimeUnixNano'])
+            if item is not root:
+                self.assertEqual(item['parentSpanId'], root['spanId'])
+
+    @override_settings(TRACING_ENABLED=False)
+    def test_disabled(self):
+        """Без TRACING_ENABLED заголовок не добавляется"""
+        response = self.request_post_orders_assign({'courier_id': 3})
+        self.assertFalse(response.has_header('Server-Timing'))
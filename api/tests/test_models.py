@@ -1,10 +1,16 @@
-from api.models import Courier, Order
+from api.models import ArchivedOrder, Assign, Courier, Order
+from api.models.couriers import WEIGHT_SCALE
 from api.tests.fixtures.fixture_api import MixinAPI
+from api.utils import get_earning, get_rating
+from api.utils.archive import archive_batch
+from api.utils.shards import shard_for_region
 from django.test import TestCase
 from rest_framework import status
 
 
 class TestModelCouriers(TestCase, MixinAPI):
+    databases = '__all__'
+
     def test_smoke_test(self):
         """Проверка доступности основных узлов"""
         response = self.client.get('/')
@@ -118,6 +124,8 @@ class TestModelCouriers(TestCase, MixinAPI):
 
 
 class TestModelOrders(TestCase, MixinAPI):
+    databases = '__all__'
+
     def test_correct_value_weight(self):
         """Корректные значения weight сохраняются в модель"""
         weights = [0.01, 50, 49]
@@ -130,6 +138,16 @@ class TestModelOrders(TestCase, MixinAPI):
             weight_ = float(Order.objects.get(order_id=i).weight)
             self.assertIn(weight_, weights)
 
+    def test_weight_stored_in_units(self):
+        """Вес хранится целым числом без потери знаков после запятой"""
+        payload = {'data': [{'order_id': 1, 'weight': '0.2345', 'region': 2,
+                             'delivery_hours': ['11:30-14:00']}]}
+        response = self.request_post_orders(payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(pk=1)
+        self.assertEqual(order.weight_units, 2345)
+        self.assertEqual(str(order.weight), '0.2345')
+
     def test_incorrect_value_weight(self):
         """Некорректные значения weight не сохраняются в модель"""
         weights = [0, -50, 50.0001, 'foo', 0.00001, 1000, -1000, [], [1], None]
@@ -149,7 +167,8 @@ class TestModelOrders(TestCase, MixinAPI):
             payload['data'][0]['region'] = region
             response = self.request_post_orders(payload)
             self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-            region_ = Order.objects.get(order_id=i).region
+            region_ = Order.objects.using(shard_for_region(region)).get(
+                order_id=i).region
             self.assertIn(region_, regions)
 
     def test_incorrect_value_region(self):
@@ -202,3 +221,111 @@ class TestModelOrders(TestCase, MixinAPI):
         order.cancel_assign()
         self.assertIsNone(order.assign_courier)
         self.assertTrue(order.allow_to_assign)
+
+
+class TestArchive(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        # Развоз собирается из заказов одного шарда: с шардом-заглушкой
+        # четные регионы лежат в default
+        self.request_post_couriers({'data': [
+            {'courier_id': 1, 'courier_type': 'bike', 'regions': [2, 4],
+             'working_hours': ['00:00-23:59']}]})
+        self.request_post_orders({'data': [
+            {'order_id': i, 'weight': 1, 'region': region,
+             'delivery_hours': ['00:00-23:59']}
+            for i, region in ((1, 2), (2, 4), (3, 2))]})
+
+    def complete(self, order_id, minutes):
+        response = self.request_post_orders_complete(
+            {'courier_id': 1, 'order_id': order_id,
+             'complete_time': self.complete_time(minutes)})
+        self.assertEqual(response.status_code, 200)
+
+    def test_archive_keeps_rating_and_earning(self):
+        """Перенос в архив не меняет рейтинг и заработок курьера"""
+        self.request_post_orders_assign({'courier_id': 1})
+        self.complete(1, 10)
+        self.complete(2, 25)
+        self.complete(3, 30)
+        courier = Courier.objects.get(pk=1)
+        expected = (get_rating(courier), get_earning(courier))
+
+        self.assertEqual(archive_batch(), (1, 3))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Assign.objects.exists())
+        self.assertEqual(ArchivedOrder.objects.count(), 3)
+        self.assertEqual((get_rating(courier), get_earning(courier)),
+                         expected)
+
+    def test_open_assign_is_not_archived(self):
+        """Незавершенный развоз остается в рабочих таблицах"""
+        self.request_post_orders_assign({'courier_id': 1})
+        self.complete(1, 10)
+        self.assertEqual(archive_batch(), (0, 0))
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_archived_order_id_is_taken(self):
+        """id заказа из архива нельзя использовать повторно"""
+        self.request_post_orders_assign({'courier_id': 1})
+        for order_id in (1, 2, 3):
+            self.complete(order_id, 10 * order_id)
+        archive_batch()
+        response = self.request_post_orders({'data': [
+            {'order_id': 1, 'weight': 1, 'region': 2,
+             'delivery_hours': ['00:00-23:59']}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestOrderTransitions(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        self.request_post_couriers({'data': [
+            {'courier_id': 1, 'courier_type': 'foot', 'regions': [2],
+             'working_hours': ['00:00-23:59']}]})
+        self.request_post_orders({'data': [
+            {'order_id': 1, 'weight': 1, 'region': 2,
+             'delivery_hours': ['00:00-23:59']}]})
+
+    def test_concurrent_transitions(self):
+        """Из двух одновременных переходов выполняется только один"""
+        courier = Courier.objects.get(pk=1)
+        first = Order.objects.get(pk=1)
+        second = Order.objects.get(pk=1)
+        self.assertTrue(first.transition('assign', assign_courier=courier))
+        self.assertFalse(second.transition('assign', assign_courier=None))
+        order = Order.objects.get(pk=1)
+        self.assertEqual(order.status, 'assigned')
+        self.assertEqual(order.assign_courier, courier)
+
+    def test_transition_touches_only_changed_columns(self):
+        """Переход записывает только статус и переданные поля"""
+        order = Order.objects.get(pk=1)
+        Order.objects.filter(pk=1).update(weight_units=2 * WEIGHT_SCALE)
+        self.assertTrue(order.transition('assign', allow_to_assign=False))
+        self.assertEqual(Order.objects.get(pk=1).weight, 2)
+
+    def test_invalid_transition(self):
+        """Нельзя завершить или отменить неназначенный заказ"""
+        order = Order.objects.get(pk=1)
+        self.assertFalse(order.transition('complete', is_complete=True))
+        self.assertFalse(order.cancel_assign())
+        self.assertEqual(Order.objects.get(pk=1).status, 'new')
+
+    def test_complete_twice(self):
+        """Повторное завершение заказа успешно и ничего не меняет"""
+        self.request_post_orders_assign({'courier_id': 1})
+        payload = {'courier_id': 1, 'order_id': 1,
+                   'complete_time': self.complete_time(10)}
+        response = self.request_post_orders_complete(payload)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order = Order.objects.get(pk=1)
+        self.assertEqual(order.status, 'complete')
+        payload['complete_time'] = self.complete_time(20)
+        response = self.request_post_orders_complete(payload)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'order_id': 1})
+        self.assertEqual(Order.objects.get(pk=1).complete_time,
+                         order.complete_time)
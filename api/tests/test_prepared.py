@@ -0,0 +1,86 @@
+import datetime
+
+from api.models import Order
+from api.tests.fixtures.fixture_api import MixinAPI
+from api.utils.prepared import Statement
+from api.utils.shards import reset_region_map, shard_for_region
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework import status
+
+
+class StatementTests(SimpleTestCase):
+    def test_named_parameters(self):
+        """Повторный именованный параметр получает тот же номер"""
+        stmt = Statement('q', 'SELECT %(a)s, %(b)s, %(a)s, 5 %% 2')
+        self.assertTrue(stmt.name.startswith('q_'))
+        self.assertEqual(stmt.prepare_sql,
+                         f'PREPARE {stmt.name} AS SELECT $1, $2, $1, 5 % 2')
+        self.assertEqual(stmt.execute_sql,
+                         f'EXECUTE {stmt.name}(%(a)s, %(b)s)')
+        self.assertEqual(stmt.arguments({'a': 1, 'b': 2}), {'a': 1, 'b': 2})
+
+    def test_positional_parameters(self):
+        """Позиционные параметры нумеруются по порядку"""
+        stmt = Statement('q', 'SELECT %s, %s')
+        self.assertEqual(stmt.prepare_sql,
+                         f'PREPARE {stmt.name} AS SELECT $1, $2')
+        self.assertEqual(stmt.execute_sql, f'EXECUTE {stmt.name}(%s, %s)')
+        self.assertEqual(stmt.arguments((1, 2)), [1, 2])
+        self.assertEqual(Statement('q', 'SELECT 1').execute_sql,
+                         f'EXECUTE {Statement("q", "SELECT 1").name}')
+        self.assertNotEqual(stmt.name, Statement('q', 'SELECT %s').name)
+
+
+@override_settings(PREPARED_STATEMENTS=True)
+class PreparedStatementsTests(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        reset_region_map()
+        MixinAPI.client.cookies.clear()
+        self.request_post_couriers({'data': [
+            {'courier_id': 1, 'courier_type': 'bike', 'regions': [5],
+             'working_hours': ['00:00-23:59']}]})
+        self.request_post_orders({'data': [
+            {'order_id': order_id, 'weight': 1, 'region': 5,
+             'delivery_hours': ['00:00-23:59']} for order_id in (1, 2)]})
+
+    @staticmethod
+    def prepared():
+        # При шардах заказы и курьеры готовятся на разных соединениях
+        names = []
+        for alias in connections:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT name FROM pg_prepared_statements')
+                names.extend(name for name, in cursor.fetchall())
+        return names
+
+    def test_assign_and_complete(self):
+        """Назначение и завершение выполняются подготовленными операторами"""
+        response = self.request_post_orders_assign({'courier_id': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([order['id'] for order in response.data['orders']],
+                         [1, 2])
+        complete_time = datetime.datetime.now() + datetime.timedelta(
+            minutes=1)
+        response = self.request_post_orders_complete({
+            'courier_id': 1, 'order_id': 1,
+            'complete_time': complete_time.strftime(
+                '%Y-%m-%dT%H:%M:%S.%f')[:-4] + 'Z'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(Order.objects.using(shard_for_region(5)).get(
+            pk=1).is_complete)
+        names = self.prepared()
+        for name in ('courier_by_pk', 'assign_candidates', 'open_assign',
+                     'complete_order'):
+            self.assertTrue(any(item.startswith(name + '_')
+                                for item in names), name)
+        # Повторные запросы используют уже подготовленные операторы
+        self.request_post_orders_assign({'courier_id': 1})
+        self.assertEqual(sorted(self.prepared()), sorted(names))
+
+    def test_unknown_courier(self):
+        """Курьер, которого нет, по-прежнему дает 400"""
+        response = self.request_post_orders_assign({'courier_id': 2})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
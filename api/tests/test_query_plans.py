@@ -0,0 +1,276 @@
+import datetime
+import os
+import random
+from unittest import skipIf
+
+from api.models import (ArchivedAssign, ArchivedOrder, Assign, Courier,
+                        Order)
+from api.models.couriers import WEIGHT_SCALE
+from api.serializers import AssignSerializer, CourierSerializer
+from api.tests.fixtures.fixture_plans import (PlanRecorder, exceeds,
+                                              load_snapshot, save_snapshot,
+                                              summarize)
+from api.utils import get_earning, get_rating
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+COURIERS = 5000
+REGIONS = 1000
+NEW_ORDERS = 20000
+# Выполненные развозы в рабочих таблицах и в архиве, по ORDERS_PER_ASSIGN
+# заказов в каждом
+ASSIGNS = 5000
+ORDERS_PER_ASSIGN = 4
+# Открытые развозы других курьеров: назначенные заказы должны попасть
+# в статистику планировщика
+OPEN_ASSIGNS = 1000
+# Развозов курьера 1, по которому снимаются планы, в истории
+COURIER_ASSIGNS = 20
+TYPES = ('foot', 'bike', 'car')
+# ANALYZE читает до 300 * STATISTICS_TARGET строк таблицы, то есть
+# все строки синтетических данных
+STATISTICS_TARGET = 1000
+UPDATE_SNAPSHOTS = os.getenv('UPDATE_PLAN_SNAPSHOTS', 'False') == 'True'
+
+CANDIDATES_SQL = """
+INSERT INTO api_ordercandidate (courier_id, order_id)
+SELECT c.courier_id, o.order_id
+FROM api_courier c
+CROSS JOIN LATERAL unnest(c.regions) AS r(region)
+JOIN api_order o ON o.region = r.region::integer
+WHERE o.status = 'new' AND o.weight_units <= CASE c.courier_type
+    WHEN 'foot' THEN %(foot)s WHEN 'bike' THEN %(bike)s ELSE %(car)s END
+"""
+
+
+def history(rng, now, first_id, assign_ids, regions):
+    """
+    Выполненные заказы развозов assign_ids [(номер, курьер)] в регионах
+    курьеров regions: (номер развоза, поля заказа)
+    """
+    order_id = first_id
+    for assign_id, courier_id in assign_ids:
+        assign_time = now - datetime.timedelta(days=rng.randint(1, 60))
+        complete_time = assign_time
+        for _ in range(ORDERS_PER_ASSIGN):
+            complete_time += datetime.timedelta(minutes=rng.randint(5, 40))
+            yield assign_id, dict(
+                order_id=order_id, region=rng.choice(regions[courier_id]),
+                weight_units=rng.randint(1, 500) * WEIGHT_SCALE // 100,
+                delivery_hours=['00:00-23:59'], assign_courier_id=courier_id,
+                assign_time=assign_time, complete_time=complete_time)
+            order_id += 1
+
+
+def scan(node_type, relation, rows=10, **fields):
+    return {'Node Type': node_type, 'Relation Name': relation,
+            'Plan Rows': rows, 'Actual Rows': rows, 'Actual Loops': 1,
+            **fields}
+
+
+class PlanShapeTests(SimpleTestCase):
+    def test_small_table_scans_are_one_node(self):
+        """Чтение небольшой таблицы целиком и по индексу - одна форма"""
+        small = {'api_courier'}
+        seq = summarize('SELECT 1 FROM api_courier',
+                        scan('Seq Scan', 'api_courier'), small)
+        bitmap = summarize('SELECT 1 FROM api_courier', scan(
+            'Bitmap Heap Scan', 'api_courier', Plans=[{
+                'Node Type': 'Bitmap Index Scan', 'Plan Rows': 10,
+                'Index Name': 'courier_regions_idx'}]), small)
+        self.assertEqual(seq['shape'], ['Scan api_courier'])
+        self.assertEqual(bitmap['shape'], seq['shape'])
+
+    def test_large_table_seq_scan_kept(self):
+        """Последовательное чтение большой таблицы видно в форме и списке"""
+        plan = summarize('SELECT 1 FROM api_order', scan(
+            'Seq Scan', 'api_order', rows=20000), {'api_courier'})
+        self.assertEqual(plan['shape'], ['Seq Scan api_order'])
+        self.assertEqual(plan['seq_scans'], ['api_order (20000)'])
+        index = summarize('SELECT 1 FROM api_order', scan(
+            'Index Only Scan', 'api_order',
+            **{'Index Name': 'order_pool_idx'}), set())
+        self.assertNotEqual(index['shape'], plan['shape'])
+
+
+@skipIf(settings.DATABASE_SHARDS, 'планы снимаются без шардов')
+class QueryPlanTests(TestCase):
+    """
+    Планы горячих запросов назначения, завершения, рейтинга, заработка и
+    снятия заказов при изменении профиля на синтетических данных.
+    Сравниваются со снимками в api/tests/plans: форма плана должна
+    совпадать, буферы и оценка строк - не превышать снимок больше
+    допустимого. Последовательное чтение больших таблиц - ошибка всегда.
+    Снимки обновляются прогоном с UPDATE_PLAN_SNAPSHOTS=True.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Таблицы пересоздаются пустыми: строки, откаченные предыдущими
+        # тестами, остаются в страницах таблиц до очистки и меняют их
+        # размер, а с ним и выбор плана
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE {} RESTART IDENTITY'.format(', '.join(
+                connection.ops.quote_name(model._meta.db_table)
+                for model in apps.get_app_config('api').get_models(
+                    include_auto_created=True))))
+        rng = random.Random(1)
+        now = datetime.datetime.now()
+        # История курьера 1 - только в регионе 1: при снятии заказов
+        # профиль меняется с регионов 1, 2 на 1, 3
+        couriers = [Courier(courier_id=1, courier_type='car',
+                            regions=['1', '2'],
+                            working_hours=['00:00-23:59'])]
+        for courier_id in range(2, COURIERS + 1):
+            first = rng.randrange(REGIONS)
+            couriers.append(Courier(
+                courier_id=courier_id, courier_type=rng.choice(TYPES),
+                regions=[str((first + shift) % REGIONS + 1)
+                         for shift in range(rng.randint(1, 3))],
+                working_hours=['00:00-23:59']))
+        Courier.objects.bulk_create(couriers, batch_size=5000)
+        Order.objects.bulk_create([
+            Order(order_id=order_id,
+                  weight_units=rng.randint(1, 500) * WEIGHT_SCALE // 100,
+                  region=rng.randint(1, REGIONS),
+                  delivery_hours=['00:00-23:59'],
+                  pooled_at=now - datetime.timedelta(seconds=order_id))
+            for order_id in range(1, NEW_ORDERS + 1)], batch_size=5000)
+        regions = {courier.pk: [int(region) for region in courier.regions]
+                   for courier in couriers}
+        regions[1] = [1]
+        cls.create_history(rng, now, regions)
+        cls.create_open_assigns(rng, now, regions)
+        with connection.cursor() as cursor:
+            cursor.execute(CANDIDATES_SQL, {
+                courier_type: Courier.get_max_weight_units(courier_type)
+                for courier_type in TYPES})
+            # Статистика собирается по всем строкам, а не по случайной
+            # выборке, и не меняется от прогона к прогону
+            cursor.execute('SET LOCAL default_statistics_target = %s',
+                           [STATISTICS_TARGET])
+            cursor.execute('ANALYZE')
+            cursor.execute('SET LOCAL default_statistics_target = DEFAULT')
+
+    @classmethod
+    def create_history(cls, rng, now, regions):
+        owners = [1 if number < COURIER_ASSIGNS else rng.randint(2, COURIERS)
+                  for number in range(ASSIGNS)]
+        assigns = Assign.objects.bulk_create([
+            Assign(courier_id=courier_id, courier_type='car',
+                   is_complete=True) for courier_id in owners],
+            batch_size=5000)
+        orders, links = [], []
+        for assign_id, fields in history(
+                rng, now, NEW_ORDERS + 1,
+                [(assign.pk, assign.courier_id) for assign in assigns],
+                regions):
+            orders.append(Order(status='complete', is_complete=True,
+                                **fields))
+            links.append(Assign.orders.through(
+                assign_id=assign_id, order_id=fields['order_id']))
+        Order.objects.bulk_create(orders, batch_size=5000)
+        Assign.orders.through.objects.bulk_create(links, batch_size=5000)
+        ArchivedAssign.objects.bulk_create([
+            ArchivedAssign(assign_id=assign_id, courier_id=courier_id,
+                           courier_type='bike', assign_time=now)
+            for assign_id, courier_id in enumerate(owners, 1)],
+            batch_size=5000)
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(assign_id=assign_id, **fields)
+            for assign_id, fields in history(
+                rng, now, NEW_ORDERS + len(orders) + 1,
+                enumerate(owners, 1), regions)], batch_size=5000)
+
+    @classmethod
+    def create_open_assigns(cls, rng, now, regions):
+        owners = rng.sample(range(2, COURIERS + 1), OPEN_ASSIGNS)
+        assigns = Assign.objects.bulk_create([
+            Assign(courier_id=courier_id, courier_type='bike')
+            for courier_id in owners], batch_size=5000)
+        orders, links = [], []
+        order_id = NEW_ORDERS + 2 * ASSIGNS * ORDERS_PER_ASSIGN + 1
+        for assign in assigns:
+            for _ in range(ORDERS_PER_ASSIGN):
+                orders.append(Order(
+                    order_id=order_id, status='assigned',
+                    region=rng.choice(regions[assign.courier_id]),
+                    weight_units=rng.randint(1, 500) * WEIGHT_SCALE // 100,
+                    delivery_hours=['00:00-23:59'],
+                    assign_courier_id=assign.courier_id,
+                    assign_time=now - datetime.timedelta(hours=1)))
+                links.append(Assign.orders.through(assign_id=assign.pk,
+                                                   order_id=order_id))
+                order_id += 1
+        Order.objects.bulk_create(orders, batch_size=5000)
+        Assign.orders.through.objects.bulk_create(links, batch_size=5000)
+
+    def assign(self):
+        serializer = AssignSerializer(data={'courier_id': 1})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def check_plans(self, name, recorder):
+        plans = recorder.plans
+        self.assertTrue(plans)
+        if UPDATE_SNAPSHOTS:
+            save_snapshot(name, plans)
+        for plan in plans:
+            self.assertEqual(plan['seq_scans'], [], plan['query'])
+        snapshot = load_snapshot(name)
+        self.assertIsNotNone(snapshot, f'нет снимка {name}, запустите '
+                                       f'с UPDATE_PLAN_SNAPSHOTS=True')
+        self.assertEqual([plan['query'] for plan in plans],
+                         [plan['query'] for plan in snapshot])
+        for plan, expected in zip(plans, snapshot):
+            with self.subTest(query=plan['query']):
+                self.assertEqual(plan['shape'], expected['shape'])
+                self.assertFalse(
+                    exceeds(plan['buffers'], expected['buffers']),
+                    f'буферов {plan["buffers"]}, в снимке '
+                    f'{expected["buffers"]}')
+                self.assertFalse(
+                    exceeds(plan['rows'], expected['rows']),
+                    f'оценка строк {plan["rows"]}, в снимке '
+                    f'{expected["rows"]}')
+
+    def test_assign(self):
+        """Назначение развоза AssignSerializer"""
+        with PlanRecorder().record() as recorder:
+            assign = self.assign()
+        self.assertTrue(assign.orders.exists())
+        self.check_plans('assign', recorder)
+
+    def test_complete(self):
+        """Завершение заказа одним запросом"""
+        order = self.assign().orders.first()
+        with PlanRecorder().record() as recorder:
+            completed = Order.complete(
+                order.pk, 1,
+                datetime.datetime.now() + datetime.timedelta(minutes=1))
+        self.assertEqual(completed['order_id'], order.pk)
+        self.check_plans('complete', recorder)
+
+    def test_rating_and_earning(self):
+        """Рейтинг и заработок по истории в рабочих таблицах и архиве"""
+        courier = Courier.objects.get(pk=1)
+        with PlanRecorder().record() as recorder:
+            get_rating(courier)
+            earning = get_earning(courier)
+        # Развозы на машине в рабочей таблице и на велосипеде в архиве
+        self.assertEqual(earning, COURIER_ASSIGNS * 500 * (9 + 5))
+        self.check_plans('rating_earning', recorder)
+
+    def test_release(self):
+        """Изменение профиля и снятие заказов check_change_*"""
+        assign = self.assign()
+        courier = Courier.objects.get(pk=1)
+        serializer = CourierSerializer(courier, data={'regions': [1, 3]},
+                                       partial=True)
+        serializer.is_valid(raise_exception=True)
+        with PlanRecorder().record() as recorder:
+            serializer.save()
+        self.assertFalse(assign.orders.filter(region=2).exists())
+        self.check_plans('release', recorder)
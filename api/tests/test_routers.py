@@ -0,0 +1,133 @@
+from unittest import skipUnless
+
+from api.middleware.replica import PIN_COOKIE, ReplicaPinMiddleware
+from api.models import Assign, Courier, Order
+from api.routers import ReplicaRouter, ShardRouter, pin_to_primary
+from api.tests.fixtures.fixture_api import MixinAPI
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], REPLICA_ROUTING=True)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def read_db_in_request(self, request):
+        """Возвращает базу, выбранную для чтения во время запроса"""
+        chosen = []
+
+        def get_response(request):
+            chosen.append(self.router.db_for_read(Courier))
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(get_response)(request)
+        return chosen[0], response
+
+    def test_read_goes_to_replica(self):
+        """Чтение направляется на реплику, запись - в основную базу"""
+        self.assertEqual(self.router.db_for_read(Courier), 'replica_0')
+        self.assertIsNone(self.router.db_for_write(Courier))
+
+    def test_pinned_read_goes_to_primary(self):
+        """Внутри pin_to_primary чтение идет в основную базу"""
+        with pin_to_primary():
+            self.assertIsNone(self.router.db_for_read(Courier))
+        self.assertEqual(self.router.db_for_read(Courier), 'replica_0')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        """Без реплик маршрутизатор не вмешивается"""
+        self.assertIsNone(self.router.db_for_read(Courier))
+
+    @override_settings(REPLICA_ROUTING=False)
+    def test_routing_disabled(self):
+        """С REPLICA_ROUTING=False чтение идет в основную базу"""
+        self.assertIsNone(self.router.db_for_read(Courier))
+
+    def test_no_migrations_on_replica(self):
+        """Миграции не применяются к репликам"""
+        self.assertFalse(self.router.allow_migrate('replica_0', 'api'))
+        self.assertIsNone(self.router.allow_migrate('default', 'api'))
+
+    def test_write_request_pins_client(self):
+        """После записи клиент некоторое время читает из основной базы"""
+        db, response = self.read_db_in_request(
+            self.factory.post('/api/v1/orders/assign/'))
+        self.assertIsNone(db)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        request = self.factory.get('/api/v1/couriers/1/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        db, _ = self.read_db_in_request(request)
+        self.assertIsNone(db)
+
+        db, response = self.read_db_in_request(
+            self.factory.get('/api/v1/couriers/1/'))
+        self.assertEqual(db, 'replica_0')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard_1'])
+class ShardRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ShardRouter()
+        self.order = Order(order_id=1, region=1)
+        self.order._state.db = 'shard_1'
+
+    def test_related_objects_follow_instance(self):
+        """Развозы заказа читаются из его шарда, курьер - из default"""
+        self.assertEqual(
+            self.router.db_for_read(Assign, instance=self.order), 'shard_1')
+        self.assertEqual(
+            self.router.db_for_write(Courier, instance=self.order),
+            'default')
+        self.assertIsNone(self.router.db_for_read(Order))
+
+    def test_relations_between_shards(self):
+        """Заказ и развоз из разных шардов связать нельзя"""
+        assign = Assign()
+        assign._state.db = 'default'
+        self.assertFalse(self.router.allow_relation(self.order, assign))
+        self.assertTrue(self.router.allow_relation(self.order, Courier()))
+
+    @override_settings(DATABASE_SHARDS=[])
+    def test_without_shards(self):
+        self.assertIsNone(
+            self.router.db_for_read(Assign, instance=self.order))
+
+
+@skipUnless(settings.DATABASE_REPLICAS,
+            'нужна реплика, например POSTGRES_REPLICA_HOSTS=localhost')
+@override_settings(REPLICA_ROUTING=True)
+class ReplicaRoutingIntegrationTests(TransactionTestCase, MixinAPI):
+    """Запускается с отдельной репликой или псевдонимом той же базы"""
+    databases = '__all__'
+
+    def test_profile_read_from_replica(self):
+        """GET профиля курьера читает реплику, если клиент не писал"""
+        MixinAPI.client.cookies.clear()
+        self.request_post_couriers({'data': [
+            {
+                'courier_id': 3,
+                'courier_type': 'foot',
+                'regions': [2],
+                'working_hours': ['09:00-18:00']
+            }
+        ]})
+        replica = connections[settings.DATABASE_REPLICAS[0]]
+        with CaptureQueriesContext(replica) as queries:
+            response = self.request_get_couriers_detail(3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+        MixinAPI.client.cookies.clear()
+        with CaptureQueriesContext(replica) as queries:
+            response = self.request_get_couriers_detail(3)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(queries), 0)
@@ -0,0 +1,100 @@
+from unittest import skipUnless
+
+from api.models import Assign, Courier, Order
+from api.tests.fixtures.fixture_api import MixinAPI
+from api.utils import get_earning, get_rating
+from api.utils.dispatch import dispatch_tick
+from api.utils.shards import reset_region_map, shard_for_region
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework import status
+
+
+@skipUnless(len(settings.DATABASE_SHARDS) > 1,
+            'нужен второй шард, например POSTGRES_SHARDS=candy_shard')
+class TestShards(TestCase, MixinAPI):
+    """
+    Запускается с шардами: POSTGRES_SHARDS=candy_shard python3 manage.py
+    test api.tests.test_shards. Регион 1 лежит в shard_1, регион 2 - в
+    default.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        reset_region_map()
+        MixinAPI.client.cookies.clear()
+        self.request_post_couriers({'data': [
+            {'courier_id': 1, 'courier_type': 'foot', 'regions': [1, 2],
+             'working_hours': ['00:00-23:59']}]})
+        self.request_post_orders({'data': [
+            {'order_id': 1, 'weight': 1, 'region': 1,
+             'delivery_hours': ['00:00-23:59']},
+            {'order_id': 2, 'weight': 1, 'region': 2,
+             'delivery_hours': ['00:00-23:59']}]})
+
+    def complete(self, order_id, minutes):
+        return self.request_post_orders_complete(
+            {'courier_id': 1, 'order_id': order_id,
+             'complete_time': self.complete_time(minutes)})
+
+    def test_orders_stored_by_region(self):
+        """Заказ записывается в шард своего региона"""
+        self.assertEqual(shard_for_region(1), 'shard_1')
+        self.assertTrue(Order.objects.using('shard_1').filter(pk=1).exists())
+        self.assertTrue(Order.objects.using('default').filter(pk=2).exists())
+        self.assertFalse(Order.objects.using('default').filter(pk=1).exists())
+
+    def test_order_id_unique_across_shards(self):
+        """Номер заказа из другого шарда занят"""
+        response = self.request_post_orders({'data': [
+            {'order_id': 1, 'weight': 1, 'region': 2,
+             'delivery_hours': ['00:00-23:59']}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_courier_spanning_shards(self):
+        """Развозы собираются по шардам, рейтинг и заработок - по всем"""
+        response = self.request_post_orders_assign({'courier_id': 1})
+        self.assertEqual(response.data['orders'], [{'id': 1}])
+        self.assertTrue(Assign.objects.using('shard_1').exists())
+        # Пока развоз в shard_1 открыт, новый не назначается
+        response = self.request_post_orders_assign({'courier_id': 1})
+        self.assertEqual(response.data['orders'], [{'id': 1}])
+
+        version = Courier.objects.get(pk=1).version
+        self.assertEqual(self.complete(1, 10).status_code, 200)
+        self.assertEqual(Courier.objects.get(pk=1).version, version + 1)
+
+        response = self.request_post_orders_assign({'courier_id': 1})
+        self.assertEqual(response.data['orders'], [{'id': 2}])
+        self.assertEqual(self.complete(2, 30).status_code, 200)
+
+        courier = Courier.objects.get(pk=1)
+        self.assertEqual(get_earning(courier), 2 * 500 * 2)
+        self.assertGreater(get_rating(courier), 0)
+
+    def test_patch_releases_orders_in_other_shard(self):
+        """Смена регионов снимает заказы из любого шарда"""
+        self.request_post_orders_assign({'courier_id': 1})
+        self.request_patch_courier({'regions': [2]}, 1)
+        self.assertEqual(Order.objects.using('shard_1').get(pk=1).status,
+                         'new')
+        self.assertFalse(Assign.objects.using('shard_1').filter(
+            is_complete=False).exists())
+
+    def test_dispatch_per_shard(self):
+        """Диспетчер назначает курьеру заказы одного шарда за развоз"""
+        self.assertEqual(dispatch_tick(using='shard_1'), 1)
+        self.assertEqual(dispatch_tick(using='default'), 0)
+        self.assertEqual(Order.objects.using('default').get(pk=2).status,
+                         'new')
+
+    def test_rebalance_moves_pending_orders(self):
+        """Перенос региона перемещает его свободные заказы"""
+        call_command('rebalance_shards', '--move', '1=default',
+                     '--no-wait', stdout=open('/dev/null', 'w'))
+        self.assertEqual(shard_for_region(1), 'default')
+        self.assertFalse(Order.objects.using('shard_1').exists())
+        self.assertEqual(Order.objects.using('default').count(), 2)
+        response = self.request_post_orders_assign({'courier_id': 1})
+        self.assertEqual(response.data['orders'], [{'id': 1}, {'id': 2}])
@@ -0,0 +1,80 @@
+import datetime
+import random
+
+from api.models import DeliverySketch
+from api.tests.fixtures.fixture_api import MixinAPI
+from api.utils.sketch import RELATIVE_ACCURACY, DDSketch
+from django.test import SimpleTestCase, TestCase
+from rest_framework import status
+
+
+class DDSketchTests(SimpleTestCase):
+    def test_relative_accuracy(self):
+        """Квантили отличаются от точных не больше чем на 1%"""
+        values = sorted(random.Random(1).lognormvariate(7, 1)
+                        for _ in range(10000))
+        sketch = DDSketch()
+        for value in values:
+            sketch.add(value)
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q) / exact, 1,
+                                   delta=RELATIVE_ACCURACY)
+
+    def test_merge(self):
+        """Слитые наброски равны наброску по всем значениям"""
+        left, right, total = DDSketch(), DDSketch(), DDSketch()
+        for value in range(1, 500):
+            (left if value % 3 else right).add(value)
+            total.add(value)
+        left.merge(right)
+        self.assertEqual(left.bins, total.bins)
+        self.assertEqual(left.count, total.count)
+
+
+class RegionStatsTests(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        MixinAPI.client.cookies.clear()
+        self.request_post_couriers({'data': [
+            {'courier_id': 1, 'courier_type': 'bike', 'regions': [5, 6],
+             'working_hours': ['00:00-23:59']}]})
+        self.request_post_orders({'data': [
+            {'order_id': order_id, 'weight': 1, 'region': 5,
+             'delivery_hours': ['00:00-23:59']} for order_id in (1, 2)]})
+        self.request_post_orders_assign({'courier_id': 1})
+        assign_time = datetime.datetime.now()
+        for order_id, minutes in ((1, 10), (2, 30)):
+            complete_time = assign_time + datetime.timedelta(
+                minutes=minutes)
+            self.request_post_orders_complete({
+                'courier_id': 1, 'order_id': order_id,
+                'complete_time': complete_time.strftime(
+                    '%Y-%m-%dT%H:%M:%S.%f')[:-4] + 'Z'})
+
+    def test_region_quantiles(self):
+        """Квантили времени доставки считаются по наброскам"""
+        sketch = DDSketch(DeliverySketch.objects.get().bins)
+        self.assertEqual(sketch.count, 2)
+        # Первый заказ доставлен за 10 минут, второй - за 20 после первого
+        self.assertAlmostEqual(sketch.quantile(0) / 600, 1,
+                               delta=RELATIVE_ACCURACY)
+        self.assertAlmostEqual(sketch.quantile(1) / 1200, 1,
+                               delta=RELATIVE_ACCURACY)
+        response = MixinAPI.client.get('/api/v1/stats/regions/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['hours'], 24)
+        row, = response.data['regions']
+        self.assertEqual((row['region'], row['courier_type'], row['count']),
+                         (5, 'bike', 2))
+        self.assertAlmostEqual(row['p50'] / 600, 1, delta=RELATIVE_ACCURACY)
+
+    def test_filters(self):
+        """Отбор по региону и проверка окна"""
+        response = MixinAPI.client.get('/api/v1/stats/regions/',
+                                       {'region': 6})
+        self.assertEqual(response.data['regions'], [])
+        response = MixinAPI.client.get('/api/v1/stats/regions/',
+                                       {'hours': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
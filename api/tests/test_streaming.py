@@ -0,0 +1,100 @@
+import gzip
+import json
+
+from api.middleware.compression import brotli, negotiate
+from api.utils.streaming import item_errors, json_list_chunks
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from rest_framework import status
+
+
+class StreamingHelpersTests(SimpleTestCase):
+    def test_json_list_chunks(self):
+        """Куски складываются в JSON с вложенным списком"""
+        chunks = list(json_list_chunks(('a', 'b'), range(5), chunk_size=2))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(''.join(chunks)),
+                         {'a': {'b': [0, 1, 2, 3, 4]}})
+        self.assertEqual(''.join(json_list_chunks(('a',), [])), '{"a":[]}')
+
+    def test_item_errors(self):
+        """Ошибки элементов собираются по мере отдачи и считаются заранее"""
+        errors, count = item_errors(
+            [{'order_id': 1}, {'order_id': 2}, 'bad'],
+            [{}, {'weight': ['required']}, {'non_field_errors': ['x']}],
+            'order_id')
+        self.assertEqual(count, 2)
+        self.assertEqual(list(errors), [
+            {'id': 2, 'weight': ['required']},
+            {'id': None, 'non_field_errors': ['x']}])
+        with self.assertRaises(TypeError):
+            item_errors({}, {'non_field_errors': ['x']}, 'order_id')
+
+    def test_negotiate(self):
+        """Кодировка выбирается по Accept-Encoding с учетом q"""
+        best = 'br' if brotli is not None else 'gzip'
+        self.assertEqual(negotiate('gzip, deflate'), 'gzip')
+        self.assertEqual(negotiate('GZIP;q=0.5, br'), best)
+        self.assertEqual(negotiate('*'), best)
+        self.assertIsNone(negotiate('gzip;q=0, deflate'))
+        self.assertIsNone(negotiate(''))
+
+
+@override_settings(STREAMING_MIN_ITEMS=3)
+class StreamingResponseTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = Client()
+
+    def post_orders(self, weights, start=1, **headers):
+        payload = {'data': [
+            {'order_id': order_id, 'weight': weight, 'region': 1,
+             'delivery_hours': ['10:00-12:00']}
+            for order_id, weight in enumerate(weights, start)]}
+        return self.client.post('/api/v1/orders/', data=json.dumps(payload),
+                                content_type='application/json', **headers)
+
+    def test_large_import_streamed(self):
+        """Ответ на загрузку от STREAMING_MIN_ITEMS заказов идет потоком"""
+        response = self.post_orders([1] * 5)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)),
+                         {'orders': [{'id': order_id}
+                                     for order_id in range(1, 6)]})
+
+    def test_small_import_not_streamed(self):
+        """Короткий ответ остается обычным Response"""
+        response = self.post_orders([1, 2])
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.data, {'orders': [{'id': 1}, {'id': 2}]})
+
+    def test_validation_errors_streamed(self):
+        """Ошибки валидации большой загрузки тоже идут потоком"""
+        response = self.post_orders([1, 0, 0, 0, 0])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(response.streaming)
+        errors = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([item['id'] for item in
+                          errors['validation_error']['orders']], [2, 3, 4, 5])
+
+    def test_stream_compressed(self):
+        """Потоковый ответ сжимается gzip по Accept-Encoding"""
+        response = self.post_orders([1] * 5, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(len(json.loads(body)['orders']), 5)
+
+    @override_settings(COMPRESSION_MIN_SIZE=10)
+    def test_small_body_threshold(self):
+        """Обычный ответ сжимается от COMPRESSION_MIN_SIZE байт"""
+        response = self.post_orders([1], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        with self.settings(COMPRESSION_MIN_SIZE=0,
+                           STREAMING_MIN_ITEMS=100):
+            response = self.post_orders([1] * 20, start=2,
+                                        HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(
+            response.content))['orders']), 20)
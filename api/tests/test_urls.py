@@ -3,6 +3,8 @@ from django.test import TestCase
 
 
 class URLTests(TestCase, MixinAPI):
+    databases = '__all__'
+
     def setUp(self) -> None:
         self.courier = {'data': [
             {
@@ -1,13 +1,20 @@
 import datetime
+import hashlib
+import json
+from unittest import mock, skipIf
 
-from api.models import Assign, Courier, Order
+from api.models import Assign, Courier, IdempotencyKey, Order
+from api.serializers import OrderListSerializer
 from api.tests.fixtures.fixture_api import MixinAPI
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from rest_framework import status
 
 
 class TestAPICouriers(TestCase, MixinAPI):
+    databases = '__all__'
+
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -884,6 +891,8 @@ class TestAPICouriers(TestCase, MixinAPI):
 
 
 class TestAPIOrders(TestCase, MixinAPI):
+    databases = '__all__'
+
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -1038,6 +1047,37 @@ class TestAPIOrders(TestCase, MixinAPI):
         response = self.request_post_orders(incorrect_payload)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_post_orders_existing_ids_checked_in_bulk(self):
+        """
+        Занятые номера заказов проверяются одним запросом к заказам и
+        одним к архиву, сколько бы заказов ни было в запросе
+        """
+        self.request_post_orders(TestAPIOrders.orders_1_2_test)
+        payload = {'data': [
+            {'order_id': order_id, 'weight': 1, 'region': 12,
+             'delivery_hours': ['09:00-18:00']}
+            for order_id in range(2, 52)]}
+        serializer = OrderListSerializer(data=payload)
+        with self.assertNumQueries(2):
+            self.assertFalse(serializer.is_valid())
+        errors = serializer.errors['data']
+        self.assertIn('order_id', errors[0])
+        self.assertEqual(errors[1:], [{}] * 49)
+        response = self.request_post_orders(payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [item['id'] for item in response.data['validation_error'][
+                'orders']], [2])
+
+    def test_post_orders_existing_id_as_string(self):
+        """Занятый номер, переданный строкой, тоже дает 400"""
+        self.request_post_orders(TestAPIOrders.orders_1_2_test)
+        response = self.request_post_orders({'data': [
+            {'order_id': '2', 'weight': 1, 'region': 12,
+             'delivery_hours': ['09:00-18:00']}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 2)
+
     def test_post_orders_assign_incorrect_courier_id(self):
         """
         Проверка неверного запроса на назначение заказов (плохой courier_id).
@@ -1286,6 +1326,55 @@ class TestAPIOrders(TestCase, MixinAPI):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['orders'], [{'id': 2}, {'id': 1}])
 
+    def test_assign_without_fitting_orders_creates_no_assign(self):
+        """
+        Курьер без подходящих заказов не получает пустой развоз и может
+        получить заказы, когда они появятся
+        """
+        self.request_post_couriers({'data': [
+            {'courier_id': 3, 'courier_type': 'foot', 'regions': [22],
+             'working_hours': ['09:00-10:00']}]})
+        self.request_post_orders({'data': [
+            {'order_id': 1, 'weight': 1, 'region': 22,
+             'delivery_hours': ['18:00-19:00']}]})
+        response = self.request_post_orders_assign({'courier_id': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'orders': []})
+        self.assertFalse(Assign.objects.filter(courier_id=3).exists())
+        self.request_post_orders({'data': [
+            {'order_id': 2, 'weight': 1, 'region': 22,
+             'delivery_hours': ['09:30-10:30']}]})
+        response = self.request_post_orders_assign({'courier_id': 3})
+        self.assertEqual(response.data['orders'], [{'id': 2}])
+
+    def test_assign_lost_race_creates_no_assign(self):
+        """
+        Если все заказы развоза назначены другим запросом раньше, пустой
+        развоз не остается
+        """
+        self.request_post_couriers({'data': [
+            {'courier_id': 3, 'courier_type': 'foot', 'regions': [22],
+             'working_hours': ['09:00-10:00']}]})
+        self.request_post_orders({'data': [
+            {'order_id': 1, 'weight': 1, 'region': 22,
+             'delivery_hours': ['09:00-10:00']}]})
+        original = Order.transition
+
+        def lose(order, name, **fields):
+            # Диспетчер назначает заказ между выборкой и переходом
+            if name == 'assign':
+                Order.objects.filter(pk=order.pk).update(status='assigned')
+            return original(order, name, **fields)
+
+        with mock.patch.object(Order, 'transition', lose):
+            response = self.request_post_orders_assign({'courier_id': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'orders': []})
+        self.assertFalse(Assign.objects.filter(courier_id=3).exists())
+        Order.objects.filter(pk=1).update(status='new')
+        response = self.request_post_orders_assign({'courier_id': 3})
+        self.assertEqual(response.data['orders'], [{'id': 1}])
+
     def test_assign_to_courier_with_non_complete_assign(self):
         """Нельзя назначить новый развоз, если курьер не завершил предыдущий"""
         # Создаем группу заказов
@@ -1519,3 +1608,279 @@ class TestAPIOrders(TestCase, MixinAPI):
 
             response = self.request_post_orders_complete({})
             self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestAPIIdempotency(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        self.request_post_couriers({'data': [
+            {
+                'courier_id': 3,
+                'courier_type': 'foot',
+                'regions': [2],
+                'working_hours': ['09:00-18:00']
+            }
+        ]})
+        self.request_post_orders({'data': [
+            {
+                'order_id': 1,
+                'weight': 0.23,
+                'region': 2,
+                'delivery_hours': ['09:00-18:00']
+            }
+        ]})
+
+    def test_assign_retry_replays_response(self):
+        """Повтор назначения с тем же ключом не создает новый развоз"""
+        first = self.request_post_orders_assign(
+            {'courier_id': 3}, HTTP_IDEMPOTENCY_KEY='assign-1')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        retry = self.request_post_orders_assign(
+            {'courier_id': 3}, HTTP_IDEMPOTENCY_KEY='assign-1')
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Assign.objects.filter(courier_id=3).count(), 1)
+
+    def test_key_reused_with_other_body(self):
+        """Ключ, использованный с другим телом запроса, отклоняется"""
+        self.request_post_orders_assign(
+            {'courier_id': 3}, HTTP_IDEMPOTENCY_KEY='assign-2')
+        response = self.request_post_orders_assign(
+            {'courier_id': 4}, HTTP_IDEMPOTENCY_KEY='assign-2')
+        self.assertEqual(response.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_complete_retry_replays_response(self):
+        """Повтор завершения с тем же ключом возвращает первый ответ"""
+        self.request_post_orders_assign({'courier_id': 3})
+        payload = {'courier_id': 3, 'order_id': 1,
+                   'complete_time': self.complete_time(10)}
+        first = self.request_post_orders_complete(
+            payload, HTTP_IDEMPOTENCY_KEY='complete-1')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        retry = self.request_post_orders_complete(
+            payload, HTTP_IDEMPOTENCY_KEY='complete-1')
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.json(), {'order_id': 1})
+
+    def pending_key(self, key, seconds):
+        return IdempotencyKey.objects.create(
+            key=key, path='/api/v1/orders/assign/',
+            request_hash=hashlib.sha256(
+                json.dumps({'courier_id': 3}).encode()).hexdigest(),
+            expires_at=datetime.datetime.now() + datetime.timedelta(
+                seconds=seconds))
+
+    def test_key_in_progress(self):
+        """Пока первый запрос с ключом выполняется, повтор получает 409"""
+        self.pending_key('assign-3', 60)
+        response = self.request_post_orders_assign(
+            {'courier_id': 3}, HTTP_IDEMPOTENCY_KEY='assign-3')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Assign.objects.exists())
+
+    def test_abandoned_key_is_reserved_again(self):
+        """Бронь, брошенная упавшим запросом, после срока занимается"""
+        self.pending_key('assign-4', -1)
+        response = self.request_post_orders_assign(
+            {'courier_id': 3}, HTTP_IDEMPOTENCY_KEY='assign-4')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stored = IdempotencyKey.objects.get(key='assign-4')
+        self.assertEqual(stored.status_code, status.HTTP_200_OK)
+
+    def test_stored_response_not_overwritten(self):
+        """Ответ первого запроса не заменяется ответом повтора"""
+        self.request_post_orders_assign(
+            {'courier_id': 3}, HTTP_IDEMPOTENCY_KEY='assign-5')
+        stored = IdempotencyKey.objects.get(key='assign-5')
+        self.request_post_orders_assign(
+            {'courier_id': 3}, HTTP_IDEMPOTENCY_KEY='assign-5')
+        self.assertEqual(IdempotencyKey.objects.get(key='assign-5').response,
+                         stored.response)
+
+
+class TestAPICourierETag(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        self.request_post_couriers({'data': [
+            {
+                'courier_id': 3,
+                'courier_type': 'foot',
+                'regions': [2],
+                'working_hours': ['09:00-18:00']
+            }
+        ]})
+
+    def test_not_modified(self):
+        """Неизмененный профиль курьера отдается как 304"""
+        response = self.request_get_couriers_detail(3)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.request_get_couriers_detail(
+                3, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_after_write(self):
+        """PATCH и назначение заказов меняют ETag курьера"""
+        etag = self.request_get_couriers_detail(3)['ETag']
+        self.request_patch_courier({'regions': [2, 3]}, 3)
+        response = self.request_get_couriers_detail(
+            3, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        self.request_post_orders({'data': [
+            {
+                'order_id': 1,
+                'weight': 1,
+                'region': 2,
+                'delivery_hours': ['09:00-18:00']
+            }
+        ]})
+        self.request_post_orders_assign({'courier_id': 3})
+        response = self.request_get_couriers_detail(
+            3, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_unknown_courier(self):
+        """Несуществующий курьер с If-None-Match возвращает 404"""
+        response = self.request_get_couriers_detail(
+            404, HTTP_IF_NONE_MATCH='"404-1"')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestAPIOrderComplete(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        self.request_post_couriers({'data': [
+            {
+                'courier_id': 3,
+                'courier_type': 'foot',
+                'regions': [2],
+                'working_hours': ['09:00-18:00']
+            }
+        ]})
+        self.request_post_orders({'data': [
+            {
+                'order_id': i,
+                'weight': 1,
+                'region': 2,
+                'delivery_hours': ['09:00-18:00']
+            } for i in (1, 2)
+        ]})
+        self.request_post_orders_assign({'courier_id': 3})
+
+    def complete(self, order_id, courier_id=3, minutes=10):
+        return self.request_post_orders_complete(
+            {'courier_id': courier_id, 'order_id': order_id,
+             'complete_time': self.complete_time(minutes)})
+
+    @skipIf(settings.DATABASE_SHARDS, 'с шардами курьер меняется отдельно')
+    @override_settings(JOBS_EAGER=False)
+    def test_complete_in_one_query(self):
+        """Завершение заказа и постановка задачи - один запрос к базе"""
+        with self.assertNumQueries(1):
+            response = self.complete(1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'order_id': 1})
+        order = Order.objects.get(pk=1)
+        self.assertTrue(order.is_complete)
+        self.assertEqual(order.status, 'complete')
+
+    def test_last_order_closes_assign(self):
+        """Развоз закрывается после завершения последнего заказа"""
+        assign = Assign.objects.get(courier_id=3)
+        self.complete(1)
+        assign.refresh_from_db()
+        self.assertFalse(assign.is_complete)
+        self.complete(2, minutes=20)
+        assign.refresh_from_db()
+        self.assertTrue(assign.is_complete)
+
+    def test_complete_foreign_order(self):
+        """Нельзя завершить заказ другого курьера или раньше выдачи"""
+        self.assertEqual(self.complete(1, courier_id=4).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.complete(1, minutes=-10).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.get(pk=1).is_complete)
+
+    def test_complete_repeated(self):
+        """Повторное завершение выполненного заказа - тот же ответ 200"""
+        self.assertEqual(self.complete(1).status_code, status.HTTP_200_OK)
+        version = Courier.objects.get(pk=3).version
+        response = self.complete(1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'order_id': 1})
+        self.assertEqual(Courier.objects.get(pk=3).version, version)
+        self.assertEqual(self.complete(1, courier_id=4).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_complete_changes_etag(self):
+        """Завершение заказа меняет версию профиля курьера"""
+        version = Courier.objects.get(pk=3).version
+        self.complete(1)
+        self.assertEqual(Courier.objects.get(pk=3).version, version + 1)
+
+
+class TestAPICouriersBulkUpdate(TestCase, MixinAPI):
+    databases = '__all__'
+
+    def setUp(self):
+        MixinAPI.client.cookies.clear()
+        self.request_post_couriers({'data': [
+            {'courier_id': courier_id, 'courier_type': 'car',
+             'regions': [courier_id], 'working_hours': ['09:00-18:00']}
+            for courier_id in (1, 2, 3)]})
+        self.request_post_orders({'data': [
+            {'order_id': order_id, 'weight': 8, 'region': order_id % 3 + 1,
+             'delivery_hours': ['09:00-18:00']} for order_id in range(1, 7)]})
+        for courier_id in (1, 2, 3):
+            self.request_post_orders_assign({'courier_id': courier_id})
+
+    def test_release_report(self):
+        """Снятые заказы возвращаются отчетом по каждому курьеру"""
+        versions = dict(Courier.objects.values_list('pk', 'version'))
+        response = self.request_patch_couriers({'data': [
+            {'courier_id': 1, 'courier_type': 'foot'},
+            {'courier_id': 2, 'regions': [5]},
+            {'courier_id': 3, 'working_hours': ['10:00-12:00']},
+        ]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = {item['id']: item for item in response.data['couriers']}
+        # Пешему курьеру остается один заказ весом 8 из двух
+        self.assertEqual(len(report[1]['released_orders']), 1)
+        self.assertIsNone(report[1]['assign_closed'])
+        # Все заказы сняты, пустой развоз закрыт
+        self.assertEqual(sorted(report[2]['released_orders']), [1, 4])
+        self.assertIsNotNone(report[2]['assign_closed'])
+        self.assertEqual(report[3]['released_orders'], [])
+        courier = Courier.objects.get(pk=1)
+        self.assertEqual((courier.courier_type, courier.allowed_orders_weight),
+                         ('foot', 2))
+        self.assertEqual(Courier.objects.get(pk=2).regions, ['5'])
+        self.assertEqual(Order.objects.filter(status='new').count(), 3)
+        for courier_id, version in versions.items():
+            self.assertGreater(Courier.objects.get(pk=courier_id).version,
+                               version)
+
+    def test_invalid_update_changes_nothing(self):
+        """Ошибка в любом элементе отклоняет весь запрос"""
+        response = self.request_patch_couriers({'data': [
+            {'courier_id': 1, 'courier_type': 'foot'},
+            {'courier_id': 2, 'courier_type': 'plane'},
+            {'courier_id': 9, 'regions': [1]},
+            {'courier_id': 1, 'regions': [1]},
+        ]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data['validation_error']['couriers']
+        self.assertEqual(sorted(item['id'] for item in errors), [1, 2, 9])
+        self.assertEqual(Courier.objects.get(pk=1).courier_type, 'car')
+        self.assertEqual(Order.objects.filter(status='new').count(), 0)
@@ -1,12 +1,28 @@
 from django.urls import include, path
-from rest_framework.routers import DefaultRouter
+from rest_framework.routers import DefaultRouter, Route
 
-from api.views import CouriersViewSet, OrdersViewSet
+from api.views import (CouriersViewSet, ExportViewSet, OrdersViewSet,
+                       StatsViewSet, metrics_view)
 
-router = DefaultRouter()
+
+class Router(DefaultRouter):
+    """PATCH на адрес списка - изменение многих объектов сразу"""
+    routes = [
+        route._replace(mapping={**route.mapping,
+                                'patch': 'bulk_partial_update'})
+        if isinstance(route, Route) and route.mapping.get('get') == 'list'
+        else route
+        for route in DefaultRouter.routes
+    ]
+
+
+router = Router()
 router.register('couriers', CouriersViewSet, basename='CouriersView')
 router.register('orders', OrdersViewSet, basename='OrdersView')
+router.register('stats', StatsViewSet, basename='StatsView')
+router.register('export', ExportViewSet, basename='ExportView')
 
 urlpatterns = [
     path('v1/', include(router.urls)),
+    path('v1/metrics/', metrics_view, name='metrics'),
 ]
@@ -1,2 +1,3 @@
-from .courier import get_earning, get_rating
+from .courier import get_courier_stats, get_earning, get_rating, rating
 from .interval import Interval
+from .idempotency import idempotent
@@ -0,0 +1,174 @@
+import contextlib
+import functools
+import math
+import time
+
+from api.models import RateBucket
+from api.utils import metrics
+from api.utils.locks import ADMISSION_LOCK
+from api.utils.tracing import span
+from django.conf import settings
+from django.db import connections, router
+from rest_framework import status
+from rest_framework.response import Response
+
+TAKE_TOKEN_SQL = """
+INSERT INTO api_ratebucket AS bucket (key, tokens, updated_at)
+VALUES (%(key)s, %(burst)s - 1, LOCALTIMESTAMP)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = LEAST(%(burst)s, bucket.tokens + %(rate)s * EXTRACT(
+        EPOCH FROM LOCALTIMESTAMP - bucket.updated_at)) - 1,
+    updated_at = LOCALTIMESTAMP
+WHERE LEAST(%(burst)s, bucket.tokens + %(rate)s * EXTRACT(
+    EPOCH FROM LOCALTIMESTAMP - bucket.updated_at)) >= 1
+RETURNING tokens
+"""
+
+BUCKET_TOKENS_SQL = """
+SELECT LEAST(%(burst)s, tokens + %(rate)s * EXTRACT(
+    EPOCH FROM LOCALTIMESTAMP - updated_at))
+FROM api_ratebucket WHERE key = %(key)s
+"""
+
+ACQUIRE_SLOT_SQL = """
+SELECT slot FROM generate_series(0, %s - 1) AS slot
+WHERE pg_try_advisory_lock(%s, slot) LIMIT 1
+"""
+
+RELEASE_SLOT_SQL = 'SELECT pg_advisory_unlock(%s, %s)'
+
+SLOTS_IN_USE_SQL = """
+SELECT count(*) FROM pg_locks
+WHERE locktype = 'advisory' AND classid = %s AND objsubid = 2 AND granted
+"""
+
+POLL_INTERVAL = 0.02
+
+admission_requests = metrics.counter(
+    'admission_requests_total',
+    'Запросы, прошедшие контроль допуска (admitted) и отклоненные с 429')
+admission_waiting = metrics.gauge(
+    'admission_waiting', 'Запросы процесса, ожидающие свободный слот')
+admission_wait = metrics.histogram(
+    'admission_wait_seconds', 'Время ожидания свободного слота',
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+admission_limit = metrics.gauge(
+    'admission_limit', 'Настроенные пределы контроля допуска')
+admission_slots = metrics.gauge(
+    'admission_slots_in_use', 'Занятые слоты во всех процессах')
+
+
+def _connection():
+    return connections[router.db_for_write(RateBucket)]
+
+
+def take_token(key):
+    """
+    Списывает токен из корзины key. Возвращает None, если токен был, иначе
+    через сколько секунд он появится.
+    """
+    rate = settings.ADMISSION_RATE
+    params = {'key': key, 'rate': rate, 'burst': settings.ADMISSION_BURST}
+    with _connection().cursor() as cursor:
+        cursor.execute(TAKE_TOKEN_SQL, params)
+        if cursor.fetchone() is not None:
+            return None
+        cursor.execute(BUCKET_TOKENS_SQL, params)
+        row = cursor.fetchone()
+    tokens = row[0] if row else 0
+    return max(1, math.ceil((1 - tokens) / rate))
+
+
+@contextlib.contextmanager
+def concurrency_slot(endpoint):
+    """
+    Занимает один из ADMISSION_CONCURRENCY слотов, общих для всех процессов,
+    на время запроса. Если свободного слота нет ADMISSION_WAIT секунд,
+    отдает False. Слоты - сессионные advisory-блокировки: при обрыве
+    соединения PostgreSQL освобождает их сам.
+    """
+    limit = settings.ADMISSION_CONCURRENCY
+    if not limit:
+        yield True
+        return
+    connection = _connection()
+    start = time.perf_counter()
+    deadline = start + settings.ADMISSION_WAIT
+    admission_waiting.inc(endpoint=endpoint)
+    try:
+        with span('concurrency_slot'):
+            while True:
+                with connection.cursor() as cursor:
+                    cursor.execute(ACQUIRE_SLOT_SQL, [limit, ADMISSION_LOCK])
+                    row = cursor.fetchone()
+                if row is not None or time.perf_counter() >= deadline:
+                    break
+                time.sleep(POLL_INTERVAL)
+    finally:
+        admission_waiting.dec(endpoint=endpoint)
+        admission_wait.observe(time.perf_counter() - start,
+                               endpoint=endpoint)
+    if row is None:
+        yield False
+        return
+    slot = row[0]
+    try:
+        yield True
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(RELEASE_SLOT_SQL, [ADMISSION_LOCK, slot])
+
+
+def too_many_requests(endpoint, reason, retry_after):
+    admission_requests.inc(endpoint=endpoint, result=reason)
+    response = Response({'validation_error': 'too many requests'},
+                        status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def admission(endpoint, key=None):
+    """
+    Контроль допуска для тяжелых запросов: key(request) выбирает корзину
+    токенов клиента (None - без ограничения частоты), кроме того число
+    одновременных запросов ограничено ADMISSION_CONCURRENCY на все
+    процессы. Отказ - 429 с заголовком Retry-After.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            retry_after = None
+            bucket = key(request) if key and settings.ADMISSION_RATE \
+                else None
+            if bucket is not None:
+                with span('rate_limit'):
+                    retry_after = take_token(f'{endpoint}:{bucket}')
+            if retry_after is not None:
+                return too_many_requests(endpoint, 'rate_limited',
+                                         retry_after)
+            with concurrency_slot(endpoint) as admitted:
+                if not admitted:
+                    return too_many_requests(endpoint, 'overloaded', 1)
+                admission_requests.inc(endpoint=endpoint, result='admitted')
+                return view_method(self, request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def courier_key(request):
+    """Корзина курьера из тела запроса, для неверного номера - None"""
+    courier_id = request.data.get('courier_id') \
+        if isinstance(request.data, dict) else None
+    if isinstance(courier_id, int) and not isinstance(courier_id, bool):
+        return f'courier:{courier_id}'
+    return None
+
+
+def update_gauges():
+    """Пределы из настроек и занятые слоты по данным PostgreSQL"""
+    admission_limit.set(settings.ADMISSION_RATE, limit='rate')
+    admission_limit.set(settings.ADMISSION_BURST, limit='burst')
+    admission_limit.set(settings.ADMISSION_CONCURRENCY, limit='concurrency')
+    with _connection().cursor() as cursor:
+        cursor.execute(SLOTS_IN_USE_SQL, [ADMISSION_LOCK])
+        admission_slots.set(cursor.fetchone()[0])
@@ -0,0 +1,42 @@
+import datetime
+from typing import Tuple
+
+from api.models import ArchivedAssign, ArchivedOrder, Assign, Order
+from django.db import transaction
+
+ORDER_FIELDS = ('order_id', 'weight_units', 'region', 'delivery_hours',
+                'assign_courier_id', 'assign_time', 'complete_time')
+
+
+def archive_batch(batch_size: int = 1000,
+                  older_than: datetime.datetime = None,
+                  using: str = None) -> Tuple[int, int]:
+    """
+    Переносит пачку завершенных развозов и их заказов в таблицы истории
+    того же шарда using. Возвращает количество перенесенных развозов
+    и заказов.
+    """
+    with transaction.atomic(using=using):
+        assigns = Assign.objects.using(using).select_for_update(
+            skip_locked=True).filter(is_complete=True).order_by('pk')
+        if older_than is not None:
+            assigns = assigns.filter(assign_time__lt=older_than)
+        assigns = list(assigns[:batch_size])
+        if not assigns:
+            return 0, 0
+        assign_ids = [assign.pk for assign in assigns]
+        orders = list(Order.objects.using(using).filter(
+            assigns__in=assign_ids).values(*ORDER_FIELDS, 'assigns'))
+        ArchivedAssign.objects.using(using).bulk_create([
+            ArchivedAssign(assign_id=assign.pk,
+                           courier_id=assign.courier_id,
+                           courier_type=assign.courier_type,
+                           assign_time=assign.assign_time)
+            for assign in assigns])
+        ArchivedOrder.objects.using(using).bulk_create([
+            ArchivedOrder(assign_id=order.pop('assigns'), **order)
+            for order in orders])
+        Order.objects.using(using).filter(
+            pk__in=[order['order_id'] for order in orders]).delete()
+        Assign.objects.using(using).filter(pk__in=assign_ids).delete()
+    return len(assigns), len(orders)
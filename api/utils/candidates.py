@@ -0,0 +1,104 @@
+from collections import defaultdict
+
+from api.models import Courier, Order, OrderCandidate
+from api.models.orders import StatusChoices
+from api.utils.interval import Interval
+from api.utils.shards import group_by_shard, shard_aliases
+from rest_framework.exceptions import ValidationError
+
+
+def candidate_pairs(couriers, orders) -> set:
+    """
+    Пары (курьер, заказ), в которых курьер работает в регионе заказа,
+    его рабочие часы пересекаются с часами доставки, а вес заказа не
+    больше максимального для типа курьера
+    """
+    by_region = defaultdict(list)
+    for courier in couriers:
+        try:
+            hours = Interval.convert_str_to_time(courier.working_hours)
+            regions = {int(region) for region in courier.regions}
+        except (ValueError, ValidationError):
+            # Профиль, записанный в обход проверок, кандидатов не дает
+            continue
+        capacity = courier.get_max_weight_units(courier.courier_type)
+        for region in regions:
+            by_region[region].append((courier.pk, hours, capacity))
+    pairs = set()
+    for order in orders:
+        delivery = Interval.convert_str_to_time(order.delivery_hours)
+        for courier_id, hours, capacity in by_region[int(order.region)]:
+            if order.weight_units <= capacity and any(
+                    Interval.is_intervals_intersection(period, working)
+                    for period in delivery for working in hours):
+                pairs.add((courier_id, order.pk))
+    return pairs
+
+
+def add_orders(orders, using=None) -> int:
+    """Записывает кандидатов для заказов, попавших в пул базы using"""
+    orders = list(orders)
+    if not orders:
+        return 0
+    couriers = Courier.objects.filter(regions__overlap=list(
+        {str(order.region) for order in orders}))
+    candidates = [OrderCandidate(courier_id=courier_id, order_id=order_id)
+                  for courier_id, order_id in candidate_pairs(couriers,
+                                                              orders)]
+    OrderCandidate.objects.using(using).bulk_create(candidates,
+                                                    ignore_conflicts=True)
+    return len(candidates)
+
+
+def remove_orders(order_ids, using=None) -> None:
+    """Удаляет кандидатов заказов, покинувших пул базы using"""
+    OrderCandidate.objects.using(using).filter(
+        order_id__in=list(order_ids)).delete()
+
+
+def refresh_couriers(couriers) -> None:
+    """
+    Пересобирает кандидатов новых курьеров или курьеров, у которых
+    изменились регионы, рабочие часы или тип
+    """
+    couriers = list(couriers)
+    if not couriers:
+        return
+    regions = {int(region) for courier in couriers
+               for region in courier.regions}
+    shards = group_by_shard(regions, key=int)
+    for alias in shard_aliases():
+        OrderCandidate.objects.using(alias).filter(
+            courier_id__in=[courier.pk for courier in couriers]).delete()
+        if alias not in shards:
+            continue
+        orders = Order.objects.using(alias).filter(
+            status=StatusChoices.new, region__in=shards[alias])
+        OrderCandidate.objects.using(alias).bulk_create([
+            OrderCandidate(courier_id=courier_id, order_id=order_id)
+            for courier_id, order_id in candidate_pairs(couriers, orders)])
+
+
+def check_candidates(using=None, fix=False) -> dict:
+    """
+    Сравнивает таблицу кандидатов базы using с посчитанной заново по
+    всем курьерам и свободным заказам. С fix приводит таблицу к
+    посчитанной. Возвращает число недостающих и лишних пар.
+    """
+    orders = Order.objects.using(using).filter(status=StatusChoices.new)
+    expected = candidate_pairs(Courier.objects.all(), orders)
+    actual = set(OrderCandidate.objects.using(using).values_list(
+        'courier_id', 'order_id'))
+    missing = expected - actual
+    extra = actual - expected
+    if fix:
+        stale = defaultdict(list)
+        for courier_id, order_id in extra:
+            stale[courier_id].append(order_id)
+        for courier_id, order_ids in stale.items():
+            OrderCandidate.objects.using(using).filter(
+                courier_id=courier_id, order_id__in=order_ids).delete()
+        OrderCandidate.objects.using(using).bulk_create(
+            [OrderCandidate(courier_id=courier_id, order_id=order_id)
+             for courier_id, order_id in missing], ignore_conflicts=True)
+    return {'missing': len(missing), 'extra': len(extra)}
@@ -1,19 +1,42 @@
-from api.models import Assign, Courier, Order
+import heapq
+import itertools
+from operator import itemgetter
+from typing import Tuple
+
+from api.models import (ArchivedAssign, ArchivedOrder, Assign, Courier,
+                        CourierStats, Order)
+from api.utils.shards import shard_aliases
 
 
 def get_rating(courier: Courier) -> float:
-    regions_times = {int(region): [] for region in courier.regions}
-    orders = Order.objects.filter(
-        assign_courier=courier,
-        is_complete=True).order_by('complete_time')
+    # Выполненные заказы лежат и в рабочей таблице, и в архиве
+    fields = ('region', 'assign_time', 'complete_time')
+    # Историю из всех шардов сливаем по времени завершения
+    orders = heapq.merge(*(
+        Order.objects.using(alias).filter(
+            assign_courier=courier,
+            is_complete=True).values_list(*fields).union(
+            ArchivedOrder.objects.using(alias).filter(
+                assign_courier=courier).values_list(*fields),
+            all=True).order_by('complete_time')
+        for alias in shard_aliases()), key=itemgetter(2))
+    return rating(courier.regions, orders)
+
+
+def rating(regions, orders) -> float:
+    """
+    Рейтинг по выполненным заказам (region, assign_time, complete_time),
+    упорядоченным по времени завершения
+    """
+    regions_times = {int(region): [] for region in regions}
     prev_complete = None
-    for order in orders:
+    for region, assign_time, complete_time in orders:
         if prev_complete is None:
-            time_delivery = order.complete_time - order.assign_time
+            time_delivery = complete_time - assign_time
         else:
-            time_delivery = order.complete_time - prev_complete
-        prev_complete = order.complete_time
-        regions_times[order.region].append(time_delivery.seconds)
+            time_delivery = complete_time - prev_complete
+        prev_complete = complete_time
+        regions_times[region].append(time_delivery.seconds)
     average_times = []
     for region, values in regions_times.items():
         if values:
@@ -25,8 +48,28 @@ def get_rating(courier: Courier) -> float:
 
 def get_earning(courier: Courier) -> int:
     coefficient = {'foot': 2, 'bike': 5, 'car': 9}
-    assigns = Assign.objects.filter(is_complete=True,
-                                    courier_id=courier.courier_id)
+    assigns = itertools.chain.from_iterable(
+        Assign.objects.using(alias).filter(
+            is_complete=True,
+            courier_id=courier.courier_id).values_list('courier_type').union(
+            ArchivedAssign.objects.using(alias).filter(
+                courier_id=courier.courier_id).values_list('courier_type'),
+            all=True)
+        for alias in shard_aliases())
     total = sum(
-        map(lambda assign: 500 * coefficient[assign.courier_type], assigns))
+        map(lambda assign: 500 * coefficient[assign[0]], assigns))
     return int(total)
+
+
+def get_courier_stats(courier: Courier) -> Tuple[float, int]:
+    """
+    Рейтинг и заработок курьера. Берутся из CourierStats, если их посчитали
+    для текущей версии профиля, иначе считаются по истории заказов.
+    """
+    try:
+        stats = courier.stats
+    except CourierStats.DoesNotExist:
+        stats = None
+    if stats is not None and stats.version == courier.version:
+        return stats.rating, stats.earning
+    return get_rating(courier), get_earning(courier)
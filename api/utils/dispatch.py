@@ -0,0 +1,199 @@
+import datetime
+import time
+
+from api.models import Assign, Courier, Order
+from api.models.orders import StatusChoices
+from api.routers import pin_to_primary
+from api.utils import metrics
+from api.utils.candidates import remove_orders
+from api.utils.events import publish_many
+from api.utils.locks import try_lock_couriers
+from api.utils.shards import shard_aliases
+from django.db import transaction
+from django.db.models import F, IntegerField, Q, Value
+from django.db.models.functions import Mod
+
+dispatched_orders = metrics.counter(
+    'dispatch_orders_total', 'Заказы, назначенные диспетчером')
+dispatch_throughput = metrics.gauge(
+    'dispatch_orders_per_second', 'Скорость назначения за последний такт')
+queue_wait = metrics.histogram(
+    'dispatch_queue_wait_seconds',
+    'Время от появления заказа в пуле до назначения',
+    buckets=(1, 5, 15, 30, 60, 300, 900, 1800, 3600, 4 * 3600))
+tick_duration = metrics.histogram(
+    'dispatch_tick_seconds', 'Длительность такта диспетчера')
+
+
+def region_shard(region, shards) -> int:
+    """Номер части, которой принадлежит регион, при делении на shards"""
+    return int(region) % shards
+
+
+def pending_orders(batch_size, shard=None, after=None, using=None):
+    """
+    Свободные заказы базы using в порядке появления в пуле, кроме занятых
+    другими. shard - пара (номер, число частей): только заказы регионов
+    этой части, after - последний заказ предыдущей страницы.
+    """
+    orders = Order.objects.using(using).select_for_update(
+        skip_locked=True).filter(status=StatusChoices.new)
+    if shard is not None:
+        index, shards = shard
+        orders = orders.annotate(region_shard=Mod(
+            'region', Value(shards, output_field=IntegerField()))).filter(
+            region_shard=index)
+    if after is not None:
+        orders = orders.filter(
+            Q(pooled_at__gt=after.pooled_at)
+            | Q(pooled_at=after.pooled_at, pk__gt=after.pk))
+    return list(orders.order_by('pooled_at', 'pk')[:batch_size])
+
+
+def idle_couriers(regions, batch_size):
+    """
+    Курьеры без открытого развоза, работающие в одном из регионов.
+    Курьер из нескольких частей достается тому процессу, который первым
+    взял его блокировку, остальные пропускают его до следующего такта.
+    """
+    candidates = list(Courier.objects.filter(
+        regions__overlap=[str(region) for region in regions],
+    ).order_by('pk').values_list('pk', flat=True))
+    busy = busy_couriers(candidates)
+    locked = try_lock_couriers(
+        [pk for pk in candidates if pk not in busy][:batch_size])
+    # Проверяем еще раз под блокировкой: пока ее держал другой процесс,
+    # он мог открыть курьеру развоз
+    busy = busy_couriers(locked)
+    return list(Courier.objects.filter(
+        pk__in=[pk for pk in locked if pk not in busy]).order_by('pk'))
+
+
+def busy_couriers(courier_ids) -> set:
+    """Курьеры с незавершенным развозом в любом из шардов"""
+    if not courier_ids:
+        return set()
+    return {courier_id for alias in shard_aliases()
+            for courier_id in Assign.objects.using(alias).filter(
+                courier_id__in=courier_ids,
+                is_complete=False).values_list('courier_id', flat=True)}
+
+
+def match(couriers, orders):
+    """
+    Распределяет заказы между курьерами по тем же правилам, что и
+    POST /orders/assign. Возвращает пары (курьер, заказы).
+    """
+    pool = list(orders)
+    matches = []
+    for courier in couriers:
+        courier.update_allowed_weight()
+        regions = set(courier.regions)
+        candidates = [order for order in pool
+                      if str(order.region) in regions
+                      and order.weight_units <= courier.allowed_weight_units]
+        selected = courier.select_orders(candidates)
+        if not selected:
+            continue
+        taken = {order.pk for order in selected}
+        pool = [order for order in pool if order.pk not in taken]
+        matches.append((courier, selected))
+        if not pool:
+            break
+    return matches
+
+
+def write_assigns(matches, now, using=None):
+    """Записывает назначения пачкой: развозы, заказы, версии курьеров"""
+    assigns = Assign.objects.using(using).bulk_create([
+        Assign(courier=courier, courier_type=courier.courier_type)
+        for courier, _ in matches])
+    links = []
+    orders = []
+    for assign, (courier, selected) in zip(assigns, matches):
+        for order in selected:
+            order.status = StatusChoices.assigned
+            order.assign_courier = courier
+            order.assign_time = now
+            order.allow_to_assign = False
+            courier.allowed_weight_units -= order.weight_units
+            links.append(Assign.orders.through(assign_id=assign.pk,
+                                               order_id=order.pk))
+            orders.append(order)
+    # Строки заказов заблокированы в этой транзакции, поэтому статус
+    # не мог измениться после выборки
+    Order.objects.using(using).bulk_update(
+        orders, ['status', 'assign_courier', 'assign_time',
+                 'allow_to_assign'])
+    Assign.orders.through.objects.using(using).bulk_create(links)
+    remove_orders([order.pk for order in orders], using=using)
+    couriers = [courier for courier, _ in matches]
+    Courier.objects.bulk_update(couriers, ['allowed_weight_units'])
+    Courier.objects.filter(pk__in=[courier.pk for courier in couriers]).update(
+        version=F('version') + 1)
+    publish_many([{'courier_id': courier.pk, 'event': 'assign',
+                   'assign_id': assign.pk,
+                   'orders': [order.pk for order in selected]}
+                  for assign, (courier, selected) in zip(assigns, matches)])
+    return orders
+
+
+def dispatch_pages(now, order_batch, courier_batch, shard, using,
+                   max_pages, after):
+    """
+    Назначает заказы страницами пула, начиная после заказа after.
+    Возвращает назначенные заказы и заказ, после которого продолжать
+    следующий такт, или None - со старых заказов.
+    """
+    dispatched = []
+    for _ in range(max_pages):
+        orders = pending_orders(order_batch, shard, after=after, using=using)
+        if not orders:
+            # Пул просмотрен до конца
+            return dispatched, None
+        after = orders[-1]
+        couriers = idle_couriers({order.region for order in orders},
+                                 courier_batch)
+        matches = match(couriers, orders) if couriers else []
+        # Страница без свободных курьеров или подходящих пар: дальше
+        # держать блокировки заказов и курьеров до конца такта незачем
+        if not matches:
+            return dispatched, after
+        dispatched += write_assigns(matches, now, using)
+        if len(dispatched) >= order_batch:
+            return dispatched, None
+    return dispatched, after
+
+
+def dispatch_tick(order_batch=500, courier_batch=1000, shard=None,
+                  using=None, max_pages=10, cursor=None) -> int:
+    """
+    Один такт диспетчера: назначает до order_batch свободных заказов
+    базы using свободным курьерам. Пул просматривается страницами от
+    старых заказов к новым, пока пачка не наберется, но не больше
+    max_pages страниц. Такт заканчивается на странице, для которой нет
+    свободных курьеров или подходящих пар. cursor - словарь, в котором
+    такт запоминает, где остановился: следующий такт с тем же словарем
+    продолжит после этой страницы, поэтому заказы, которые некому
+    доставить, не задерживают остальные. Заказы и курьеры, которые
+    обрабатывает другой процесс или запрос, пропускаются.
+    Возвращает число назначенных заказов.
+    """
+    start = time.perf_counter()
+    now = datetime.datetime.now()
+    # Блокировки курьеров берутся в default, заказы - в своем шарде
+    with pin_to_primary(), transaction.atomic(), \
+            transaction.atomic(using=using):
+        dispatched, after = dispatch_pages(
+            now, order_batch, courier_batch, shard, using, max_pages,
+            cursor.get('after') if cursor is not None else None)
+    if cursor is not None:
+        cursor['after'] = after
+    for order in dispatched:
+        queue_wait.observe((now - order.pooled_at).total_seconds())
+    duration = time.perf_counter() - start
+    labels = {'shard': shard[0]} if shard is not None else {}
+    dispatched_orders.inc(len(dispatched), **labels)
+    dispatch_throughput.set(len(dispatched) / duration, **labels)
+    tick_duration.observe(duration, **labels)
+    return len(dispatched)
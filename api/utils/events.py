@@ -0,0 +1,180 @@
+import asyncio
+import functools
+import json
+import logging
+from collections import defaultdict
+
+import psycopg2
+from api.utils import metrics
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'courier_events'
+# NOTIFY принимает не больше 8000 байт
+MAX_PAYLOAD = 7900
+RECONNECT_DELAY = 1
+
+NOTIFY_SQL = """
+SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload
+"""
+
+subscribers_gauge = metrics.gauge(
+    'events_subscribers', 'Открытые потоки событий курьеров')
+delivered_events = metrics.counter(
+    'events_delivered_total', 'События, отправленные подписчикам')
+dropped_subscribers = metrics.counter(
+    'events_dropped_total', 'Потоки, закрытые из-за переполнения очереди')
+
+
+def publish(courier_id, event, **data):
+    """
+    Событие для курьера: assign, cancel или assign_closed. Подписчики
+    получают его только после фиксации текущей транзакции default.
+    При EVENTS_BACKEND='notify' событие рассылается через NOTIFY всем
+    процессам, при 'local' - только подписчикам этого процесса.
+    """
+    publish_many([{'courier_id': courier_id, 'event': event, **data}])
+
+
+def publish_many(events):
+    """Несколько событий одним запросом к базе"""
+    payloads = []
+    for event in events:
+        payload = json.dumps(event)
+        if len(payload) > MAX_PAYLOAD:
+            # Длинный список заказов клиент перечитает сам
+            payload = json.dumps({'courier_id': event['courier_id'],
+                                  'event': event['event'],
+                                  'truncated': True})
+        payloads.append(payload)
+    if not payloads:
+        return
+    if settings.EVENTS_BACKEND == 'notify':
+        with connections['default'].cursor() as cursor:
+            cursor.execute(NOTIFY_SQL, [CHANNEL, payloads])
+        return
+    for payload in payloads:
+        transaction.on_commit(functools.partial(broker.publish, payload))
+
+
+class Broker:
+    """
+    Подписчики процесса: курьер -> очереди его открытых потоков. Работает
+    в цикле событий ASGI-сервера, при EVENTS_BACKEND='notify' получает
+    события из PostgreSQL одним соединением с LISTEN на весь процесс.
+    """
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.loop = None
+        self.listener = None
+        self.listener_fd = None
+
+    def subscribe(self, courier_id) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.stop()
+            self.loop = loop
+            if settings.EVENTS_BACKEND == 'notify':
+                self.listen()
+        queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.subscribers[courier_id].add(queue)
+        subscribers_gauge.inc()
+        return queue
+
+    def unsubscribe(self, courier_id, queue):
+        queues = self.subscribers.get(courier_id)
+        if queues is None or queue not in queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[courier_id]
+        subscribers_gauge.dec()
+
+    def dispatch(self, payload):
+        """
+        Раскладывает событие по очередям потоков курьера готовым сообщением
+        Server-Sent Events. Вызывается в цикле событий.
+        """
+        try:
+            data = json.loads(payload)
+            queues = self.subscribers.get(data['courier_id'])
+            event = data['event']
+        except (ValueError, KeyError, TypeError):
+            logger.warning('invalid event payload %r', payload)
+            return
+        if not queues:
+            return
+        # Сообщение собирается один раз для всех потоков курьера
+        message = f'event: {event}\ndata: {payload}\n\n'.encode()
+        for queue in list(queues):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Клиент не читает поток: закрываем его, после
+                # переподключения он перечитает состояние
+                self.unsubscribe(data['courier_id'], queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                dropped_subscribers.inc()
+
+    def publish(self, payload):
+        """Потокобезопасная рассылка события подписчикам процесса"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.dispatch, payload)
+
+    def listen(self):
+        # Отдельное соединение psycopg2 вне Django: оно живет в цикле
+        # событий и только ждет уведомлений
+        params = connections['default'].get_connection_params()
+        try:
+            self.listener = psycopg2.connect(**params)
+            self.listener.autocommit = True
+            with self.listener.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+        except Exception:
+            logger.exception('failed to listen for courier events')
+            self.close_listener()
+            self.loop.call_later(RECONNECT_DELAY, self.restart)
+            return
+        self.listener_fd = self.listener.fileno()
+        self.loop.add_reader(self.listener_fd, self.on_notify)
+
+    def on_notify(self):
+        try:
+            self.listener.poll()
+        except Exception:
+            logger.exception('courier events connection lost')
+            self.restart()
+            return
+        while self.listener.notifies:
+            self.dispatch(self.listener.notifies.pop(0).payload)
+
+    def restart(self):
+        self.close_listener()
+        if self.loop is not None and not self.loop.is_closed():
+            self.listen()
+
+    def close_listener(self):
+        if self.listener is None:
+            return
+        if self.listener_fd is not None and self.loop is not None \
+                and not self.loop.is_closed():
+            self.loop.remove_reader(self.listener_fd)
+        self.listener.close()
+        self.listener = None
+        self.listener_fd = None
+
+    def stop(self):
+        """Отключается от цикла событий, например после его закрытия"""
+        self.close_listener()
+        # Очереди принадлежат старому циклу событий
+        subscribers_gauge.dec(sum(map(len, self.subscribers.values())))
+        self.subscribers.clear()
+        self.loop = None
+
+
+broker = Broker()
@@ -0,0 +1,101 @@
+import csv
+import datetime
+import io
+import json
+
+from api.models import Order
+from api.models.couriers import WEIGHT_SCALE
+from api.utils.shards import shard_aliases
+from django.db import connections, router, transaction
+
+FIELDS = ('order_id', 'assign_id', 'courier_id', 'courier_type', 'region',
+          'weight', 'assign_time', 'complete_time')
+
+# Выполненные заказы из рабочих таблиц и из архива, без сортировки
+EXPORT_SQL = """
+SELECT o.order_id, ao.assign_id, o.assign_courier_id, a.courier_type,
+       o.region, (o.weight_units::numeric / %(scale)s)::numeric(6, 4),
+       o.assign_time, o.complete_time
+FROM api_order o
+JOIN api_assign_orders ao ON ao.order_id = o.order_id
+JOIN api_assign a ON a.id = ao.assign_id
+WHERE o.status = 'complete'
+  AND o.complete_time >= %(since)s AND o.complete_time < %(until)s
+UNION ALL
+SELECT o.order_id, o.assign_id, o.assign_courier_id, a.courier_type,
+       o.region, (o.weight_units::numeric / %(scale)s)::numeric(6, 4),
+       o.assign_time, o.complete_time
+FROM api_archivedorder o
+JOIN api_archivedassign a ON a.assign_id = o.assign_id
+WHERE o.complete_time >= %(since)s AND o.complete_time < %(until)s
+"""
+
+# Строк за одно обращение к серверному курсору и в одном куске ответа
+CHUNK_SIZE = 2000
+
+
+def completed_orders(since, until):
+    """
+    Строки FIELDS выполненных заказов с complete_time в [since, until).
+    Читаются серверным курсором по CHUNK_SIZE строк, поэтому память не
+    зависит от числа заказов. Без шардов читается реплика, если она есть.
+    """
+    for alias in shard_aliases():
+        using = alias or router.db_for_read(Order)
+        # Серверный курсор без WITH HOLD живет внутри транзакции
+        with transaction.atomic(using=using):
+            with connections[using].chunked_cursor() as cursor:
+                cursor.cursor.itersize = CHUNK_SIZE
+                cursor.execute(EXPORT_SQL, {'since': since, 'until': until,
+                                            'scale': WEIGHT_SCALE})
+                yield from cursor
+
+
+def _chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def to_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _json_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def to_ndjson(rows):
+    for chunk in _chunks(rows):
+        yield ''.join(json.dumps(dict(zip(FIELDS, row)), default=_json_value)
+                      + '\n' for row in chunk)
+
+
+FORMATS = {
+    'csv': (to_csv, 'text/csv'),
+    'ndjson': (to_ndjson, 'application/x-ndjson'),
+}
+
+
+def export_orders(since=None, until=None, fmt='csv'):
+    """Куски текста выгрузки в формате fmt: csv или ndjson"""
+    since = since or datetime.datetime.min
+    until = until or datetime.datetime.max
+    render, _ = FORMATS[fmt]
+    return render(completed_orders(since, until))
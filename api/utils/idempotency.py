@@ -0,0 +1,104 @@
+import datetime
+import functools
+import hashlib
+
+from api.models import IdempotencyKey
+from django.conf import settings
+from django.db import connections, router
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+# Ключ занимается строкой без ответа до выполнения обработчика. Истекшая
+# строка, в том числе брошенная упавшим процессом, занимается заново
+RESERVE_KEY_SQL = """
+INSERT INTO api_idempotencykey AS k (key, path, request_hash, status_code,
+                                     response, expires_at)
+VALUES (%(key)s, %(path)s, %(request_hash)s, NULL, NULL, %(expires_at)s)
+ON CONFLICT (key, path) DO UPDATE
+SET request_hash = EXCLUDED.request_hash, status_code = NULL,
+    response = NULL, expires_at = EXCLUDED.expires_at
+WHERE k.expires_at <= %(now)s
+RETURNING k.id
+"""
+
+
+def reserve(key, path, request_hash, now):
+    """
+    Занимает ключ для запроса. Возвращает занятую строку - queryset
+    по ее номеру и сроку брони, - или None, если ключ уже занят другим
+    запросом или хранит его ответ.
+    """
+    expires_at = now + datetime.timedelta(
+        seconds=settings.IDEMPOTENCY_PENDING_TTL)
+    connection = connections[router.db_for_write(IdempotencyKey)]
+    with connection.cursor() as cursor:
+        cursor.execute(RESERVE_KEY_SQL, {
+            'key': key, 'path': path, 'request_hash': request_hash,
+            'expires_at': expires_at, 'now': now})
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    # Срок брони отличает ее от брони той же строки, занятой заново после
+    # истечения: такую строку этот запрос менять не должен
+    return IdempotencyKey.objects.filter(pk=row[0], expires_at=expires_at,
+                                         status_code__isnull=True)
+
+
+def replay(stored, request_hash):
+    """Ответ на запрос с уже занятым ключом"""
+    # Тот же ключ с другим телом запроса - ошибка клиента
+    if stored is not None and stored.request_hash != request_hash:
+        return Response({'validation_error': 'Idempotency-Key already used'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    # Первый запрос с этим ключом еще выполняется
+    if stored is None or stored.status_code is None:
+        return Response(
+            {'validation_error': 'request with this Idempotency-Key '
+                                 'is in progress'},
+            status=status.HTTP_409_CONFLICT,
+            headers={'Retry-After': '1'})
+    response = Response(stored.response, status=stored.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """
+    Повторный запрос с тем же Idempotency-Key не выполняет обработчик
+    заново, а получает сохраненный ответ первого запроса. Пока первый
+    запрос выполняется, повтор получает 409.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'validation_error': 'invalid Idempotency-Key'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        request_hash = hashlib.sha256(request.body).hexdigest()
+        now = datetime.datetime.now()
+        reserved = reserve(key, request.path, request_hash, now)
+        if reserved is None:
+            return replay(IdempotencyKey.objects.filter(
+                key=key, path=request.path).first(), request_hash)
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            reserved.delete()
+            raise
+        # Ошибки сервера и отказы по перегрузке не сохраняем, чтобы клиент
+        # мог повторить запрос
+        if response.status_code >= 500 or \
+                response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            reserved.delete()
+            return response
+        # Сохраненный ответ не перезаписывается: строка заполняется, только
+        # пока она еще занята этим запросом
+        ttl = datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        reserved.update(status_code=response.status_code,
+                        response=response.data, expires_at=now + ttl)
+        return response
+    return wrapper
@@ -0,0 +1,117 @@
+import datetime
+import time
+import traceback
+
+from api.models import Job
+from api.models.jobs import JobStatusChoices
+from api.routers import pin_to_primary
+from api.utils import metrics
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+_tasks = {}
+
+jobs_processed = metrics.counter(
+    'jobs_processed_total', 'Выполненные фоновые задачи')
+job_duration = metrics.histogram(
+    'job_duration_seconds', 'Время выполнения фоновой задачи')
+
+
+def task(name):
+    """Регистрирует функцию как фоновую задачу с именем name"""
+    def decorator(func):
+        _tasks[name] = func
+        return func
+    return decorator
+
+
+def run_task(name, payload):
+    """Выполняет задачу в транзакции на основной базе и замеряет время"""
+    start = time.perf_counter()
+    outcome = 'failed'
+    try:
+        with pin_to_primary(), transaction.atomic():
+            _tasks[name](**payload)
+        outcome = 'done'
+    finally:
+        duration = time.perf_counter() - start
+        jobs_processed.inc(name=name, outcome=outcome)
+        job_duration.observe(duration, name=name)
+    return duration
+
+
+def enqueue(name, **payload):
+    """
+    Ставит задачу в очередь. При JOBS_EAGER задача выполняется сразу,
+    без обработчика (для разработки и тестов).
+    """
+    if settings.JOBS_EAGER:
+        run_task(name, payload)
+        return None
+    return Job.objects.create(name=name, payload=payload)
+
+
+def enqueue_many(name, payloads):
+    """Ставит в очередь задачи name с каждым из payloads одним запросом"""
+    if settings.JOBS_EAGER:
+        for payload in payloads:
+            run_task(name, payload)
+        return []
+    return Job.objects.bulk_create([Job(name=name, payload=payload)
+                                    for payload in payloads])
+
+
+def claim(batch_size, visibility_timeout):
+    """
+    Забирает готовые к выполнению задачи. Задачи, взятые другими
+    обработчиками, пропускаются (SKIP LOCKED). Задачи упавшего
+    обработчика возвращаются в работу после visibility_timeout секунд.
+    """
+    now = datetime.datetime.now()
+    with pin_to_primary(), transaction.atomic():
+        jobs = list(Job.objects.select_for_update(skip_locked=True).filter(
+            Q(status=JobStatusChoices.queued, run_at__lte=now)
+            | Q(status=JobStatusChoices.running, locked_until__lt=now)
+        ).order_by('run_at')[:batch_size])
+        locked_until = now + datetime.timedelta(seconds=visibility_timeout)
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=JobStatusChoices.running,
+            locked_until=locked_until,
+            started_at=now,
+            attempts=F('attempts') + 1)
+    for job in jobs:
+        job.status = JobStatusChoices.running
+        job.attempts += 1
+    return jobs
+
+
+def run_job(job) -> bool:
+    """
+    Выполняет взятую задачу и записывает результат. Неудачная задача
+    повторяется с экспоненциальной задержкой до max_attempts раз.
+    """
+    # Результат записывается, только если задачу не забрал другой
+    # обработчик после истечения блокировки
+    current = Job.objects.filter(pk=job.pk, attempts=job.attempts,
+                                 status=JobStatusChoices.running)
+    start = time.perf_counter()
+    try:
+        run_task(job.name, job.payload)
+    except Exception:
+        now = datetime.datetime.now()
+        failed = job.attempts >= job.max_attempts
+        current.update(
+            status=(JobStatusChoices.failed if failed
+                    else JobStatusChoices.queued),
+            run_at=now + datetime.timedelta(seconds=2 ** job.attempts),
+            locked_until=None,
+            finished_at=now if failed else None,
+            duration_ms=(time.perf_counter() - start) * 1000,
+            last_error=traceback.format_exc())
+        return False
+    current.update(status=JobStatusChoices.done,
+                   locked_until=None,
+                   finished_at=datetime.datetime.now(),
+                   duration_ms=(time.perf_counter() - start) * 1000)
+    return True
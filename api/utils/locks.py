@@ -0,0 +1,62 @@
+import contextlib
+
+from api.models import Courier
+from django.db import connections, router, transaction
+
+# Первый ключ advisory-блокировок курьеров, второй - номер курьера
+COURIER_LOCK = 1
+# Первый ключ слотов контроля допуска, второй - номер слота
+ADMISSION_LOCK = 2
+
+LOCK_SQL = 'SELECT pg_advisory_xact_lock(%s, %s)'
+
+LOCK_MANY_SQL = """
+SELECT pg_advisory_xact_lock(%s, id) FROM unnest(%s::integer[]) AS id
+"""
+
+TRY_LOCK_SQL = """
+SELECT id FROM unnest(%s::integer[]) AS id
+WHERE pg_try_advisory_xact_lock(%s, id)
+"""
+
+
+def try_lock_couriers(courier_ids) -> list:
+    """
+    Берет advisory-блокировки курьеров до конца текущей транзакции, не
+    дожидаясь занятых другими. Возвращает номера заблокированных курьеров.
+    """
+    if not courier_ids:
+        return []
+    connection = connections[router.db_for_write(Courier)]
+    with connection.cursor() as cursor:
+        cursor.execute(TRY_LOCK_SQL, [list(courier_ids), COURIER_LOCK])
+        return [row[0] for row in cursor.fetchall()]
+
+
+@contextlib.contextmanager
+def lock_courier(courier_id):
+    """
+    Открывает транзакцию и ждет блокировку курьера до ее конца. Назначение,
+    изменение профиля и завершение заказов одного курьера выполняются по
+    очереди, разных курьеров - параллельно.
+    """
+    using = router.db_for_write(Courier)
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(LOCK_SQL, [COURIER_LOCK, courier_id])
+        yield
+
+
+@contextlib.contextmanager
+def lock_couriers(courier_ids):
+    """
+    lock_courier для нескольких курьеров одним запросом. Блокировки
+    берутся по возрастанию номеров, поэтому два таких запроса не ждут
+    друг друга по кругу.
+    """
+    using = router.db_for_write(Courier)
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(LOCK_MANY_SQL,
+                           [COURIER_LOCK, sorted(set(courier_ids))])
+        yield
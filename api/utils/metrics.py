@@ -0,0 +1,131 @@
+import os
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    items = ','.join(f'{key}="{value}"' for key, value in labels)
+    return '{' + items + '}'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(labels):
+        return tuple(sorted((key, str(value))
+                            for key, value in labels.items()))
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, labels, value)
+                    for labels, value in self.values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.type}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_labels_text(labels)} {value}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(
+                key, ([0] * (len(self.buckets) + 1), 0, 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        result = []
+        with self.lock:
+            items = list(self.values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                result.append((f'{self.name}_bucket',
+                               labels + (('le', str(bound)),), cumulative))
+            result.append((f'{self.name}_sum', labels, total))
+            result.append((f'{self.name}_count', labels, count))
+        return result
+
+
+def _get_or_create(cls, name, documentation, **kwargs):
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = cls(name, documentation, **kwargs)
+        return _registry[name]
+
+
+def counter(name, documentation):
+    return _get_or_create(Counter, name, documentation)
+
+
+def gauge(name, documentation):
+    return _get_or_create(Gauge, name, documentation)
+
+
+def histogram(name, documentation, buckets=DEFAULT_BUCKETS):
+    return _get_or_create(Histogram, name, documentation, buckets=buckets)
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+def write_textfile(path):
+    """Атомарно записывает метрики в файл для textfile-коллектора"""
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as file:
+        file.write(render())
+    os.replace(temporary, path)
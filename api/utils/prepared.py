@@ -0,0 +1,98 @@
+import hashlib
+import re
+import weakref
+
+from django.conf import settings
+from django.db import connections
+
+# %(name)s, %s или экранированный %% в SQL для psycopg2
+PLACEHOLDER_RE = re.compile(r'%\((\w+)\)s|%s|%%')
+
+# Подготовленные операторы каждого соединения с базой: PREPARE живет до
+# закрытия соединения, поэтому запоминается на самом соединении psycopg2
+_prepared = weakref.WeakKeyDictionary()
+_statements = {}
+
+
+class Statement:
+    """
+    SQL с параметрами psycopg2, переписанный в PREPARE ... AS с $1..$n и
+    EXECUTE. Имя включает хэш текста: запросы разной формы (например,
+    с разной длиной IN) готовятся отдельно.
+    """
+
+    def __init__(self, name, sql):
+        digest = hashlib.sha1(sql.encode()).hexdigest()[:10]
+        self.name = f'{name}_{digest}'
+        self.params = []
+        body = PLACEHOLDER_RE.sub(self._number, sql)
+        self.prepare_sql = f'PREPARE {self.name} AS {body}'
+        # Именованные параметры остаются именованными: перед EXECUTE
+        # можно выполнить другой SQL с теми же параметрами
+        self.named = any(name is not None for name in self.params)
+        placeholders = ', '.join(f'%({name})s' if self.named else '%s'
+                                 for name in self.params)
+        self.execute_sql = (f'EXECUTE {self.name}({placeholders})'
+                            if self.params else f'EXECUTE {self.name}')
+
+    def _number(self, match):
+        if match.group() == '%%':
+            return '%'
+        name = match.group(1)
+        # Именованный параметр, встреченный повторно, получает тот же номер
+        if name is not None and name in self.params:
+            return f'${self.params.index(name) + 1}'
+        self.params.append(name)
+        return f'${len(self.params)}'
+
+    def arguments(self, params):
+        return params if self.named else list(params)
+
+
+def statement(name, sql) -> Statement:
+    key = (name, sql)
+    if key not in _statements:
+        _statements[key] = Statement(name, sql)
+    return _statements[key]
+
+
+def prepare(cursor, name, sql) -> Statement:
+    """Готовит оператор на соединении курсора, если еще не готов"""
+    stmt = statement(name, sql)
+    raw = cursor.db.connection
+    prepared = _prepared.setdefault(raw, set())
+    if stmt.name not in prepared:
+        cursor.execute(stmt.prepare_sql)
+        prepared.add(stmt.name)
+    return stmt
+
+
+def execute(cursor, name, sql, params=(), prefix=''):
+    """
+    cursor.execute(prefix + sql, params), где sql выполняется
+    подготовленным оператором: разбор и планирование выполняются один раз
+    на соединение. prefix - команды с теми же параметрами, отправляемые
+    тем же обращением к базе. При PREPARED_STATEMENTS=False - обычный
+    execute.
+    """
+    if not settings.PREPARED_STATEMENTS:
+        cursor.execute(prefix + sql, params)
+        return
+    stmt = prepare(cursor, name, sql)
+    cursor.execute(prefix + stmt.execute_sql, stmt.arguments(params))
+
+
+def fetch(name, queryset) -> list:
+    """Объекты queryset, выбранные подготовленным оператором name"""
+    if not settings.PREPARED_STATEMENTS:
+        return list(queryset)
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        stmt = prepare(cursor, name, sql)
+    return list(queryset.model.objects.raw(
+        stmt.execute_sql, stmt.arguments(params), using=queryset.db))
+
+
+def fetch_first(name, queryset):
+    rows = fetch(name, queryset[:1])
+    return rows[0] if rows else None
@@ -0,0 +1,92 @@
+import time
+from collections import defaultdict
+
+from api.models import Order, RegionShard
+from api.models.orders import StatusChoices
+from django.conf import settings
+from django.db import transaction
+
+_region_map = {}
+_loaded_at = None
+
+
+def shard_aliases() -> list:
+    """
+    Базы с заказами и развозами. Без шардов - [None], тогда базу
+    (основную или реплику) выбирает роутер.
+    """
+    return list(settings.DATABASE_SHARDS) or [None]
+
+
+def region_map() -> dict:
+    """Перенесенные регионы, перечитываются раз в SHARD_MAP_TTL секунд"""
+    global _region_map, _loaded_at
+    now = time.monotonic()
+    if _loaded_at is None or now - _loaded_at >= settings.SHARD_MAP_TTL:
+        _region_map = dict(RegionShard.objects.using('default').values_list(
+            'region', 'alias'))
+        _loaded_at = now
+    return _region_map
+
+
+def reset_region_map():
+    global _loaded_at
+    _loaded_at = None
+
+
+def default_shard(region):
+    shards = settings.DATABASE_SHARDS
+    return shards[int(region) % len(shards)]
+
+
+def shard_for_region(region):
+    """База, в которой хранятся заказы региона. Без шардов - None"""
+    if not settings.DATABASE_SHARDS:
+        return None
+    alias = region_map().get(int(region))
+    if alias not in settings.DATABASE_SHARDS:
+        alias = default_shard(region)
+    return alias
+
+
+def shard_of(instance):
+    """База, из которой прочитан заказ или развоз. Без шардов - None"""
+    return instance._state.db if settings.DATABASE_SHARDS else None
+
+
+def group_by_shard(items, key=lambda item: item.region) -> dict:
+    groups = defaultdict(list)
+    for item in items:
+        groups[shard_for_region(key(item))].append(item)
+    return groups
+
+
+def move_pending_orders(source, batch_size=1000) -> int:
+    """
+    Переносит пачку свободных заказов из source в шарды, на которые
+    теперь указывает карта регионов. Заказы сначала записываются в новый
+    шард и только потом удаляются из старого: после сбоя повторный запуск
+    допишет недостающие и удалит оставшиеся копии.
+    Назначенные заказы остаются на месте до переноса в архив.
+    """
+    from api.utils.candidates import add_orders
+
+    reset_region_map()
+    regions = Order.objects.using(source).filter(
+        status=StatusChoices.new).values_list('region', flat=True).distinct()
+    moved_regions = [region for region in regions
+                     if shard_for_region(region) != source]
+    if not moved_regions:
+        return 0
+    with transaction.atomic(using=source):
+        orders = list(Order.objects.using(source).select_for_update(
+            skip_locked=True).filter(
+            status=StatusChoices.new,
+            region__in=moved_regions).order_by('pk')[:batch_size])
+        for alias, group in group_by_shard(orders).items():
+            Order.objects.using(alias).bulk_create(group,
+                                                   ignore_conflicts=True)
+            add_orders(group, using=alias)
+        Order.objects.using(source).filter(
+            pk__in=[order.pk for order in orders]).delete()
+    return len(orders)
@@ -0,0 +1,75 @@
+import math
+
+from django.db import connections
+
+# Относительная точность квантилей: оценка отличается от истинного
+# значения не больше чем на 1%
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+# Сливает корзины EXCLUDED.bins в сохраненный набросок
+MERGE_BINS_SQL = """
+s.bins || (SELECT jsonb_object_agg(
+    key, value::integer + COALESCE((s.bins ->> key)::integer, 0))
+    FROM jsonb_each_text(EXCLUDED.bins))
+"""
+
+RECORD_SQL = f"""
+INSERT INTO api_deliverysketch AS s (region, courier_type, bucket_start,
+                                     bins, count)
+VALUES (%(region)s, %(courier_type)s,
+        date_trunc('hour', %(complete_time)s::timestamp),
+        jsonb_build_object(%(bin)s::text, 1), 1)
+ON CONFLICT (region, courier_type, bucket_start) DO UPDATE
+SET bins = {MERGE_BINS_SQL}, count = s.count + 1
+"""
+
+
+def record_delivery(region, courier_type, index, complete_time):
+    """Добавляет заказ в набросок часа complete_time в default"""
+    with connections['default'].cursor() as cursor:
+        cursor.execute(RECORD_SQL, {'region': region,
+                                    'courier_type': courier_type,
+                                    'bin': index,
+                                    'complete_time': complete_time})
+
+
+def bin_index(seconds) -> int:
+    """Номер корзины наброска, значения меньше секунды считаются секундой"""
+    return math.ceil(math.log(max(1.0, seconds)) / LOG_GAMMA)
+
+
+class DDSketch:
+    """
+    Набросок распределения в стиле DDSketch: значения раскладываются по
+    корзинам с границами GAMMA ** i, квантиль оценивается с относительной
+    ошибкой RELATIVE_ACCURACY. Наброски складываются поэлементно, поэтому
+    их можно хранить по часам и сливать за любое окно.
+    """
+
+    def __init__(self, bins=None):
+        self.bins = {int(index): count for index, count in
+                     (bins or {}).items()}
+        self.count = sum(self.bins.values())
+
+    def add(self, seconds, count=1):
+        index = bin_index(seconds)
+        self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+
+    def merge(self, other):
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += other.count
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                break
+        return 2 * GAMMA ** index / (GAMMA + 1)
@@ -0,0 +1,62 @@
+import itertools
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+# Элементов в одном куске потокового ответа
+CHUNK_SIZE = 1000
+
+# Те же параметры, что у JSONRenderer DRF по умолчанию
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def json_list_chunks(path, items, chunk_size=CHUNK_SIZE):
+    """
+    Куски JSON {path[0]: {path[1]: ... [items]}}: список кодируется
+    по chunk_size элементов, не собираясь в памяти целиком
+    """
+    yield ''.join(f'{{{_encoder.encode(key)}:' for key in path) + '['
+    items = iter(items)
+    first = True
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            break
+        text = ','.join(map(_encoder.encode, chunk))
+        yield text if first else ',' + text
+        first = False
+    yield ']' + '}' * len(path)
+
+
+def bulk_response(path, items, status, count=None):
+    """
+    Ответ массового запроса со списком items по пути path. Списки до
+    STREAMING_MIN_ITEMS элементов отдаются обычным Response, длиннее -
+    потоком по мере кодирования. count - длина items, если это генератор.
+    """
+    if count is None:
+        count = len(items)
+    if count < settings.STREAMING_MIN_ITEMS:
+        data = list(items)
+        for key in reversed(path):
+            data = {key: data}
+        return Response(data, status=status)
+    return StreamingHttpResponse(json_list_chunks(path, items),
+                                 status=status,
+                                 content_type='application/json')
+
+
+def item_errors(items, errors, key):
+    """
+    Ошибки валидации элементов массового запроса {'id': ..., **ошибки}
+    и их число. Сами элементы ответа собираются по мере отдачи.
+    """
+    if not isinstance(errors, list):
+        # Ошибка всего списка, а не его элементов
+        raise TypeError('item errors expected')
+    count = sum(1 for error in errors if error)
+    return ({'id': item.get(key) if isinstance(item, dict) else None,
+             **error}
+            for item, error in zip(items, errors) if error), count
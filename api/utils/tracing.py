@@ -0,0 +1,87 @@
+import contextlib
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+SERVICE_NAME = 'candy_delivery_api'
+
+_current_trace = ContextVar('current_trace', default=None)
+_export_lock = threading.Lock()
+
+
+class Trace:
+    """Набор вложенных интервалов времени (span) одного запроса"""
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self.stack = []
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing: длительности фаз в мс"""
+        durations = OrderedDict()
+        for item in self.spans:
+            duration = (item['endTimeUnixNano']
+                        - item['startTimeUnixNano']) / 1e6
+            durations[item['name']] = durations.get(item['name'], 0) + duration
+        return ', '.join(f'{name};dur={duration:.3f}'
+                         for name, duration in durations.items())
+
+    def to_otlp(self):
+        """Трасса в формате OTLP/JSON"""
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{
+                'key': 'service.name',
+                'value': {'stringValue': SERVICE_NAME}}]},
+            'scopeSpans': [{'scope': {'name': 'api'},
+                            'spans': self.spans}],
+        }]}
+
+
+@contextlib.contextmanager
+def start_trace():
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Замеряет фазу обработки запроса. Вне трассы ничего не делает"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    span_id = secrets.token_hex(8)
+    parent_id = trace.stack[-1] if trace.stack else ''
+    trace.stack.append(span_id)
+    start_ns = time.time_ns()
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        trace.stack.pop()
+        trace.spans.append({
+            'traceId': trace.trace_id,
+            'spanId': span_id,
+            'parentSpanId': parent_id,
+            'name': name,
+            'kind': 1,
+            'startTimeUnixNano': start_ns,
+            'endTimeUnixNano': start_ns + time.perf_counter_ns() - start,
+            'attributes': [{'key': key, 'value': {'stringValue': str(value)}}
+                           for key, value in attributes.items()],
+        })
+
+
+def export_trace(trace, path):
+    """Дописывает трассу строкой OTLP/JSON в файл для коллектора"""
+    line = json.dumps(trace.to_otlp())
+    with _export_lock, open(path, 'a') as file:
+        file.write(line + '\n')
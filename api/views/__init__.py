@@ -1,2 +1,5 @@
 from .couriers import CouriersViewSet
-from .orders import OrdersViewSet
\ No newline at end of file
+from .orders import OrdersViewSet
+from .metrics import metrics_view
+from .stats import StatsViewSet
+from .export import ExportViewSet
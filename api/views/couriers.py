@@ -1,25 +1,31 @@
 from api.models import Courier
-from api.serializers.couriers import CourierListSerializer, CourierSerializer
-from api.utils import get_earning, get_rating
+from api.serializers.couriers import (CourierBulkUpdateSerializer,
+                                      CourierListSerializer, CourierSerializer)
+from api.utils import get_courier_stats
+from api.utils.admission import admission
+from api.utils.streaming import bulk_response, item_errors
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 from rest_framework import status, viewsets
 from rest_framework.response import Response
 
 
 class CouriersViewSet(viewsets.ViewSet):
+    @admission('couriers_import')
     def create(self, request, *args, **kwargs):
         serializer = CourierListSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            couriers = serializer.save()
+            return bulk_response(('couriers',),
+                                 ({'id': courier.pk} for courier in couriers),
+                                 status.HTTP_201_CREATED, count=len(couriers))
         # Добавляем подробную информацию об ошибках валидации
-        ids = [item.get('courier_id') for item in request.data['data']]
-        errors_list = serializer.errors['data']
         try:
-            errors_ids = [{'id': id, **e}
-                          for id, e in zip(ids, errors_list) if e]
-            data = {'validation_error': {'couriers': errors_ids}}
-            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+            errors, count = item_errors(
+                request.data['data'], serializer.errors['data'], 'courier_id')
+            return bulk_response(('validation_error', 'couriers'), errors,
+                                 status.HTTP_400_BAD_REQUEST, count=count)
         except TypeError as e:
             return Response({'validation_error': 'bad request TypeError'},
                             status=status.HTTP_400_BAD_REQUEST)
@@ -27,6 +33,20 @@ class CouriersViewSet(viewsets.ViewSet):
             return Response({'validation_error': e.__class__.__name__},
                             status=status.HTTP_400_BAD_REQUEST)
 
+    @admission('couriers_update')
+    def bulk_partial_update(self, request, *args, **kwargs):
+        """PATCH /couriers: изменение профилей многих курьеров сразу"""
+        serializer = CourierBulkUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            errors = getattr(serializer, 'item_errors', None)
+            if errors:
+                return bulk_response(('validation_error', 'couriers'),
+                                     errors, status.HTTP_400_BAD_REQUEST)
+            return Response(serializer.errors,
+                            status=status.HTTP_400_BAD_REQUEST)
+        report = serializer.save()
+        return bulk_response(('couriers',), report, status.HTTP_200_OK)
+
     def partial_update(self, request, *args, **kwargs):
         courier = get_object_or_404(Courier, pk=self.kwargs.get('pk'))
         serializer = CourierSerializer(courier, data=request.data, partial=True)
@@ -44,15 +64,27 @@ class CouriersViewSet(viewsets.ViewSet):
                             status=status.HTTP_400_BAD_REQUEST)
 
     def retrieve(self, request, *args, **kwargs):
-        courier = get_object_or_404(Courier, pk=self.kwargs.get('pk'))
+        # Если профиль не менялся, отвечаем 304 по одному запросу версии,
+        # без расчета рейтинга и заработка
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            courier = Courier.objects.filter(
+                pk=self.kwargs.get('pk')).only('version').first()
+            if courier is None:
+                raise Http404
+            if courier.etag in parse_etags(if_none_match):
+                return Response(status=status.HTTP_304_NOT_MODIFIED,
+                                headers={'ETag': courier.etag})
+        courier = get_object_or_404(Courier.objects.select_related('stats'),
+                                    pk=self.kwargs.get('pk'))
         serializer = CourierSerializer(courier)
         data = serializer.to_representation(courier)
 
-        rating = get_rating(courier)
+        rating, earning = get_courier_stats(courier)
         if rating:
             data['rating'] = rating
-        earning = get_earning(courier)
         if earning:
             data['earning'] = earning
 
-        return Response(data, status=status.HTTP_200_OK)
+        return Response(data, status=status.HTTP_200_OK,
+                        headers={'ETag': courier.etag})
@@ -0,0 +1,94 @@
+import asyncio
+import re
+
+from api.models import Courier
+from api.utils.events import broker, delivered_events
+from api.views.export import ThreadedWsgiToAsgi
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections
+
+EVENTS_PATH = re.compile(r'^/api/v1/couriers/(\d+)/events/?$')
+EXPORT_PATH = re.compile(r'^/api/v1/export/')
+
+HEARTBEAT = b': ping\n\n'
+
+
+def courier_exists(courier_id):
+    try:
+        return Courier.objects.filter(pk=courier_id).exists()
+    finally:
+        close_old_connections()
+
+
+async def wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+class CourierEventsRouter:
+    """
+    ASGI-приложение: GET /api/v1/couriers/{id}/events/ - поток событий
+    курьера в формате Server-Sent Events, остальные запросы обрабатывает
+    Django. Ожидающий поток не занимает ни поток, ни соединение с базой:
+    это корутина и очередь в Broker. Выгрузка /api/v1/export/ читает
+    базу во время ответа и выполняется в отдельном потоке, см.
+    api.views.export.ThreadedWsgiToAsgi.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.export = ThreadedWsgiToAsgi(get_wsgi_application())
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            match = EVENTS_PATH.match(scope['path'])
+            if match:
+                return await self.stream(int(match.group(1)), receive, send)
+        if scope['type'] == 'http' and EXPORT_PATH.match(scope['path']):
+            return await self.export(scope, receive, send)
+        return await self.application(scope, receive, send)
+
+    @staticmethod
+    async def stream(courier_id, receive, send):
+        if not await sync_to_async(courier_exists)(courier_id):
+            await send({'type': 'http.response.start', 'status': 404,
+                        'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body',
+                        'body': b'{"detail": "Not found."}'})
+            return
+        queue = broker.subscribe(courier_id)
+        disconnect = asyncio.ensure_future(wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'text/event-stream'),
+                                    (b'cache-control', b'no-cache'),
+                                    (b'x-accel-buffering', b'no')]})
+            await send({'type': 'http.response.body',
+                        'body': b'retry: 3000\n\n', 'more_body': True})
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    {get, disconnect}, timeout=settings.EVENTS_HEARTBEAT,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if disconnect in done:
+                    get.cancel()
+                    return
+                if get not in done:
+                    get.cancel()
+                    message = HEARTBEAT
+                else:
+                    message = get.result()
+                    # None - поток закрыт брокером из-за переполнения
+                    if message is None:
+                        break
+                    delivered_events.inc()
+                await send({'type': 'http.response.body', 'body': message,
+                            'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnect.cancel()
+            broker.unsubscribe(courier_id, queue)
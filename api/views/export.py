@@ -0,0 +1,74 @@
+import asyncio
+
+from api.utils.export import FORMATS, export_orders
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from django.http import StreamingHttpResponse
+from rest_framework import serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    # format занят DRF для выбора рендерера
+    type = serializers.ChoiceField(choices=tuple(FORMATS), default='csv')
+
+
+class ExportViewSet(viewsets.ViewSet):
+    @action(detail=False, methods=['GET'])
+    def orders(self, request):
+        """
+        Выгрузка выполненных заказов с complete_time в [since, until)
+        потоком CSV или NDJSON, без загрузки всех строк в память
+        """
+        query = ExportQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        fmt = params['type']
+        response = StreamingHttpResponse(
+            export_orders(params.get('since'), params.get('until'), fmt),
+            content_type=FORMATS[fmt][1])
+        response['Content-Disposition'] = \
+            f'attachment; filename="orders.{fmt}"'
+        return response
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """
+    Выгрузка под ASGI: Django 3.0 перебирает потоковый ответ прямо в
+    цикле событий, а export_orders читает базу. Запрос целиком, вместе с
+    ответом, обрабатывается WSGI-обработчиком в отдельном потоке, а не в
+    общем потоке синхронного кода, который выгрузка заняла бы надолго.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiInstance(self.wsgi_application)(scope, receive,
+                                                          send)
+
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    async def run_wsgi_app(self, body):
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.run_in_thread, body)
+
+    def run_in_thread(self, body):
+        response = self.wsgi_application(
+            self.build_environ(self.scope, body), self.start_response)
+        try:
+            for output in response:
+                self.send_body(output, more_body=True)
+            self.send_body(b'', more_body=False)
+        finally:
+            # Django закрывает соединение с базой по сигналу
+            # request_finished из close()
+            if hasattr(response, 'close'):
+                response.close()
+
+    def send_body(self, body, more_body):
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({'type': 'http.response.body', 'body': body,
+                        'more_body': more_body})
@@ -0,0 +1,9 @@
+from api.utils import admission, metrics
+from django.http import HttpResponse
+
+
+def metrics_view(request):
+    """Метрики процесса в текстовом формате Prometheus"""
+    admission.update_gauges()
+    return HttpResponse(metrics.render(),
+                        content_type='text/plain; version=0.0.4')
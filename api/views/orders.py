@@ -1,25 +1,30 @@
 from api.models import Order
 from api.serializers.assigns import AssignSerializer
 from api.serializers.orders import OrderListSerializer, OrderSerializer
-from rest_framework import status, viewsets
+from api.utils import idempotent
+from api.utils.admission import admission, courier_key
+from api.utils.streaming import bulk_response, item_errors
+from api.utils.tracing import span
+from rest_framework import serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 
 class OrdersViewSet(viewsets.ViewSet):
+    @admission('orders_import')
     def create(self, request, *args, **kwargs):
         serializer = OrderListSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            orders = serializer.save()
+            return bulk_response(('orders',),
+                                 ({'id': order.pk} for order in orders),
+                                 status.HTTP_201_CREATED, count=len(orders))
         # Добавляем подробную информацию об ошибках валидации
-        ids = [item.get('order_id') for item in request.data.get('data')]
-        errors_list = serializer.errors['data']
         try:
-            errors_id = [{'id': id, **e}
-                         for id, e in zip(ids, errors_list) if e]
-            message = {'validation_error': {'orders': errors_id}}
-            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+            errors, count = item_errors(request.data.get('data'),
+                                        serializer.errors['data'], 'order_id')
+            return bulk_response(('validation_error', 'orders'), errors,
+                                 status.HTTP_400_BAD_REQUEST, count=count)
         except TypeError as e:
             return Response({'validation_error': 'bad request TypeError'},
                             status=status.HTTP_400_BAD_REQUEST)
@@ -28,6 +33,8 @@ class OrdersViewSet(viewsets.ViewSet):
                             status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['POST'])
+    @idempotent
+    @admission('assign', key=courier_key)
     def assign(self, request):
         serializer = AssignSerializer(data=request.data)
         if serializer.is_valid():
@@ -36,23 +43,25 @@ class OrdersViewSet(viewsets.ViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['POST'])
+    @idempotent
     def complete(self, request):
         try:
-            complete_time = request.data.pop('complete_time')
-            courier_id = request.data.pop('courier_id')
-            order_id = request.data.get('order_id')
-            order = Order.objects.filter(
-                order_id=order_id,
-                assign_courier__pk=courier_id,
-                allow_to_assign=False).first()
-            if not order:
+            with span('request_parsing'):
+                complete_time = OrderSerializer.parse_complete_time(
+                    request.data.pop('complete_time'))
+                courier_id = serializers.IntegerField().to_internal_value(
+                    request.data.pop('courier_id'))
+                order_id = serializers.IntegerField().to_internal_value(
+                    request.data.get('order_id'))
+            # Проверка принадлежности заказа, порядка времени и само
+            # завершение выполняются одним запросом к базе
+            with span('complete_query'):
+                completed = Order.complete(order_id, courier_id,
+                                           complete_time)
+            if not completed:
                 raise ValueError
         except Exception:
             return Response({"validation_error": 'bad request'},
                             status=status.HTTP_400_BAD_REQUEST)
-        serializer = OrderSerializer(data=request.data,
-                                     context={'complete_time': complete_time,
-                                              'courier_id': courier_id})
-        serializer.is_valid()
-        serializer.update(order, serializer.validated_data)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response({'order_id': completed['order_id']},
+                        status=status.HTTP_200_OK)
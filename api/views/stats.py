@@ -0,0 +1,51 @@
+import datetime
+from collections import defaultdict
+
+from api.models import DeliverySketch
+from api.utils.sketch import DDSketch
+from rest_framework import serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+QUANTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+
+class RegionStatsQuerySerializer(serializers.Serializer):
+    hours = serializers.IntegerField(min_value=1, max_value=24 * 90,
+                                     default=24)
+    region = serializers.IntegerField(min_value=1, required=False)
+    courier_type = serializers.ChoiceField(choices=('foot', 'bike', 'car'),
+                                           required=False)
+
+
+class StatsViewSet(viewsets.ViewSet):
+    @action(detail=False, methods=['GET'])
+    def regions(self, request):
+        """
+        Квантили времени доставки в секундах по регионам и типам курьеров
+        за последние hours часов. Считаются по часовым наброскам, без
+        чтения заказов.
+        """
+        query = RegionStatsQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        now = datetime.datetime.now().replace(minute=0, second=0,
+                                              microsecond=0)
+        since = now - datetime.timedelta(hours=params['hours'] - 1)
+        sketches = DeliverySketch.objects.filter(bucket_start__gte=since)
+        if 'region' in params:
+            sketches = sketches.filter(region=params['region'])
+        if 'courier_type' in params:
+            sketches = sketches.filter(courier_type=params['courier_type'])
+        merged = defaultdict(DDSketch)
+        for region, courier_type, bins in sketches.values_list(
+                'region', 'courier_type', 'bins'):
+            merged[region, courier_type].merge(DDSketch(bins))
+        data = [{'region': region, 'courier_type': courier_type,
+                 'count': sketch.count,
+                 **{name: round(sketch.quantile(q), 1)
+                    for name, q in QUANTILES.items()}}
+                for (region, courier_type), sketch in sorted(merged.items())]
+        return Response({'hours': params['hours'], 'regions': data},
+                        status=status.HTTP_200_OK)
@@ -0,0 +1,113 @@
+"""
+Масштабирование диспетчера по числу процессов на синтетических данных.
+
+    python benchmarks/dispatch_scaling.py [--workers 1,2,4,8]
+        [--couriers 5000] [--orders 50000] [--regions 500]
+
+Данные создаются в отдельной тестовой базе (test_<POSTGRES_NAME>),
+которая удаляется в конце, если не указан --keepdb. Перед каждым
+замером все назначения сбрасываются, затем выполняется
+manage.py dispatch --once --workers N. Курьеры работают в 1-3
+соседних регионах, поэтому часть из них попадает в несколько частей.
+"""
+import argparse
+import datetime
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+
+def hours(start, length):
+    return f'{start:02d}:00-{min(start + length, 23):02d}:59'
+
+
+def populate(couriers, orders, regions, seed):
+    from api.models import Courier, Order
+    from api.models.couriers import WEIGHT_SCALE
+
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    Courier.objects.bulk_create([
+        Courier(courier_id=number,
+                courier_type=rng.choice(('foot', 'bike', 'car')),
+                regions=[str((first + shift) % regions + 1)
+                         for shift in range(rng.randint(1, 3))],
+                working_hours=[hours(rng.randint(6, 14), rng.randint(4, 9))],
+                allowed_weight_units=0)
+        for number, first in ((number, rng.randrange(regions))
+                              for number in range(1, couriers + 1))],
+        batch_size=5000)
+    Order.objects.bulk_create([
+        Order(order_id=number,
+              weight_units=rng.randint(1, 500) * WEIGHT_SCALE // 100,
+              region=rng.randint(1, regions),
+              delivery_hours=[hours(rng.randint(6, 20), rng.randint(1, 3))],
+              pooled_at=now + datetime.timedelta(microseconds=number))
+        for number in range(1, orders + 1)], batch_size=5000)
+
+
+def reset():
+    from api.models import Assign, Order
+
+    Assign.objects.all().delete()
+    Order.objects.update(status='new', assign_courier=None,
+                         assign_time=None, allow_to_assign=True)
+
+
+def run_dispatch(workers, database):
+    env = dict(os.environ, POSTGRES_NAME=database)
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, 'manage.py', 'dispatch', '--once',
+         '--workers', str(workers)],
+        cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    dispatched = int(re.search(r'dispatched (\d+)', output.stdout).group(1))
+    return elapsed, dispatched
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,2,4,8')
+    parser.add_argument('--couriers', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--regions', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keepdb', action='store_true')
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.db import connection
+
+    old_name = connection.settings_dict['NAME']
+    database = connection.creation.create_test_db(verbosity=0,
+                                                  autoclobber=True)
+    try:
+        populate(args.couriers, args.orders, args.regions, args.seed)
+        print(f'{"workers":>8}{"seconds":>10}{"orders":>9}'
+              f'{"orders/s":>11}{"speedup":>9}{"efficiency":>12}')
+        baseline = None
+        for workers in map(int, args.workers.split(',')):
+            reset()
+            connection.close()
+            elapsed, dispatched = run_dispatch(workers, database)
+            rate = dispatched / elapsed
+            baseline = baseline or rate
+            print(f'{workers:>8}{elapsed:>10.2f}{dispatched:>9}'
+                  f'{rate:>11.0f}{rate / baseline:>9.2f}'
+                  f'{rate / baseline / workers:>12.0%}')
+    finally:
+        if not args.keepdb:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
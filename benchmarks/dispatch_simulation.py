@@ -0,0 +1,289 @@
+"""
+Дискретно-событийная модель дня работы сервиса для сравнения стратегий
+назначения заказов.
+
+    python benchmarks/dispatch_simulation.py [--orders 20000]
+        [--couriers 400] [--regions 30] [--tick 60]
+        [--strategy api.utils.dispatch:match]
+        [--delivery-minutes foot=25,bike=15,car=10]
+        [--distribution lognormal] [--sigma 0.5] [--json]
+
+Заказы приходят в течение суток с пиками в обед и вечером, курьеры
+работают сменами. Раз в --tick секунд стратегия получает свободных
+курьеров на смене и пул заказов в порядке очереди и возвращает пары
+(курьер, заказы), как api.utils.dispatch.match - те же правила, что у
+POST /orders/assign. Заказы развоза доставляются по очереди, время
+доставки берется из распределения --distribution со средним по типу
+курьера. База не используется: курьеры и заказы - несохраненные модели.
+
+В отчете: заказы по часам, ожидание в пуле, загрузка курьеров по весу
+и по времени, рейтинг курьеров по формуле get_rating и процессорное
+время стратегии на одно решение.
+"""
+import argparse
+import datetime
+import heapq
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+DAY = datetime.datetime(2021, 3, 1)
+SHIFTS = ('07:00-15:00', '10:00-18:00', '12:00-20:00', '15:00-23:00')
+# Доли заказов по часам суток: пики в обед и вечером
+ARRIVAL_PROFILE = (1, 1, 1, 1, 1, 1, 2, 4, 6, 6, 7, 9,
+                   12, 11, 8, 7, 7, 9, 12, 12, 10, 6, 3, 2)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def minutes(text):
+    hours, mins = map(int, text.split(':'))
+    return hours * 60 + mins
+
+
+def on_shift(courier, now):
+    current = now.hour * 60 + now.minute
+    for period in courier.working_hours:
+        start, end = period.split('-')
+        if minutes(start) <= current <= minutes(end):
+            return True
+    return False
+
+
+def load_strategy(path):
+    module, _, name = path.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def delivery_sampler(means, distribution, sigma, rng):
+    """Время доставки одного заказа в секундах по типу курьера"""
+    def sample(courier_type):
+        mean = means[courier_type] * 60
+        if distribution == 'fixed':
+            return mean
+        if distribution == 'exponential':
+            return rng.expovariate(1 / mean)
+        # Среднее логнормального распределения равно mean
+        return rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+    return sample
+
+
+def generate_day(orders, couriers, regions, rng):
+    """Курьеры и заказы с временем появления в пуле"""
+    from api.models import Courier, Order
+    from api.models.couriers import WEIGHT_SCALE
+
+    staff = [
+        Courier(courier_id=number,
+                courier_type=rng.choice(('foot', 'bike', 'car')),
+                regions=[str((first + shift) % regions + 1)
+                         for shift in range(rng.randint(1, 3))],
+                working_hours=[rng.choice(SHIFTS)])
+        for number, first in ((number, rng.randrange(regions))
+                              for number in range(1, couriers + 1))]
+    hours = rng.choices(range(24), weights=ARRIVAL_PROFILE, k=orders)
+    arrivals = []
+    for number, hour in enumerate(hours, 1):
+        pooled_at = DAY + datetime.timedelta(
+            hours=hour, seconds=rng.randrange(3600))
+        start = min(hour + rng.randint(0, 2), 21)
+        arrivals.append(Order(
+            order_id=number,
+            weight_units=rng.randint(1, 1000) * WEIGHT_SCALE // 100,
+            region=rng.randint(1, regions),
+            delivery_hours=[f'{start:02d}:00-{start + 2:02d}:00'],
+            pooled_at=pooled_at))
+    return staff, arrivals
+
+
+def percentiles(values):
+    from api.utils.sketch import DDSketch
+
+    sketch = DDSketch()
+    for value in values:
+        sketch.add(value)
+    return {f'p{round(q * 100)}': (round(sketch.quantile(q) / 60, 1)
+                                   if sketch.count else None)
+            for q in QUANTILES}
+
+
+class Simulation:
+    """Очередь событий суток и накопленная статистика"""
+
+    def __init__(self, staff, arrivals, strategy, sample, tick):
+        self.staff = staff
+        self.orders = len(arrivals)
+        self.strategy = strategy
+        self.sample = sample
+        self.events = []
+        self.sequence = 0
+        self.pool = []
+        self.busy = set()
+        self.waits = []
+        self.loads = []
+        self.busy_seconds = defaultdict(float)
+        self.completed_by_hour = [0] * 24
+        self.history = defaultdict(list)
+        self.cpu_seconds = 0.0
+        self.decisions = 0
+        self.assigned = 0
+        self.end = DAY + datetime.timedelta(days=1)
+        for order in arrivals:
+            self.push(order.pooled_at, 'arrival', order)
+        moment = DAY
+        while moment < self.end:
+            self.push(moment, 'tick')
+            moment += datetime.timedelta(seconds=tick)
+
+    def push(self, moment, kind, payload=None):
+        self.sequence += 1
+        heapq.heappush(self.events, (moment, self.sequence, kind, payload))
+
+    def run(self):
+        while self.events:
+            moment, _, kind, payload = heapq.heappop(self.events)
+            if kind == 'arrival':
+                self.pool.append(payload)
+            elif kind == 'complete':
+                courier, order, assign_time = payload
+                if moment < self.end:
+                    self.completed_by_hour[moment.hour] += 1
+                self.history[courier.pk].append(
+                    (order.region, assign_time, moment))
+            elif kind == 'free':
+                self.busy.discard(payload)
+            elif kind == 'tick' and self.pool:
+                self.tick(moment)
+
+    def tick(self, moment):
+        """Одно решение стратегии по свободным курьерам на смене"""
+        idle = [courier for courier in self.staff
+                if courier.pk not in self.busy and on_shift(courier, moment)]
+        if not idle:
+            return
+        start = time.process_time()
+        matches = self.strategy(idle, self.pool)
+        self.cpu_seconds += time.process_time() - start
+        self.decisions += 1
+        taken = set()
+        for courier, selected in matches:
+            taken.update(order.pk for order in selected)
+            self.deliver(moment, courier, selected)
+        self.pool = [order for order in self.pool if order.pk not in taken]
+
+    def deliver(self, moment, courier, selected):
+        """Развоз заказов по очереди со случайным временем доставки"""
+        self.busy.add(courier.pk)
+        capacity = courier.get_max_weight_units(courier.courier_type)
+        self.loads.append(
+            sum(order.weight_units for order in selected) / capacity)
+        finish = moment
+        for order in selected:
+            self.waits.append((moment - order.pooled_at).total_seconds())
+            finish += datetime.timedelta(
+                seconds=self.sample(courier.courier_type))
+            self.push(finish, 'complete', (courier, order, moment))
+        self.busy_seconds[courier.pk] += (finish - moment).total_seconds()
+        self.push(finish, 'free', courier.pk)
+        self.assigned += len(selected)
+
+    def report(self):
+        from api.utils import rating
+
+        shift_seconds = sum(
+            (minutes(end) - minutes(start)) * 60
+            for courier in self.staff for start, end in
+            (period.split('-') for period in courier.working_hours))
+        ratings = [rating(courier.regions, self.history[courier.pk])
+                   for courier in self.staff if self.history[courier.pk]]
+        return {
+            'orders': self.orders,
+            'assigned': self.assigned,
+            'completed': sum(len(items) for items in self.history.values()),
+            'left_in_pool': len(self.pool),
+            'completed_per_hour': self.completed_by_hour,
+            'wait_minutes': percentiles(self.waits),
+            'weight_utilization': round(sum(self.loads) / len(self.loads), 3)
+            if self.loads else 0,
+            'time_utilization': round(sum(self.busy_seconds.values())
+                                      / shift_seconds, 3),
+            'rating': {'mean': round(sum(ratings) / len(ratings), 2),
+                       'min': min(ratings), 'max': max(ratings)}
+            if ratings else None,
+            'decisions': self.decisions,
+            'cpu_ms_per_decision': round(
+                self.cpu_seconds / self.decisions * 1000, 3)
+            if self.decisions else 0,
+            'cpu_us_per_order': round(
+                self.cpu_seconds / self.assigned * 1e6, 1)
+            if self.assigned else 0,
+        }
+
+
+def print_report(report):
+    print(f'orders {report["orders"]}, assigned {report["assigned"]}, '
+          f'completed {report["completed"]}, '
+          f'left in pool {report["left_in_pool"]}')
+    print('completed per hour: '
+          + ' '.join(map(str, report['completed_per_hour'])))
+    print('wait in pool, min: ' + ', '.join(
+        f'{name} {value}' for name, value in report['wait_minutes'].items()))
+    print(f'utilization: weight {report["weight_utilization"]:.1%}, '
+          f'time {report["time_utilization"]:.1%}')
+    if report['rating']:
+        print('rating: ' + ', '.join(
+            f'{name} {value}' for name, value in report['rating'].items()))
+    print(f'strategy CPU: {report["cpu_ms_per_decision"]} ms per decision '
+          f'({report["decisions"]}), {report["cpu_us_per_order"]} us '
+          f'per order')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--couriers', type=int, default=400)
+    parser.add_argument('--regions', type=int, default=30)
+    parser.add_argument('--tick', type=int, default=60,
+                        help='секунд между решениями стратегии')
+    parser.add_argument('--strategy', default='api.utils.dispatch:match',
+                        help='функция module:name(couriers, orders)')
+    parser.add_argument('--delivery-minutes', default='foot=25,bike=15,car=10',
+                        help='среднее время доставки по типам курьеров')
+    parser.add_argument('--distribution', default='lognormal',
+                        choices=('lognormal', 'exponential', 'fixed'))
+    parser.add_argument('--sigma', type=float, default=0.5,
+                        help='параметр логнормального распределения')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+
+    rng = random.Random(args.seed)
+    means = {key: float(value) for key, value in
+             (item.split('=') for item in args.delivery_minutes.split(','))}
+    staff, arrivals = generate_day(args.orders, args.couriers, args.regions,
+                                   rng)
+    simulation = Simulation(
+        staff, arrivals, load_strategy(args.strategy),
+        delivery_sampler(means, args.distribution, args.sigma, rng),
+        args.tick)
+    simulation.run()
+    report = simulation.report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Время горячих запросов назначения с подготовленными операторами и без.
+
+    python benchmarks/prepared_statements.py [--couriers 5000]
+        [--orders 50000] [--regions 500] [--repeat 2000]
+
+Данные создаются в отдельной тестовой базе (test_<POSTGRES_NAME>),
+которая удаляется в конце, если не указан --keepdb. Для каждого
+запроса - курьер по номеру, открытый развоз и кандидаты курьера -
+выполняется --repeat обращений к случайным курьерам обычным запросом
+и через api.utils.prepared. Planning - время планирования одного
+выполнения по EXPLAIN (ANALYZE, SUMMARY): для EXECUTE после пяти
+выполнений PostgreSQL обычно переходит на общий план.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+
+def queries(courier):
+    """Запросы POST /orders/assign в том виде, как их строит сериализатор"""
+    from api.models import Assign, Courier, Order
+
+    return {
+        'courier_by_pk': Courier.objects.filter(pk=courier.pk)[:1],
+        'open_assign': Assign.objects.filter(
+            courier_id=courier.pk, is_complete=False).order_by('-pk')[:1],
+        'assign_candidates': Order.objects.filter(
+            candidates__courier_id=courier.pk,
+            weight_units__lte=courier.get_max_weight_units(
+                courier.courier_type),
+            region__in=[int(region) for region in courier.regions],
+            status='new').order_by('pooled_at', 'pk'),
+    }
+
+
+def planning_ms(cursor, sql, params):
+    cursor.execute('EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) ' + sql, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Planning Time']
+
+
+def measure(name, couriers, repeat, prepared):
+    """Среднее время обращения и планирования в миллисекундах"""
+    from api.utils.prepared import fetch, prepare
+    from django.db import connection
+    from django.test import override_settings
+
+    with override_settings(PREPARED_STATEMENTS=prepared):
+        start = time.perf_counter()
+        for courier in couriers[:repeat]:
+            fetch(name, queries(courier)[name])
+        elapsed = time.perf_counter() - start
+        planning = []
+        with connection.cursor() as cursor:
+            for courier in couriers[:100]:
+                sql, params = queries(courier)[name].query.sql_with_params()
+                if prepared:
+                    stmt = prepare(cursor, name, sql)
+                    sql, params = stmt.execute_sql, stmt.arguments(params)
+                planning.append(planning_ms(cursor, sql, params))
+    return (elapsed / min(repeat, len(couriers)) * 1000,
+            sum(planning) / len(planning))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--couriers', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--regions', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keepdb', action='store_true')
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.db import connection
+
+    from api.models import Courier, Order
+    from api.utils.candidates import add_orders
+    from benchmarks.dispatch_scaling import populate
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        populate(args.couriers, args.orders, args.regions, args.seed)
+        add_orders(Order.objects.all())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        couriers = list(Courier.objects.all())
+        random.Random(args.seed).shuffle(couriers)
+        print(f'{"query":<20}{"plain ms":>10}{"prepared ms":>13}'
+              f'{"plan ms":>9}{"prepared plan ms":>18}')
+        for name in ('courier_by_pk', 'open_assign', 'assign_candidates'):
+            plain, plain_planning = measure(name, couriers, args.repeat,
+                                            False)
+            prepared, prepared_planning = measure(name, couriers,
+                                                  args.repeat, True)
+            print(f'{name:<20}{plain:>10.3f}{prepared:>13.3f}'
+                  f'{plain_planning:>9.3f}{prepared_planning:>18.3f}')
+    finally:
+        if not args.keepdb:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Сравнение времени запуска и накладных расходов на запрос для
+core.settings и core.settings_production.
+
+    python benchmarks/settings_overhead.py [--runs 5] [--requests 2000]
+
+Каждый замер выполняется в отдельном процессе. Для замера накопления
+SQL-запросов в памяти нужна доступная база из настроек.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILES = ('core.settings', 'core.settings_production')
+
+MEASURE = '''
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from importlib import import_module
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+import_module(settings.ROOT_URLCONF)
+startup = time.perf_counter() - start
+
+from django.test import Client
+client = Client()
+requests = int(sys.argv[1])
+client.get('/api/v1/')
+start = time.perf_counter()
+for _ in range(requests):
+    client.get('/api/v1/')
+per_request = (time.perf_counter() - start) / requests
+
+logged = None
+try:
+    from django.db import connection
+    with connection.cursor() as cursor:
+        for _ in range(1000):
+            cursor.execute('SELECT 1')
+    logged = len(connection.queries)
+except Exception:
+    pass
+print(json.dumps({'startup': startup, 'per_request': per_request,
+                  'logged_queries': logged}))
+'''
+
+
+def measure(profile, requests):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=profile)
+    output = subprocess.run(
+        [sys.executable, '-c', MEASURE, str(requests)],
+        cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    print(f'{"settings":<28}{"startup, ms":>14}{"request, us":>14}'
+          f'{"SQL kept in memory":>20}')
+    for profile in PROFILES:
+        results = [measure(profile, args.requests) for _ in range(args.runs)]
+        startup = statistics.median(item['startup'] for item in results)
+        per_request = statistics.median(
+            item['per_request'] for item in results)
+        logged = results[-1]['logged_queries']
+        print(f'{profile:<28}{startup * 1000:>14.1f}'
+              f'{per_request * 1e6:>14.1f}{str(logged):>20}')
+
+
+if __name__ == '__main__':
+    main()
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Потоки событий курьеров обслуживаются в обход Django, см. api.views.events
+from api.views.events import CourierEventsRouter  # noqa: E402
+
+application = CourierEventsRouter(application)
@@ -25,7 +25,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = os.getenv('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = ['*']
 
@@ -47,6 +47,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.ReplicaPinMiddleware',
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.TracingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,6 +98,51 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения, например POSTGRES_REPLICA_HOSTS=db-1:5432,db-2
+for number, address in enumerate(
+        filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    host, _, port = address.partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# Чтение с реплик; тесты выключают его (core.test_runner), так как
+# реплика-зеркало тестовой базы не видит данных незафиксированной транзакции
+REPLICA_ROUTING = os.getenv('REPLICA_ROUTING', 'True') == 'True'
+
+# Дополнительные базы, между которыми вместе с default делятся заказы
+# и развозы по регионам, например POSTGRES_SHARDS=candy_2@db-2:5432,candy_3
+for number, address in enumerate(
+        filter(None, os.getenv('POSTGRES_SHARDS', '').split(',')), 1):
+    name, _, address = address.partition('@')
+    host, _, port = address.partition(':')
+    DATABASES[f'shard_{number}'] = {
+        **DATABASES['default'],
+        'NAME': name,
+        'HOST': host or DATABASES['default']['HOST'],
+        'PORT': port or DATABASES['default']['PORT'],
+    }
+
+DATABASE_SHARDS = [alias for alias in DATABASES
+                   if alias.startswith('shard_')]
+if DATABASE_SHARDS:
+    DATABASE_SHARDS.insert(0, 'default')
+
+# Сколько секунд процессы используют закешированную карту регионов
+SHARD_MAP_TTL = int(os.getenv('SHARD_MAP_TTL', 5))
+
+DATABASE_ROUTERS = ['api.routers.ShardRouter', 'api.routers.ReplicaRouter']
+
+TEST_RUNNER = 'core.test_runner.PrimaryTestRunner'
+
+# Сколько секунд после записи читать данные клиента из основной базы
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -140,3 +189,59 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
 }
+
+# Время хранения ответов на запросы с заголовком Idempotency-Key, в секундах
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+# Срок брони ключа, пока первый запрос выполняется: после него ключ,
+# брошенный упавшим процессом, можно занять заново
+IDEMPOTENCY_PENDING_TTL = int(os.getenv('IDEMPOTENCY_PENDING_TTL', 60))
+
+# Профилирование запросов: доля случайно профилируемых запросов,
+# срок действия подписанного заголовка X-Profile и число сохраняемых функций
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN_MAX_AGE = int(os.getenv('PROFILING_TOKEN_MAX_AGE', 60 * 60))
+PROFILING_TOP_FUNCTIONS = 50
+
+# Трассировка фаз обработки запросов: заголовок Server-Timing и выгрузка
+# трасс в формате OTLP/JSON построчно в файл
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'True') == 'True'
+TRACING_EXPORT_PATH = os.getenv('TRACING_EXPORT_PATH')
+
+# Фоновые задачи: при JOBS_EAGER выполняются сразу в запросе, иначе
+# записываются в очередь и выполняются командой manage.py worker
+JOBS_EAGER = os.getenv('JOBS_EAGER', 'True') == 'True'
+
+# Контроль допуска: корзина токенов на курьера для POST /orders/assign
+# (ADMISSION_RATE запросов в секунду, до ADMISSION_BURST подряд, 0 -
+# без ограничения) и общий для всех процессов предел одновременных
+# назначений и загрузок (0 - без предела). Свободный слот запрос ждет
+# до ADMISSION_WAIT секунд, затем получает 429
+ADMISSION_RATE = float(os.getenv('ADMISSION_RATE', 5))
+ADMISSION_BURST = int(os.getenv('ADMISSION_BURST', 20))
+ADMISSION_CONCURRENCY = int(os.getenv('ADMISSION_CONCURRENCY', 16))
+ADMISSION_WAIT = float(os.getenv('ADMISSION_WAIT', 0.5))
+
+# События курьеров (GET /api/v1/couriers/{id}/events/ через core.asgi):
+# 'notify' рассылает их всем процессам через PostgreSQL NOTIFY, 'local' -
+# только подписчикам того же процесса. Поток, который не успевает читать
+# EVENTS_QUEUE_SIZE событий, закрывается; пустой комментарий отправляется
+# раз в EVENTS_HEARTBEAT секунд
+EVENTS_BACKEND = os.getenv('EVENTS_BACKEND', 'notify')
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 100))
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', 15))
+
+# Ответы массовых запросов со списком от STREAMING_MIN_ITEMS элементов
+# отдаются потоком. Ответы сжимаются gzip или br (если установлен
+# пакет brotli) по Accept-Encoding: обычные - от COMPRESSION_MIN_SIZE
+# байт, потоковые - всегда
+STREAMING_MIN_ITEMS = int(os.getenv('STREAMING_MIN_ITEMS', 1000))
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BR_QUALITY = int(os.getenv('COMPRESSION_BR_QUALITY', 4))
+
+# Частые запросы (курьер, открытый развоз, кандидаты назначения,
+# завершение заказа) выполняются подготовленными операторами: PREPARE на
+# соединение, затем EXECUTE. Имеет смысл при постоянных соединениях
+# (CONN_MAX_AGE) или пулере в сессионном режиме; за пулером в режиме
+# transaction операторы нужно отключить
+PREPARED_STATEMENTS = os.getenv('PREPARED_STATEMENTS', 'False') == 'True'
@@ -0,0 +1,54 @@
+"""
+Настройки для работы сервиса как JSON API под /api/.
+
+Подключаются через DJANGO_SETTINGS_MODULE=core.settings_production.
+Из основных настроек убраны админка, сессии, сообщения, CSRF, CORS,
+шаблоны и JWT: API не использует их, а каждое приложение и middleware
+добавляет время запуска и работу на каждый запрос. Отладка выключена,
+чтобы не накапливать в памяти все выполненные SQL-запросы.
+"""
+
+from core.settings import *  # noqa: F401,F403
+from core.settings import MIDDLEWARE
+
+DEBUG = False
+
+INSTALLED_APPS = [
+    'api',
+    'rest_framework',
+]
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if middleware.startswith('api.') or middleware in (
+        'django.middleware.security.SecurityMiddleware',
+        'django.middleware.common.CommonMiddleware',
+    )
+]
+
+TEMPLATES = []
+
+# Постоянные соединения с базой вместо нового на каждый запрос
+CONN_MAX_AGE = int(os.getenv('CONN_MAX_AGE', 60))  # noqa: F405
+for database in DATABASES.values():  # noqa: F405
+    database['CONN_MAX_AGE'] = CONN_MAX_AGE
+# Подготовленные операторы живут, пока открыто соединение
+PREPARED_STATEMENTS = os.getenv(  # noqa: F405
+    'PREPARED_STATEMENTS', str(CONN_MAX_AGE > 0)) == 'True'
+
+# Снятие заказов и пересчет рейтинга выполняет manage.py worker
+JOBS_EAGER = os.getenv('JOBS_EAGER', 'False') == 'True'  # noqa: F405
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.AllowAny',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+    ],
+    'UNAUTHENTICATED_USER': None,
+}
@@ -0,0 +1,20 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class PrimaryTestRunner(DiscoverRunner):
+    """
+    Запускает тесты с чтением из основной базы. Реплика в тестах - зеркало
+    default (TEST MIRROR) на отдельном соединении: TestCase оборачивает
+    тест в транзакцию, и чтение с реплики не видело бы записанных данных.
+    Маршрутизацию на реплики проверяют тесты с REPLICA_ROUTING=True.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.primary_reads = override_settings(REPLICA_ROUTING=False)
+        self.primary_reads.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.primary_reads.disable()
+        super().teardown_test_environment(**kwargs)
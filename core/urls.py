@@ -13,14 +13,23 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
+from django.conf import settings
 from django.urls import include, path
-from django.views.generic import TemplateView
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-    path('redoc/',
-         TemplateView.as_view(template_name='redoc.html'),
-         name='redoc'),
 ]
+
+# В профиле только для API (core.settings_production) нет админки и шаблонов
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))
+
+if settings.TEMPLATES:
+    from django.views.generic import TemplateView
+
+    urlpatterns.append(path('redoc/',
+                            TemplateView.as_view(template_name='redoc.html'),
+                            name='redoc'))